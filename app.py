@@ -1,13 +1,41 @@
 # app.py
-from flask import Flask, render_template, request, jsonify
-from logistics.cargo_manager import CargoManager
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from logistics.cargo_manager import SHIPMENT_STATUSES, CargoManager
+from logistics.route_overrides import RouteOverrideStore
 from route_optimizer import EnhancedRouteOptimizer
+from routing.registry import load_regions
+import atexit
 import json
+import os
 from datetime import datetime
 
+# Prebuilt routing graph snapshot (see RouteOptimizerBackend.save_snapshot)
+GRAPH_SNAPSHOT = 'data/graph_snapshot'
+
+# Operating regions loaded on demand (see routing.registry.load_regions),
+# and the memory their graphs may hold before the least used are dropped
+REGIONS_FILE = 'data/regions.json'
+GRAPH_MEMORY_BUDGET = 4 * 1024 ** 3
+
+# Seconds between keep-alive comments on idle event streams
+STREAM_HEARTBEAT = 15
+
 app = Flask(__name__)
 cargo_manager = CargoManager()
-route_optimizer = EnhancedRouteOptimizer('models/route_model.pkl')
+# Write out buffered telemetry on shutdown
+atexit.register(cargo_manager.close)
+route_optimizer = EnhancedRouteOptimizer(
+    'models/route_model.pkl',
+    snapshot_path=GRAPH_SNAPSHOT if os.path.isdir(GRAPH_SNAPSHOT) else None,
+    engine='csr',
+    regions=load_regions(REGIONS_FILE) if os.path.isfile(REGIONS_FILE) else None,
+    memory_budget=GRAPH_MEMORY_BUDGET,
+    # Overrides live in the database, so every worker process routes with them
+    override_store=RouteOverrideStore(cargo_manager.db)
+)
+atexit.register(route_optimizer.close)
+if route_optimizer.registry is not None:
+    route_optimizer.registry.preload()
 
 @app.route('/')
 def index():
@@ -27,43 +55,150 @@ def shipment_stats():
 
 @app.route('/api/shipments/active', methods=['GET'])
 def active_shipments():
-    """Get all active shipments"""
-    shipments = cargo_manager.get_active_shipments()
+    """
+    Get all active shipments
+    
+    Responses carry an ETag of the shipment change version; a matching
+    If-None-Match gets 304. With ?since=<version> only shipments changed
+    after that version are sent, plus the ids that left the active list.
+    Route geometry is an encoded polyline (decoded by /api/shipments/<id>/geometry).
+    """
+    since = request.args.get('since', type=int)
+    version = cargo_manager.shipments_version
+    etag = f'"{version}"'
+    if request.headers.get('If-None-Match') == etag or since == version:
+        return '', 304, {'ETag': etag}
+    
+    if since is not None:
+        version, shipments, removed = cargo_manager.get_active_shipments_since(since)
+    else:
+        shipments, removed = cargo_manager.get_active_shipments(), None
+    
     # Convert JSON strings to objects
     for shipment in shipments:
-        if 'route_data' in shipment and shipment['route_data']:
-            shipment['route_data'] = json.loads(shipment['route_data'])
-        if 'current_location' in shipment and shipment['current_location']:
+        if shipment['current_location']:
             shipment['current_location'] = json.loads(shipment['current_location'])
     
-    return jsonify(shipments)
+    # Attach nearest road nodes for all shipments in one spatial index query
+    if route_optimizer.has_graph:
+        route_optimizer.snap_shipments(shipments)
+    
+    if since is not None:
+        response = jsonify({'version': version, 'shipments': shipments, 'removed': removed})
+    else:
+        response = jsonify(shipments)
+    response.headers['ETag'] = f'"{version}"'
+    return response
+
+@app.route('/api/shipments/<int:shipment_id>/geometry', methods=['GET'])
+def get_shipment_geometry(shipment_id):
+    """Decoded route coordinates stored for a shipment"""
+    coords = cargo_manager.get_shipment_route_geometry(shipment_id)
+    if coords is None:
+        return jsonify({'error': 'no route stored for this shipment'}), 404
+    
+    return jsonify({'route': coords})
 
 @app.route('/api/shipments/<int:shipment_id>/route', methods=['GET'])
 def get_shipment_route(shipment_id):
-    """Get optimized route for a shipment"""
-    # Get shipment and its cargo
-    # (You'd need to add a method to cargo_manager for this)
-    
-    # For demo purposes, we'll create sample data
-    shipment = {
-        'id': shipment_id,
-        'origin_lat': 34.05,
-        'origin_lon': -118.25,
-        'dest_lat': 34.22,
-        'dest_lon': -118.40,
-        'priority': 'urgent'
-    }
-    
-    cargo_list = [
-        {'id': 1, 'name': 'Medical Supplies', 'priority': 'critical', 'temperature_min': 2, 'temperature_max': 30},
-        {'id': 2, 'name': 'MREs', 'priority': 'standard'}
-    ]
-    
-    # Get optimized route
-    route_data = route_optimizer.optimize_for_shipment(shipment, cargo_list)
+    """
+    Get optimized route for a shipment
+    
+    The route is stored in shipments.route_data with the key it was computed
+    under (snapped endpoints and weight set); while that key is current the
+    stored route is returned without searching the graph again.
+    """
+    shipment = cargo_manager.get_shipment(shipment_id)
+    if shipment is None:
+        return jsonify({'error': 'shipment not found'}), 404
+    cargo_list = shipment['cargo']
+    # Shipments on the move are routed from where they are
+    if shipment['status'] == 'in_transit':
+        shipment = route_optimizer.from_current_location(shipment)
+    
+    route_key = route_optimizer.route_key(shipment, cargo_list)
+    stored = shipment['route_data']
+    # Routes stored before route keys were kept are plain coordinate lists
+    if isinstance(stored, dict) and shipment['route'] and stored.get('route_key') == route_key:
+        route_data = {k: v for k, v in stored.items() if k != 'route_key'}
+        return jsonify(dict(route_data, route=shipment['route']))
+    
+    # Get optimized route ('astar' is goal-directed, for long-haul routes)
+    algorithm = request.args.get('algorithm')
+    route_data = route_optimizer.optimize_for_shipment(shipment, cargo_list, algorithm=algorithm)
+    if route_data['route']:
+        cargo_manager.set_shipment_route(shipment_id, route_data['route'],
+                                         dict({k: v for k, v in route_data.items() if k != 'route'},
+                                              route_key=route_key))
     
     return jsonify(route_data)
 
+@app.route('/api/shipments/routes/batch', methods=['POST'])
+def get_shipment_routes_batch():
+    """Optimize routes for many shipments in one call"""
+    data = request.json
+    
+    shipments = data.get('shipments', [])
+    cargo_lists = data.get('cargo_lists', [[] for _ in shipments])
+    if len(cargo_lists) != len(shipments):
+        return jsonify({'error': 'cargo_lists must have one entry per shipment'}), 400
+    
+    routes = route_optimizer.optimize_many(shipments, cargo_lists,
+                                           algorithm=data.get('algorithm'))
+    
+    return jsonify([dict(route, id=shipment.get('id')) for shipment, route in zip(shipments, routes)])
+
+@app.route('/api/routing/regions', methods=['GET'])
+def routing_regions():
+    """Loaded region graphs, memory use and load/eviction counters"""
+    if route_optimizer.registry is None:
+        return jsonify({'regions': 0, 'loaded': []})
+    return jsonify(route_optimizer.registry.stats())
+
+@app.route('/api/routing/overrides', methods=['GET'])
+def list_routing_overrides():
+    """Active live edge overrides"""
+    return jsonify(route_optimizer.list_overrides())
+
+@app.route('/api/routing/overrides', methods=['POST'])
+def apply_routing_overrides():
+    """
+    Apply closures, slowdowns and area risk penalties to the road network
+    
+    Body: {"overrides": [...], "reroute": true}. In-transit shipments whose
+    stored route runs through an overridden edge are re-planned from their
+    current location and their routes saved.
+    """
+    data = request.json
+    try:
+        ids = route_optimizer.apply_overrides(data.get('overrides', []))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    rerouted = []
+    if data.get('reroute', True):
+        shipments = cargo_manager.get_in_transit_shipments()
+        affected = route_optimizer.affected_routes([s['route'] for s in shipments], ids)
+        shipments = [s for s, hit in zip(shipments, affected) if hit]
+        routes = route_optimizer.reroute_shipments(shipments, [s['cargo'] for s in shipments])
+        for shipment, route in zip(shipments, routes):
+            if route['route']:
+                route_key = route_optimizer.route_key(route_optimizer.from_current_location(shipment),
+                                                      shipment['cargo'])
+                cargo_manager.set_shipment_route(shipment['id'], route['route'],
+                                                 dict({k: v for k, v in route.items() if k != 'route'},
+                                                      route_key=route_key))
+                rerouted.append(shipment['id'])
+    
+    return jsonify({'ids': ids, 'rerouted': rerouted})
+
+@app.route('/api/routing/overrides/<override_id>', methods=['DELETE'])
+def remove_routing_override(override_id):
+    """Lift a live edge override"""
+    if not route_optimizer.remove_overrides([override_id]):
+        return jsonify({'error': 'no such override'}), 404
+    return jsonify({'success': True})
+
 @app.route('/api/shipments/create', methods=['POST'])
 def create_shipment():
     """Create a new shipment"""
@@ -84,6 +219,42 @@ def create_shipment():
     
     return jsonify({'id': shipment_id, 'status': 'created'})
 
+@app.route('/api/shipments/bulk/create', methods=['POST'])
+def create_shipments():
+    """Create many shipments (e.g. a resupply wave) in one transaction"""
+    data = request.json
+    
+    shipments = data.get('shipments', [])
+    required = ('name', 'origin_id', 'destination_id')
+    if any(any(field not in shipment for field in required) for shipment in shipments):
+        return jsonify({'error': 'every shipment needs name, origin_id and destination_id'}), 400
+    
+    shipment_ids = cargo_manager.create_shipments(shipments)
+    
+    return jsonify({'ids': shipment_ids, 'status': 'created'})
+
+@app.route('/api/shipments/bulk/update', methods=['POST'])
+def update_shipments():
+    """Move many shipments to one status in one transaction"""
+    data = request.json
+    
+    shipment_ids = data.get('shipment_ids', [])
+    status = data.get('status')
+    if status not in SHIPMENT_STATUSES:
+        return jsonify({'error': f'status must be one of {", ".join(SHIPMENT_STATUSES)}'}), 400
+    if not isinstance(shipment_ids, list) or any(type(i) is not int for i in shipment_ids):
+        return jsonify({'error': 'shipment_ids must be a list of integers'}), 400
+    # JSON object keys arrive as strings
+    try:
+        current_locations = {int(shipment_id): location
+                             for shipment_id, location in (data.get('current_locations') or {}).items()}
+    except (AttributeError, ValueError):
+        return jsonify({'error': 'current_locations must map shipment ids to locations'}), 400
+    
+    updated = cargo_manager.update_shipments_status(shipment_ids, status, current_locations)
+    
+    return jsonify({'updated': updated, 'status': 'updated'})
+
 @app.route('/api/shipments/<int:shipment_id>/update', methods=['POST'])
 def update_shipment(shipment_id):
     """Update shipment status"""
@@ -91,6 +262,8 @@ def update_shipment(shipment_id):
     
     status = data.get('status')
     current_location = data.get('current_location')
+    if status not in SHIPMENT_STATUSES:
+        return jsonify({'error': f'status must be one of {", ".join(SHIPMENT_STATUSES)}'}), 400
     
     cargo_manager.update_shipment_status(shipment_id, status, current_location)
     
@@ -104,10 +277,97 @@ def add_environmental_reading(shipment_id):
     temperature = data.get('temperature')
     humidity = data.get('humidity')
     
-    cargo_manager.add_environmental_reading(shipment_id, temperature, humidity)
+    if not cargo_manager.add_environmental_reading(shipment_id, temperature, humidity):
+        return jsonify({'status': 'rejected', 'error': 'ingest backlog full'}), 503, {'Retry-After': '1'}
     
     return jsonify({'status': 'added'})
 
+@app.route('/api/environmental/bulk', methods=['POST'])
+def add_environmental_readings():
+    """Add a batch of environmental readings across shipments"""
+    data = request.json
+    
+    readings = data.get('readings', []) if isinstance(data, dict) else data
+    if any('shipment_id' not in reading for reading in readings):
+        return jsonify({'error': 'every reading needs a shipment_id'}), 400
+    
+    try:
+        accepted = cargo_manager.add_environmental_readings(readings)
+    except ValueError as e:
+        return jsonify({'error': f'invalid timestamp: {e}'}), 400
+    result = {'accepted': accepted, 'rejected': len(readings) - accepted}
+    
+    # Partial acceptance: the sender should retry the tail after backing off
+    if result['rejected']:
+        return jsonify(result), 503, {'Retry-After': '1'}
+    return jsonify(result), 202
+
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    """Cargo constraint alerts newer than ?since= (an alert id)"""
+    alerts = cargo_manager.get_alerts(
+        since_id=request.args.get('since', 0, type=int),
+        shipment_id=request.args.get('shipment_id', type=int)
+    )
+    
+    return jsonify({'alerts': alerts, 'violating': cargo_manager.get_violating_shipments()})
+
+@app.route('/api/stream', methods=['GET'])
+def event_stream():
+    """
+    Server-sent events for live dashboards
+    
+    ?topics= picks from shipments, readings and alerts (default: all).
+    A 'resync' event means the client fell behind and should refetch.
+    """
+    topics = request.args.get('topics')
+    subscription = cargo_manager.events.subscribe(topics.split(',') if topics else None)
+    
+    def stream():
+        try:
+            yield ': connected\n\n'
+            while True:
+                message = subscription.get(timeout=STREAM_HEARTBEAT)
+                yield message if message is not None else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/environmental/ingest/stats', methods=['GET'])
+def environmental_ingest_stats():
+    """Telemetry buffer backlog and throughput counters"""
+    return jsonify(cargo_manager.get_ingest_stats())
+
+@app.route('/api/shipments/environmental/latest', methods=['GET'])
+def get_latest_environmental_readings():
+    """Current conditions for many shipments (?ids=1,2,3; default all active)"""
+    ids = request.args.get('ids')
+    try:
+        shipment_ids = [int(i) for i in ids.split(',') if i.strip()] if ids else None
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+    
+    return jsonify(cargo_manager.get_latest_readings(shipment_ids))
+
+@app.route('/api/shipments/<int:shipment_id>/environmental/history', methods=['GET'])
+def get_environmental_history(shipment_id):
+    """Environmental history between ?start= and ?end= (ISO timestamps)"""
+    start = request.args.get('start')
+    if not start:
+        return jsonify({'error': 'start is required'}), 400
+    
+    try:
+        history = cargo_manager.get_reading_history(
+            shipment_id, start, request.args.get('end'),
+            max_points=request.args.get('max_points', 500, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': f'invalid timestamp: {e}'}), 400
+    
+    return jsonify(history)
+
 @app.route('/api/shipments/<int:shipment_id>/environmental', methods=['GET'])
 def get_environmental_reading(shipment_id):
     """Get latest environmental reading for a shipment"""
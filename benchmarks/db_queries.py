@@ -0,0 +1,154 @@
+# benchmarks/db_queries.py
+"""
+Latency of the dashboard and tracking queries as environmental_readings grows.
+
+Grows a scratch database to each requested size and times the hot
+CargoManager queries at every step; with the schema indexes in place the
+latencies should stay flat. Pass --no-indexes to drop them for comparison.
+latest_reading_sql times the indexed environmental_readings lookup itself;
+latest_reading_cached is the in-memory path the API now serves from.
+
+    python benchmarks/db_queries.py --sizes 100000 1000000 10000000 --output results.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logistics.cargo_manager import CargoManager
+
+NUM_SHIPMENTS = 500
+CARGO_PER_SHIPMENT = 5
+INSERT_CHUNK = 100000
+START_TS = 1700000000000
+
+def seed(manager):
+    """Locations, cargo and shipments; a fifth of the shipments stay active"""
+    with manager.db.writer() as conn:
+        conn.execute("INSERT INTO locations (name, latitude, longitude) VALUES ('Depot', 34.5, 69.1)")
+        conn.execute("INSERT INTO locations (name, latitude, longitude) VALUES ('FOB', 34.6, 69.3)")
+    for i in range(NUM_SHIPMENTS):
+        cargo_ids = [manager.add_cargo(f'cargo-{i}-{j}', 'supplies') for j in range(CARGO_PER_SHIPMENT)]
+        shipment_id = manager.create_shipment(f'shipment-{i}', 1, 2, cargo_ids)
+        manager.update_shipment_status(shipment_id, 'in_transit' if i % 5 == 0 else 'delivered')
+
+def grow_readings(manager, current, target, rng):
+    """
+    Append readings (spread over every shipment) until the table holds target rows
+
+    Rows are written directly rather than through the telemetry buffer, so
+    the latest-reading cache is updated here the way ingest would.
+    """
+    while current < target:
+        count = min(INSERT_CHUNK, target - current)
+        rows = []
+        for i in range(current, current + count):
+            ts = START_TS + i * 1000
+            rows.append((rng.randint(1, NUM_SHIPMENTS), rng.uniform(-10, 40), rng.uniform(10, 90),
+                         time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(ts / 1000)), ts))
+        with manager.db.writer() as conn:
+            conn.executemany('''
+            INSERT INTO environmental_readings (shipment_id, temperature, humidity, timestamp, ts)
+            VALUES (?, ?, ?, ?, ?)
+            ''', rows)
+        manager.latest_readings.update(rows)
+        current += count
+    return current
+
+def latest_reading_sql(manager, shipment_id):
+    """Newest reading of a shipment straight from environmental_readings"""
+    with manager.db.reader() as conn:
+        return conn.execute('''
+        SELECT shipment_id, temperature, humidity, timestamp, ts FROM environmental_readings
+        WHERE shipment_id = ?
+        ORDER BY ts DESC
+        LIMIT 1
+        ''', (shipment_id,)).fetchone()
+
+def time_query(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': statistics.median(samples),
+        'p95_ms': sorted(samples)[max(0, int(len(samples) * 0.95) - 1)],
+        'max_ms': max(samples)
+    }
+
+def run(sizes, repeats, drop_indexes, seed_value=0):
+    rng = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = CargoManager(os.path.join(tmp, 'bench.db'))
+        seed(manager)
+        if drop_indexes:
+            with manager.db.writer() as conn:
+                names = [row[0] for row in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")]
+                for name in names:
+                    conn.execute(f'DROP INDEX {name}')
+
+        active_id = 1  # shipments 1, 6, 11, ... are in transit
+        queries = {
+            'latest_reading_sql': lambda: latest_reading_sql(manager, rng.randint(1, NUM_SHIPMENTS)),
+            'latest_reading_cached': lambda: manager.get_latest_environmental_readings(rng.randint(1, NUM_SHIPMENTS)),
+            'active_shipments': manager.get_active_shipments,
+            'shipment_stats': manager.get_shipment_stats,
+            'cargo_stats': manager.get_cargo_stats,
+            'status_update': lambda: manager.update_shipment_status(active_id, 'in_transit')
+        }
+
+        results = []
+        rows = 0
+        for size in sorted(sizes):
+            started = time.perf_counter()
+            rows = grow_readings(manager, rows, size, rng)
+            load_s = time.perf_counter() - started
+            # Let the planner see the new table statistics, as a deployment would
+            with manager.db.writer() as conn:
+                conn.execute('ANALYZE')
+            step = {'readings': rows, 'load_s': load_s, 'queries': {}}
+            for name, fn in queries.items():
+                step['queries'][name] = time_query(fn, repeats)
+            results.append(step)
+            print(f'{rows:>12,} readings: ' + ', '.join(
+                f"{name} {q['median_ms']:.3f} ms" for name, q in step['queries'].items()), file=sys.stderr)
+
+        schema_version = manager.db.schema_version
+        manager.close()
+
+    return {
+        'benchmark': 'db_queries',
+        'schema_version': schema_version,
+        'indexes': not drop_indexes,
+        'shipments': NUM_SHIPMENTS,
+        'repeats': repeats,
+        'results': results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='readings table sizes to measure at')
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--no-indexes', action='store_true', help='drop the schema indexes first')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.repeats, args.no_indexes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
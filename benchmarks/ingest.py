@@ -0,0 +1,104 @@
+# benchmarks/ingest.py
+"""
+Environmental telemetry ingest rate through CargoManager.
+
+Sends readings for a fleet of in-transit shipments (a share of them out of
+their cargo's temperature limits, so constraint alerts fire) in request-
+sized batches, and measures how fast they are accepted into the write
+buffer and how fast they are on disk, plus how often the buffer pushed back.
+
+    python benchmarks/ingest.py --readings 200000 --batch 500 --output ingest.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logistics.cargo_manager import CargoManager
+
+NUM_SHIPMENTS = 200
+
+def seed(manager):
+    """In-transit shipments carrying cold-chain cargo (2-8 °C)"""
+    with manager.db.writer() as conn:
+        conn.execute("INSERT INTO locations (name, latitude, longitude) VALUES ('Depot', 28.5, 77.0)")
+        conn.execute("INSERT INTO locations (name, latitude, longitude) VALUES ('FOB', 28.7, 77.3)")
+    shipment_ids = manager.create_shipments([
+        {'name': f'shipment-{i}', 'origin_id': 1, 'destination_id': 2,
+         'cargo_ids': [manager.add_cargo(f'vaccines-{i}', 'medical', temp_min=2, temp_max=8)]}
+        for i in range(NUM_SHIPMENTS)
+    ])
+    manager.update_shipments_status(shipment_ids, 'in_transit')
+    return shipment_ids
+
+def run(readings, batch, excursion_rate=0.05, seed_value=0):
+    rng = random.Random(seed_value)
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = CargoManager(os.path.join(tmp, 'bench.db'), compact_interval=None,
+                               reconcile_interval=None)
+        shipment_ids = seed(manager)
+
+        sent = accepted = 0
+        refused_batches = 0
+        started = time.perf_counter()
+        while sent < readings:
+            count = min(batch, readings - sent)
+            rows = [{'shipment_id': rng.choice(shipment_ids),
+                     'temperature': rng.uniform(9, 12) if rng.random() < excursion_rate else rng.uniform(3, 7),
+                     'humidity': rng.uniform(30, 60)}
+                    for _ in range(count)]
+            taken = manager.add_environmental_readings(rows)
+            if taken < count:
+                refused_batches += 1
+                # Back off like a well-behaved sender answered with 503
+                time.sleep(0.01)
+            accepted += taken
+            sent += count
+        accept_s = time.perf_counter() - started
+
+        manager.telemetry.flush()
+        durable_s = time.perf_counter() - started
+        stats = manager.get_ingest_stats()
+        with manager.db.reader() as conn:
+            alerts = conn.execute('SELECT COUNT(*) FROM constraint_alerts').fetchone()[0]
+        manager.close()
+
+    print(f"{accepted:,} readings: {accepted / accept_s:,.0f}/s accepted, "
+          f"{accepted / durable_s:,.0f}/s durable", file=sys.stderr)
+    return {
+        'benchmark': 'ingest',
+        'readings': readings,
+        'batch': batch,
+        'shipments': NUM_SHIPMENTS,
+        'accepted': accepted,
+        'refused_batches': refused_batches,
+        'accept_per_s': accepted / accept_s if accept_s else None,
+        'durable_per_s': accepted / durable_s if durable_s else None,
+        'accept_s': accept_s,
+        'durable_s': durable_s,
+        'alerts': alerts,
+        'telemetry': stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=500, help='readings per request')
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.readings, args.batch)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+# benchmarks/routes.py
+"""
+Routing latency and throughput on synthetic road networks.
+
+For each grid size: graph setup cost, snapping, single-route latency per
+engine/algorithm (plus contraction hierarchies on graphs up to
+--ch-max-nodes), route-cache hits and batch throughput. Every search is
+cross-checked against plain Dijkstra on the same weights; any cost that
+differs is reported under 'mismatches'. Runs offline on StubModel.
+
+    python benchmarks/routes.py --sizes 50 100 200 --queries 50 --output routes.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import networkx as nx
+import numpy as np
+
+from benchmarks.synthetic import StubModel, random_points, synthetic_graph
+from routing.contraction import DEFAULT_MAX_NODES
+from route_optimizer import RouteCache, RouteOptimizerBackend
+
+# Routes of equal cost may differ in tie-breaks; costs must agree this closely
+COST_TOLERANCE = 1e-6
+# NetworkX routing is timed only up to this many nodes
+NETWORKX_MAX_NODES = 20000
+
+HOUR, WEEKDAY = 9, 2
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[max(0, int(len(samples) * 0.95) - 1)],
+        'max_ms': samples[-1],
+        'count': len(samples)
+    }
+
+def route_cost(backend, route_nodes, weights):
+    """Total weight of a route, or inf when no route was found"""
+    if not route_nodes:
+        return float('inf')
+    rg = backend.routing_graph
+    edges = rg.path_edges(rg.node_indices(route_nodes), weights)
+    return float(np.sum(weights[edges]))
+
+def make_backend(G, engine, contraction_hierarchies=False):
+    # No route cache, so every call is a real search
+    backend = RouteOptimizerBackend(engine=engine, contraction_hierarchies=contraction_hierarchies,
+                                    route_cache_size=0)
+    backend.model = StubModel()
+    backend.model_hash = 'stub'
+    backend.set_graph(G)
+    return backend
+
+def run_size(size, queries, batch_size, ch_max_nodes, seed):
+    G, build_ms = timed(lambda: synthetic_graph(size, seed=seed))
+    backend, setup_ms = timed(lambda: make_backend(G, 'csr'))
+    weights, score_ms = timed(lambda: backend.get_edge_weights(HOUR, WEEKDAY))
+    rg = backend.routing_graph
+    step = {
+        'grid': size,
+        'nodes': rg.num_nodes,
+        'edges': rg.num_edges,
+        'graph_build_ms': build_ms,
+        'backend_setup_ms': setup_ms,
+        'weight_scoring_ms': score_ms,
+        'memory_bytes': backend.memory_bytes(),
+        'latency': {},
+        'mismatches': []
+    }
+
+    points = random_points(G, 2 * queries, seed=seed)
+    pairs = list(zip(points[::2], points[1::2]))
+
+    # Snapping: one batch query vs one point at a time
+    _, batch_ms = timed(lambda: backend.snap_points(points))
+    single = [timed(lambda p=p: backend.nearest_node(p))[1] for p in points[:200]]
+    step['snap'] = {'batch_points': len(points), 'batch_ms': batch_ms,
+                    'single': summarize(single)}
+
+    # Reference costs: plain Dijkstra on the CSR engine
+    reference = []
+    samples = []
+    for start, end in pairs:
+        (_, nodes), ms = timed(lambda: backend.predict_route(start, end, HOUR, WEEKDAY, algorithm='dijkstra'))
+        reference.append(route_cost(backend, nodes, weights))
+        samples.append(ms)
+    step['latency']['csr/dijkstra'] = summarize(samples)
+
+    def check(name, routes):
+        for (start, end), expected, nodes in zip(pairs, reference, routes):
+            cost = route_cost(backend, nodes, weights)
+            if abs(cost - expected) > COST_TOLERANCE * max(1.0, abs(expected)):
+                step['mismatches'].append({'mode': name, 'start': start, 'end': end,
+                                           'cost': cost, 'expected': expected})
+
+    def measure(name, route_backend, **kwargs):
+        samples, routes = [], []
+        for start, end in pairs:
+            (_, nodes), ms = timed(lambda: route_backend.predict_route(start, end, HOUR, WEEKDAY, **kwargs))
+            samples.append(ms)
+            routes.append(nodes)
+        step['latency'][name] = summarize(samples)
+        check(name, routes)
+
+    measure('csr/astar', backend, algorithm='astar')
+
+    if rg.num_nodes <= NETWORKX_MAX_NODES:
+        measure('networkx/dijkstra', backend, engine='networkx', algorithm='dijkstra')
+        measure('networkx/astar', backend, engine='networkx', algorithm='astar')
+
+    if rg.num_nodes <= ch_max_nodes:
+        ch_backend = make_backend(G, 'csr', contraction_hierarchies=True)
+        ch_backend.hierarchies.max_nodes = ch_max_nodes
+        ch_weights = ch_backend.get_edge_weights(HOUR, WEEKDAY)
+        key = ch_backend.weight_key(HOUR, WEEKDAY)
+        started = time.perf_counter()
+        ch_backend.hierarchies.get(key, ch_backend.routing_graph, ch_weights)
+        ch_backend.hierarchies.wait()
+        step['ch_build_ms'] = (time.perf_counter() - started) * 1000
+        hierarchy = ch_backend.hierarchies.get(key, ch_backend.routing_graph, ch_weights)
+        step['ch_bytes'] = hierarchy.nbytes if hierarchy is not None else None
+        measure('csr/ch', ch_backend)
+        ch_backend.close()
+
+    # Route cache: the same requests again, answered without a search
+    backend.route_cache = RouteCache()
+    for start, end in pairs:
+        backend.predict_route(start, end, HOUR, WEEKDAY)
+    samples = [timed(lambda s=start, e=end: backend.predict_route(s, e, HOUR, WEEKDAY))[1]
+               for start, end in pairs]
+    step['latency']['route_cache_hit'] = summarize(samples)
+    backend.route_cache = RouteCache(0)
+
+    # Batch throughput across the process pool
+    batch_points = random_points(G, 2 * batch_size, seed=seed + 1)
+    requests = [{'start_point': start, 'end_point': end, 'time_of_day': HOUR, 'day_of_week': WEEKDAY}
+                for start, end in zip(batch_points[::2], batch_points[1::2])]
+    routes, batch_ms = timed(lambda: backend.predict_routes(requests))
+    step['batch'] = {
+        'routes': len(requests),
+        'found': sum(1 for _, nodes in routes if nodes),
+        'total_ms': batch_ms,
+        'routes_per_s': len(requests) / (batch_ms / 1000) if batch_ms else None
+    }
+    backend.close()
+
+    print(f"{size}x{size} ({rg.num_nodes:,} nodes): " + ', '.join(
+        f"{name} {q['median_ms']:.2f} ms" for name, q in step['latency'].items())
+        + f", batch {step['batch']['routes_per_s']:.0f} routes/s", file=sys.stderr)
+    return step
+
+def run(sizes, queries, batch_size, ch_max_nodes, seed=0):
+    results = [run_size(size, queries, batch_size, ch_max_nodes, seed) for size in sizes]
+    return {
+        'benchmark': 'routes',
+        'queries': queries,
+        'batch_size': batch_size,
+        'networkx_version': nx.__version__,
+        'results': results,
+        'mismatches': sum(len(step['mismatches']) for step in results)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 60, 120],
+                        help='grid sides (a size of n gives n*n intersections)')
+    parser.add_argument('--queries', type=int, default=50, help='routes timed per mode')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--ch-max-nodes', type=int, default=DEFAULT_MAX_NODES,
+                        help='build contraction hierarchies only up to this many nodes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.sizes, args.queries, args.batch_size, args.ch_max_nodes, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if report['mismatches']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# benchmarks/suite.py
+"""
+Run every benchmark offline and write one JSON report for regression tracking.
+
+Scenarios: single-route latency and batch routing throughput on synthetic
+graphs (routes.py), telemetry ingest rate (ingest.py) and dashboard query
+latency as readings grow (db_queries.py). --quick uses sizes small enough
+for CI. Exits non-zero if any routing mode disagreed with Dijkstra.
+
+    python benchmarks/suite.py --output results/benchmarks.json
+    python benchmarks/suite.py --quick
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks import db_queries, ingest, routes
+
+PROFILES = {
+    'quick': {
+        'routes': {'sizes': [20, 40], 'queries': 20, 'batch_size': 100, 'ch_max_nodes': 2000},
+        'ingest': {'readings': 20000, 'batch': 500},
+        'db_queries': {'sizes': [10000, 50000], 'repeats': 50, 'drop_indexes': False}
+    },
+    'full': {
+        'routes': {'sizes': [30, 60, 120], 'queries': 50, 'batch_size': 500, 'ch_max_nodes': 20000},
+        'ingest': {'readings': 200000, 'batch': 500},
+        'db_queries': {'sizes': [10000, 100000, 1000000], 'repeats': 200, 'drop_indexes': False}
+    }
+}
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(profile, scenarios):
+    settings = PROFILES[profile]
+    report = {
+        'profile': profile,
+        'started_at': datetime.now().isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'scenarios': {}
+    }
+    runners = {'routes': routes.run, 'ingest': ingest.run, 'db_queries': db_queries.run}
+    for name in scenarios:
+        print(f'== {name}', file=sys.stderr)
+        started = time.perf_counter()
+        report['scenarios'][name] = runners[name](**settings[name])
+        report['scenarios'][name]['elapsed_s'] = time.perf_counter() - started
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='small sizes, for CI')
+    parser.add_argument('--only', nargs='+', choices=['routes', 'ingest', 'db_queries'],
+                        default=['routes', 'ingest', 'db_queries'])
+    parser.add_argument('--output', help='write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    report = run('quick' if args.quick else 'full', args.only)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if report['scenarios'].get('routes', {}).get('mismatches'):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
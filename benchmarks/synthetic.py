@@ -0,0 +1,107 @@
+# benchmarks/synthetic.py
+"""
+Synthetic road networks and a stub travel-time model for offline benchmarks.
+
+synthetic_graph() builds an OSMnx-shaped MultiDiGraph (node x/y, edge
+length, highway, maxspeed and some LineString geometry): a grid of
+residential streets with random primary arterials laid over it, so routes
+have a fast backbone to find the way a real city does. StubModel stands
+in for the trained XGBoost model with the same predict() interface.
+"""
+import math
+import random
+import networkx as nx
+import numpy as np
+from shapely.geometry import LineString
+
+from routing.graph import haversine
+
+# Grid origin (south-west corner) and street spacing
+ORIGIN_LAT, ORIGIN_LON = 28.5, 77.0
+SPACING_M = 150
+# OSM-like node ids, so nothing relies on ids being 0..N-1
+NODE_ID_BASE = 10 ** 9
+
+def synthetic_graph(rows, cols=None, arterials=None, oneway=0.1, seed=0):
+    """
+    Grid road network of rows x cols intersections plus random arterials
+
+    arterials defaults to one per 20 intersections; each is a straight
+    primary road between two intersections up to a tenth of the grid apart.
+    A fraction oneway of the residential streets only run one way.
+    """
+    cols = cols or rows
+    arterials = (rows * cols) // 20 if arterials is None else arterials
+    rng = random.Random(seed)
+    dlat = SPACING_M / 111320
+    dlon = SPACING_M / (111320 * math.cos(math.radians(ORIGIN_LAT)))
+
+    G = nx.MultiDiGraph(crs='epsg:4326')
+    for i in range(rows):
+        for j in range(cols):
+            G.add_node(NODE_ID_BASE + i * cols + j,
+                       y=ORIGIN_LAT + i * dlat + rng.uniform(-0.1, 0.1) * dlat,
+                       x=ORIGIN_LON + j * dlon + rng.uniform(-0.1, 0.1) * dlon)
+
+    def add(u, v, highway, maxspeed, curved=False):
+        a, b = G.nodes[u], G.nodes[v]
+        length = float(haversine(a['y'], a['x'], b['y'], b['x']))
+        data = {'length': length * (1.1 if curved else 1.0), 'highway': highway, 'maxspeed': maxspeed}
+        if curved:
+            bend = ((a['x'] + b['x']) / 2 + dlon * 0.1, (a['y'] + b['y']) / 2)
+            data['geometry'] = LineString([(a['x'], a['y']), bend, (b['x'], b['y'])])
+        G.add_edge(u, v, **data)
+
+    def street(u, v):
+        highway = rng.choice(('residential', 'residential', 'tertiary'))
+        maxspeed = rng.choice((None, '30', '40', '40 km/h'))
+        curved = rng.random() < 0.2
+        add(u, v, highway, maxspeed, curved)
+        if rng.random() >= oneway:
+            add(v, u, highway, maxspeed, curved)
+
+    for i in range(rows):
+        for j in range(cols):
+            u = NODE_ID_BASE + i * cols + j
+            if j + 1 < cols:
+                street(u, u + 1)
+            if i + 1 < rows:
+                street(u, u + cols)
+
+    reach = max(2, max(rows, cols) // 10)
+    for _ in range(arterials):
+        i, j = rng.randrange(rows), rng.randrange(cols)
+        k = min(rows - 1, max(0, i + rng.randint(-reach, reach)))
+        l = min(cols - 1, max(0, j + rng.randint(-reach, reach)))
+        if (i, j) != (k, l):
+            u, v = NODE_ID_BASE + i * cols + j, NODE_ID_BASE + k * cols + l
+            add(u, v, 'primary', rng.choice(('60', '80')))
+            add(v, u, 'primary', rng.choice(('60', '80')))
+    return G
+
+def random_points(G, count, seed=0):
+    """(lat, lon) points scattered over the graph's bounding box"""
+    rng = random.Random(seed)
+    lats = [d['y'] for _, d in G.nodes(data=True)]
+    lons = [d['x'] for _, d in G.nodes(data=True)]
+    return [(rng.uniform(min(lats), max(lats)), rng.uniform(min(lons), max(lons))) for _ in range(count)]
+
+class StubModel:
+    """
+    Deterministic stand-in for the travel-time model
+
+    Predicts the training target (length / maxspeed * 60) with a fixed
+    congestion factor per highway_* column, vectorized like XGBoost's
+    predict over the whole edge feature matrix.
+    """
+    def __init__(self, congestion=0.25):
+        self.congestion = congestion
+        self.calls = 0
+
+    def predict(self, X):
+        self.calls += 1
+        length = X['length'].to_numpy(dtype=np.float64)
+        maxspeed = X['maxspeed'].to_numpy(dtype=np.float64)
+        highway = X[[c for c in X.columns if c.startswith('highway_')]].to_numpy(dtype=np.float64)
+        factor = 1 + self.congestion * highway.sum(axis=1) if highway.size else 1.0
+        return (length / maxspeed * 60 * factor).astype(np.float32)
@@ -1,162 +1,466 @@
 # logistics/cargo_manager.py
 import json
+import logging
+import threading
 from datetime import datetime
-from models.database import LogisticsDB
+from models.database import LogisticsDB, current_version, next_version, to_ts
+from logistics.constraints import ConstraintIndex
+from logistics.counters import StatusCounters, status_deltas
+from logistics.events import EventBus
+from logistics import polyline
+from logistics.rollups import ReadingRollups
+from logistics.telemetry import READING_FIELDS, LatestReadings, TelemetryBuffer
+
+logger = logging.getLogger(__name__)
+
+# Statuses a shipment can be moved to
+SHIPMENT_STATUSES = ('planning', 'in_transit', 'delivered')
+
+# Columns served by the active shipments feed; route_data stays out of it,
+# and route geometry is sent as its encoded polyline
+ACTIVE_SHIPMENTS_SQL = '''
+SELECT s.id, s.name, s.status, s.priority, s.risk_level,
+       s.origin_id, s.destination_id, s.departure_time, s.arrival_time,
+       s.current_location, s.route_polyline, s.version, s.updated_at,
+       o.name as origin_name, o.latitude as origin_lat, o.longitude as origin_lon,
+       d.name as dest_name, d.latitude as dest_lat, d.longitude as dest_lon
+FROM shipments s
+JOIN locations o ON s.origin_id = o.id
+JOIN locations d ON s.destination_id = d.id
+'''
 
 class CargoManager:
-    def __init__(self, db_file='data/logistics.db'):
+    def __init__(self, db_file='data/logistics.db', telemetry_batch=500, telemetry_delay=1.0,
+                 telemetry_max_pending=50000, raw_retention_days=7, minute_retention_days=90,
+                 compact_interval=3600, reconcile_interval=300):
         self.db = LogisticsDB(db_file)
+        # Live updates for dashboards, published once changes are committed
+        self.events = EventBus()
+        # Dashboard status counts, maintained on every write
+        self.counters = StatusCounters.load(self.db)
+        # Current conditions per shipment, served from memory
+        self.latest_readings = LatestReadings.load(self.db)
+        # Cargo limits of active shipments; every reading is checked on arrival
+        self.constraints = ConstraintIndex.load(self.db)
+        # Minute/hour aggregates maintained as readings are written
+        self.rollups = ReadingRollups(raw_retention_days, minute_retention_days,
+                                      constraints=self.constraints)
+        # Environmental readings are written in batches off the request path
+        self.telemetry = TelemetryBuffer(self.db, max_batch=telemetry_batch,
+                                         max_delay=telemetry_delay,
+                                         max_pending=telemetry_max_pending,
+                                         latest=self.latest_readings,
+                                         on_accept=[self._check_readings],
+                                         on_flush=[self.rollups.apply, self._persist_alerts,
+                                                   self._publish_readings])
+        
+        # Background upkeep; an interval of None disables the job
+        self._stopping = threading.Event()
+        self._jobs = []
+        self._start_periodic('telemetry-compact', compact_interval, self.compact_readings)
+        self._start_periodic('counter-reconcile', reconcile_interval, self.reconcile_counters)
     
     def add_cargo(self, name, cargo_type, weight=0, volume=0, priority='standard', 
                  temp_min=None, temp_max=None, humidity_min=None, humidity_max=None):
         """Add a new cargo item to the database"""
-        cursor = self.db.conn.cursor()
         now = datetime.now().isoformat()
         
-        cursor.execute('''
-        INSERT INTO cargo (name, type, weight, volume, priority, 
-                          temperature_min, temperature_max, 
-                          humidity_min, humidity_max, 
-                          created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, cargo_type, weight, volume, priority, 
-             temp_min, temp_max, humidity_min, humidity_max, 
-             now, now))
-        
-        self.db.conn.commit()
+        with self.db.writer() as conn:
+            cursor = conn.execute('''
+            INSERT INTO cargo (name, type, weight, volume, priority, 
+                              temperature_min, temperature_max, 
+                              humidity_min, humidity_max, 
+                              created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (name, cargo_type, weight, volume, priority, 
+                 temp_min, temp_max, humidity_min, humidity_max, 
+                 now, now))
+            self.db.after_commit(lambda: self.counters.apply('cargo', {'pending': 1}))
+        
         return cursor.lastrowid
     
     def create_shipment(self, name, origin_id, destination_id, cargo_ids, 
                        departure_time=None, priority='standard', risk_level='medium'):
         """Create a new shipment with cargo items"""
-        cursor = self.db.conn.cursor()
-        now = datetime.now().isoformat()
-        
-        # Create shipment record
-        cursor.execute('''
-        INSERT INTO shipments (name, origin_id, destination_id, departure_time, 
-                              status, priority, risk_level, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (name, origin_id, destination_id, departure_time, 
-             'planning', priority, risk_level, now, now))
+        return self.create_shipments([{
+            'name': name,
+            'origin_id': origin_id,
+            'destination_id': destination_id,
+            'cargo_ids': cargo_ids,
+            'departure_time': departure_time,
+            'priority': priority,
+            'risk_level': risk_level
+        }])[0]
+    
+    def create_shipments(self, shipments):
+        """
+        Create many shipments with their cargo items in one transaction
         
-        shipment_id = cursor.lastrowid
+        shipments are dicts with name, origin_id, destination_id, cargo_ids
+        and optionally departure_time, priority and risk_level. Returns the
+        new shipment ids in the same order.
+        """
+        now = datetime.now().isoformat()
         
-        # Add cargo items to shipment
-        for cargo_id in cargo_ids:
-            cursor.execute('''
+        with self.db.writer() as conn:
+            # writer() holds SQLite's write lock, so ids after the maximum are free
+            first_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM shipments').fetchone()[0]
+            shipment_ids = list(range(first_id, first_id + len(shipments)))
+            version = next_version(conn, 'shipments')
+            
+            conn.executemany('''
+            INSERT INTO shipments (id, name, origin_id, destination_id, departure_time, 
+                                  status, priority, risk_level, created_at, updated_at, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(shipment_id, s['name'], s['origin_id'], s['destination_id'], s.get('departure_time'),
+                  'planning', s.get('priority', 'standard'), s.get('risk_level', 'medium'), now, now, version)
+                 for shipment_id, s in zip(shipment_ids, shipments)])
+            
+            # Add cargo items to shipments
+            conn.executemany('''
             INSERT INTO shipment_items (shipment_id, cargo_id, quantity)
             VALUES (?, ?, ?)
-            ''', (shipment_id, cargo_id, 1))
+            ''', [(shipment_id, cargo_id, 1)
+                 for shipment_id, s in zip(shipment_ids, shipments)
+                 for cargo_id in s.get('cargo_ids', [])])
             
             # Update cargo status
-            cursor.execute('''
+            in_shipments = 'id IN (SELECT cargo_id FROM shipment_items WHERE shipment_id BETWEEN ? AND ?)'
+            id_range = (first_id, first_id + len(shipments) - 1)
+            cargo_before = status_deltas(conn, 'cargo', in_shipments, id_range)
+            conn.execute(f'''
             UPDATE cargo SET status = 'assigned', updated_at = ?
-            WHERE id = ?
-            ''', (now, cargo_id))
+            WHERE {in_shipments}
+            ''', (now,) + id_range)
+            
+            def count():
+                self.counters.apply('shipments', {'planning': len(shipments)})
+                self.counters.transition('cargo', cargo_before, 'assigned')
+            
+            self.db.after_commit(count)
+            
+            envelopes = ConstraintIndex.lookup_many(conn, shipment_ids)
+            self._publish_after_commit('shipments', {
+                'action': 'created', 'ids': shipment_ids, 'status': 'planning', 'version': version
+            })
         
-        self.db.conn.commit()
-        return shipment_id
+        self.constraints.add_many(envelopes)
+        return shipment_ids
     
     def update_shipment_status(self, shipment_id, status, current_location=None):
         """Update shipment status and location"""
-        cursor = self.db.conn.cursor()
+        locations = {shipment_id: current_location} if current_location else None
+        self.update_shipments_status([shipment_id], status, locations)
+    
+    def update_shipments_status(self, shipment_ids, status, current_locations=None):
+        """
+        Move many shipments to status in one transaction
+        
+        current_locations optionally maps shipment ids to their new location.
+        Cargo in the shipments follows them to in_transit or delivered.
+        Returns the number of shipments updated.
+        """
         now = datetime.now().isoformat()
+        ids_json = json.dumps(list(shipment_ids))
         
-        if current_location:
-            # Convert location to JSON string
-            location_json = json.dumps(current_location)
+        with self.db.writer() as conn:
+            in_ids = 'id IN (SELECT value FROM json_each(?))'
+            shipments_before = status_deltas(conn, 'shipments', in_ids, (ids_json,))
+            cargo_before = None
             
-            cursor.execute('''
-            UPDATE shipments SET status = ?, current_location = ?, updated_at = ?
-            WHERE id = ?
-            ''', (status, location_json, now, shipment_id))
-        else:
-            cursor.execute('''
-            UPDATE shipments SET status = ?, updated_at = ?
-            WHERE id = ?
-            ''', (status, now, shipment_id))
-        
-        # Update cargo status for items in this shipment
-        if status == 'delivered':
-            cursor.execute('''
-            UPDATE cargo SET status = 'delivered', updated_at = ?
-            WHERE id IN (
-                SELECT cargo_id FROM shipment_items WHERE shipment_id = ?
-            )
-            ''', (now, shipment_id))
-        elif status == 'in_transit':
-            cursor.execute('''
-            UPDATE cargo SET status = 'in_transit', updated_at = ?
-            WHERE id IN (
-                SELECT cargo_id FROM shipment_items WHERE shipment_id = ?
-            )
-            ''', (now, shipment_id))
-        
-        self.db.conn.commit()
+            version = next_version(conn, 'shipments')
+            updated = conn.execute('''
+            UPDATE shipments SET status = ?, updated_at = ?, version = ?
+            WHERE id IN (SELECT value FROM json_each(?))
+            ''', (status, now, version, ids_json)).rowcount
+            
+            if current_locations:
+                # Convert locations to JSON strings
+                conn.executemany('''
+                UPDATE shipments SET current_location = ?
+                WHERE id = ?
+                ''', [(json.dumps(location), shipment_id)
+                     for shipment_id, location in current_locations.items() if location])
+            
+            # Update cargo status for items in these shipments
+            if status in ('delivered', 'in_transit'):
+                in_shipments = '''id IN (
+                    SELECT cargo_id FROM shipment_items
+                    WHERE shipment_id IN (SELECT value FROM json_each(?))
+                )'''
+                cargo_before = status_deltas(conn, 'cargo', in_shipments, (ids_json,))
+                conn.execute(f'''
+                UPDATE cargo SET status = ?, updated_at = ?
+                WHERE {in_shipments}
+                ''', (status, now, ids_json))
+            
+            def count():
+                self.counters.transition('shipments', shipments_before, status)
+                if cargo_before is not None:
+                    self.counters.transition('cargo', cargo_before, status)
+            
+            self.db.after_commit(count)
+            
+            envelopes = None
+            if status in ('planning', 'in_transit'):
+                missing = [i for i in shipment_ids if self.constraints.get(i) is None]
+                envelopes = ConstraintIndex.lookup_many(conn, missing) if missing else None
+            
+            self._publish_after_commit('shipments', {
+                'action': 'status', 'ids': list(shipment_ids), 'status': status,
+                'current_locations': current_locations or {}, 'version': version
+            })
+        
+        # Only active shipments are checked against their cargo limits
+        if status not in ('planning', 'in_transit'):
+            self.constraints.remove_many(shipment_ids)
+        elif envelopes:
+            self.constraints.add_many(envelopes)
+        
+        return updated
         
+    @property
+    def shipments_version(self):
+        """
+        Latest committed shipment change version
+        
+        Every write to a shipment stamps it with a new version from the
+        database's 'shipments' counter, so a client that saw version v needs
+        only the rows with a higher one, whichever process wrote them.
+        """
+        with self.db.reader() as conn:
+            return current_version(conn, 'shipments')
+    
+    def _publish_after_commit(self, topic, payload):
+        """Publish an event once the surrounding writer() transaction commits"""
+        if self.events.subscriber_count:
+            self.db.after_commit(lambda: self.events.publish(topic, payload))
+    
+    def _check_readings(self, rows):
+        """Check accepted readings against cargo limits as they arrive"""
+        self.constraints.check_rows(rows)
+    
+    def _persist_alerts(self, conn, rows):
+        """Telemetry flush hook: save new alerts, pushing them once they have ids"""
+        written = self.constraints.persist(conn, rows)
+        if written:
+            self.db.after_commit(lambda: self._alerts_saved(written))
+    
+    def _alerts_saved(self, written):
+        for alert in self.constraints.saved(written):
+            self.events.publish('alerts', alert)
+    
+    def _publish_readings(self, conn, rows):
+        """Telemetry flush hook: push the newest reading per shipment in the batch"""
+        if self.events.subscriber_count:
+            self._publish_after_commit('readings', [
+                dict(zip(READING_FIELDS, row)) for row in LatestReadings.newest(rows)
+            ])
+    
+    def set_shipment_route(self, shipment_id, route_coords, route_data=None):
+        """
+        Store a shipment's route
+        
+        route_coords ((lat, lon) pairs) are kept as an encoded polyline;
+        route_data is any other route information, stored as JSON.
+        """
+        with self.db.writer() as conn:
+            version = next_version(conn, 'shipments')
+            conn.execute('''
+            UPDATE shipments SET route_polyline = ?, route_data = ?, updated_at = ?, version = ?
+            WHERE id = ?
+            ''', (polyline.encode(route_coords) if route_coords else None,
+                  json.dumps(route_data) if route_data is not None else None,
+                  datetime.now().isoformat(), version, shipment_id))
+            self._publish_after_commit('shipments', {
+                'action': 'route', 'ids': [shipment_id], 'version': version
+            })
+    
+    def get_shipment_route_geometry(self, shipment_id):
+        """Decoded route coordinates of a shipment, or None if it has no route"""
+        with self.db.reader() as conn:
+            row = conn.execute('SELECT route_polyline FROM shipments WHERE id = ?',
+                               (shipment_id,)).fetchone()
+        return polyline.decode(row[0]) if row and row[0] else None
+    
     def get_shipment_stats(self):
         """Get shipment statistics by status"""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        SELECT status, COUNT(*) as count
-        FROM shipments
-        GROUP BY status
-        ''')
-        
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        return self.counters.get('shipments')
     
     def get_cargo_stats(self):
         """Get cargo statistics by status"""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        SELECT status, COUNT(*) as count
-        FROM cargo
-        GROUP BY status
-        ''')
-        
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        return self.counters.get('cargo')
+    
+    def reconcile_counters(self):
+        """Recount statuses from the tables; returns the tables that had drifted"""
+        return self.counters.reconcile(self.db)
     
     def get_active_shipments(self):
         """Get all active shipments (planning or in_transit)"""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        SELECT s.*, 
-               o.name as origin_name, o.latitude as origin_lat, o.longitude as origin_lon,
-               d.name as dest_name, d.latitude as dest_lat, d.longitude as dest_lon
-        FROM shipments s
-        JOIN locations o ON s.origin_id = o.id
-        JOIN locations d ON s.destination_id = d.id
-        WHERE s.status IN ('planning', 'in_transit')
-        ''')
+        with self.db.reader() as conn:
+            cursor = conn.execute(ACTIVE_SHIPMENTS_SQL + '''
+            WHERE s.status IN ('planning', 'in_transit')
+            ''')
+            
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    
+    def get_active_shipments_since(self, version):
+        """
+        Changes to the active shipment list after version
+        
+        Returns (current version, shipments changed and still active, ids of
+        shipments that changed and are no longer active).
+        """
+        with self.db.reader() as conn:
+            # Read the counter first: a write racing with the query is re-sent next time
+            current = current_version(conn, 'shipments')
+            cursor = conn.execute(ACTIVE_SHIPMENTS_SQL + '''
+            WHERE s.version > ?
+            ''', (version,))
+            
+            columns = [col[0] for col in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
+        changed = [row for row in rows if row['status'] in ('planning', 'in_transit')]
+        removed = [row['id'] for row in rows if row['status'] not in ('planning', 'in_transit')]
+        return current, changed, removed
+
+    def get_in_transit_shipments(self):
+        """
+        In-transit shipments with what re-routing needs
+
+        Each has its decoded 'route' geometry (None if no route is stored),
+        current_location parsed from JSON and its 'cargo' rows.
+        """
+        with self.db.reader() as conn:
+            return self._shipments_with_cargo(conn, "s.status = 'in_transit'")
+
+    def get_shipment(self, shipment_id):
+        """
+        One shipment with its locations, decoded route, cargo and parsed
+        route_data, or None if it does not exist
+        """
+        with self.db.reader() as conn:
+            shipments = self._shipments_with_cargo(conn, 's.id = ?', (shipment_id,))
+            if not shipments:
+                return None
+            route_data = conn.execute('SELECT route_data FROM shipments WHERE id = ?',
+                                      (shipment_id,)).fetchone()[0]
+        shipment = shipments[0]
+        shipment['route_data'] = json.loads(route_data) if route_data else None
+        return shipment
+
+    @staticmethod
+    def _shipments_with_cargo(conn, where, params=()):
+        cursor = conn.execute(ACTIVE_SHIPMENTS_SQL + f'WHERE {where}', params)
+        columns = [col[0] for col in cursor.description]
+        shipments = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+        cursor = conn.execute(f'''
+        SELECT si.shipment_id, c.*
+        FROM shipment_items si
+        JOIN cargo c ON c.id = si.cargo_id
+        JOIN shipments s ON s.id = si.shipment_id
+        WHERE {where}
+        ''', params)
         columns = [col[0] for col in cursor.description]
-        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        cargo = {}
+        for row in cursor.fetchall():
+            item = dict(zip(columns, row))
+            cargo.setdefault(item.pop('shipment_id'), []).append(item)
+
+        for shipment in shipments:
+            polyline_text = shipment.pop('route_polyline')
+            shipment['route'] = polyline.decode(polyline_text) if polyline_text else None
+            if shipment['current_location']:
+                shipment['current_location'] = json.loads(shipment['current_location'])
+            shipment['cargo'] = cargo.get(shipment['id'], [])
+        return shipments
     
     def add_environmental_reading(self, shipment_id, temperature, humidity):
-        """Record environmental conditions for a shipment"""
-        cursor = self.db.conn.cursor()
-        now = datetime.now().isoformat()
-        
-        cursor.execute('''
-        INSERT INTO environmental_readings (shipment_id, temperature, humidity, timestamp)
-        VALUES (?, ?, ?, ?)
-        ''', (shipment_id, temperature, humidity, now))
-        
-        self.db.conn.commit()
+        """Record environmental conditions for a shipment; False if ingest is backlogged"""
+        return self.telemetry.add(shipment_id, temperature, humidity)
+    
+    def add_environmental_readings(self, readings):
+        """
+        Record many readings at once
         
+        readings are dicts with shipment_id, temperature, humidity and an
+        optional timestamp (ISO 8601 or epoch seconds). Returns the number
+        accepted into the write buffer; the rest were refused because it is full.
+        """
+        return self.telemetry.add_many(
+            (r['shipment_id'], r.get('temperature'), r.get('humidity'), r.get('timestamp'))
+            for r in readings
+        )
+    
+    def get_alerts(self, since_id=0, shipment_id=None):
+        """Recent constraint alerts, newer than since_id"""
+        return self.constraints.recent(since_id, shipment_id)
+    
+    def get_violating_shipments(self):
+        """Active shipments whose latest reading breaks a cargo limit"""
+        return self.constraints.violating()
+    
+    def get_ingest_stats(self):
+        """Telemetry write buffer metrics"""
+        return self.telemetry.stats()
+    
     def get_latest_environmental_readings(self, shipment_id):
         """Get latest environmental readings for a shipment"""
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-        SELECT * FROM environmental_readings
-        WHERE shipment_id = ?
-        ORDER BY timestamp DESC
-        LIMIT 1
-        ''', (shipment_id,))
-        
-        row = cursor.fetchone()
-        if row:
-            columns = [col[0] for col in cursor.description]
-            return dict(zip(columns, row))
-        return None
\ No newline at end of file
+        return self.latest_readings.get(shipment_id)
+    
+    def get_latest_readings(self, shipment_ids=None):
+        """
+        Latest reading for each of shipment_ids (default: every active shipment)
+        
+        Returns {shipment_id: reading} for the shipments that have reported.
+        """
+        if shipment_ids is None:
+            with self.db.reader() as conn:
+                shipment_ids = [row[0] for row in conn.execute('''
+                SELECT id FROM shipments WHERE status IN ('planning', 'in_transit')
+                ''')]
+        return self.latest_readings.get_many(shipment_ids)
+    
+    def get_reading_history(self, shipment_id, start, end=None, max_points=500):
+        """
+        Environmental history for charts
+        
+        start and end are datetimes or ISO strings (end defaults to now).
+        Served from raw readings or minute/hour rollups, whichever is the
+        finest that covers the range within max_points.
+        """
+        end = to_ts(end) if end is not None else to_ts(datetime.now())
+        return self.rollups.history(self.db, shipment_id, to_ts(start), end, max_points)
+    
+    def compact_readings(self):
+        """Apply the retention policy now; returns rows deleted per table"""
+        # Rollups must include everything that is about to be deleted
+        self.telemetry.flush()
+        return self.rollups.compact(self.db)
+    
+    def _start_periodic(self, name, interval, fn):
+        """Run fn every interval seconds on a daemon thread until close()"""
+        if not interval:
+            return
+        
+        def run():
+            while not self._stopping.wait(interval):
+                try:
+                    fn()
+                except Exception:
+                    logger.exception('Background job %s failed', name)
+        
+        thread = threading.Thread(target=run, name=name, daemon=True)
+        thread.start()
+        self._jobs.append(thread)
+    
+    def close(self):
+        """Flush buffered telemetry and close the database"""
+        self._stopping.set()
+        for thread in self._jobs:
+            thread.join()
+        self.telemetry.close()
+        self.db.close()
\ No newline at end of file
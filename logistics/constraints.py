@@ -0,0 +1,186 @@
+# logistics/constraints.py
+import json
+import threading
+from collections import deque
+from datetime import datetime
+
+# Envelope of a shipment: the tightest limits over all of its cargo
+ENVELOPE_FIELDS = ('temperature_min', 'temperature_max', 'humidity_min', 'humidity_max')
+NO_LIMITS = (None, None, None, None)
+
+ENVELOPE_SQL = '''
+SELECT si.shipment_id,
+       MAX(c.temperature_min), MIN(c.temperature_max),
+       MAX(c.humidity_min), MIN(c.humidity_max)
+FROM shipment_items si
+JOIN cargo c ON c.id = si.cargo_id
+'''
+
+def violations(envelope, temperature, humidity):
+    """Names of the limits a reading breaks, e.g. ('temperature_max',)"""
+    temp_min, temp_max, humidity_min, humidity_max = envelope
+    broken = ()
+    if temperature is not None:
+        if temp_min is not None and temperature < temp_min:
+            broken += ('temperature_min',)
+        elif temp_max is not None and temperature > temp_max:
+            broken += ('temperature_max',)
+    if humidity is not None:
+        if humidity_min is not None and humidity < humidity_min:
+            broken += ('humidity_min',)
+        elif humidity_max is not None and humidity > humidity_max:
+            broken += ('humidity_max',)
+    return broken
+
+class ConstraintIndex:
+    """
+    Constraint envelopes of active shipments, checked on every reading.
+
+    Envelopes are loaded for planning/in-transit shipments at startup,
+    added when a shipment is created and dropped when it is delivered, so
+    checking a reading is a dict lookup and a few comparisons.
+
+    An alert is raised when a shipment's set of broken limits changes: once
+    when it goes out of bounds (kind 'violation') and once when it is back
+    within them (kind 'cleared'), not for every out-of-range reading. The
+    most recent alerts are kept in memory; all of them are written to the
+    constraint_alerts table with the next telemetry flush, and get the id
+    SQLite assigns them once that flush commits.
+    """
+    def __init__(self, envelopes=None, max_recent=1000):
+        self._envelopes = dict(envelopes or {})
+        self._broken = {}
+        self._recent = deque(maxlen=max_recent)
+        self._unsaved = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, db, **kwargs):
+        """Envelopes of every active shipment"""
+        with db.reader() as conn:
+            rows = conn.execute(ENVELOPE_SQL + '''
+            JOIN shipments s ON s.id = si.shipment_id
+            WHERE s.status IN ('planning', 'in_transit')
+            GROUP BY si.shipment_id
+            ''').fetchall()
+        return cls({row[0]: tuple(row[1:]) for row in rows}, **kwargs)
+
+    @staticmethod
+    def lookup(conn, shipment_id):
+        """Envelope of any shipment, read from the database"""
+        row = conn.execute(ENVELOPE_SQL + 'WHERE si.shipment_id = ?', (shipment_id,)).fetchone()
+        return tuple(row[1:]) if row and row[0] is not None else NO_LIMITS
+
+    @staticmethod
+    def lookup_many(conn, shipment_ids):
+        """{shipment_id: envelope} for many shipments in one query"""
+        envelopes = dict.fromkeys(shipment_ids, NO_LIMITS)
+        rows = conn.execute(ENVELOPE_SQL + '''
+        WHERE si.shipment_id IN (SELECT value FROM json_each(?))
+        GROUP BY si.shipment_id
+        ''', (json.dumps(list(envelopes)),))
+        envelopes.update((row[0], tuple(row[1:])) for row in rows)
+        return envelopes
+
+    def add(self, shipment_id, envelope):
+        with self._lock:
+            self._envelopes[shipment_id] = tuple(envelope)
+
+    def add_many(self, envelopes):
+        with self._lock:
+            self._envelopes.update(envelopes)
+
+    def remove(self, shipment_id):
+        self.remove_many([shipment_id])
+
+    def remove_many(self, shipment_ids):
+        with self._lock:
+            for shipment_id in shipment_ids:
+                self._envelopes.pop(shipment_id, None)
+                self._broken.pop(shipment_id, None)
+
+    def get(self, shipment_id):
+        """Envelope of an active shipment, or None if it is not tracked"""
+        return self._envelopes.get(shipment_id)
+
+    def envelope(self, conn, shipment_id):
+        """Envelope from memory when active, else from the database"""
+        envelope = self._envelopes.get(shipment_id)
+        return envelope if envelope is not None else self.lookup(conn, shipment_id)
+
+    def check_rows(self, rows):
+        """
+        Check accepted (shipment_id, temperature, humidity, timestamp, ts) rows
+
+        Returns the alerts raised, oldest first. Their id stays None until
+        they are saved.
+        """
+        raised = []
+        with self._lock:
+            for shipment_id, temperature, humidity, timestamp, ts in rows:
+                envelope = self._envelopes.get(shipment_id)
+                if envelope is None:
+                    continue
+                broken = violations(envelope, temperature, humidity)
+                if broken == self._broken.get(shipment_id, ()):
+                    continue
+                self._broken[shipment_id] = broken
+                alert = {
+                    'id': None,
+                    'shipment_id': shipment_id,
+                    'kind': 'violation' if broken else 'cleared',
+                    'limits': list(broken),
+                    'temperature': temperature,
+                    'humidity': humidity,
+                    'envelope': dict(zip(ENVELOPE_FIELDS, envelope)),
+                    'timestamp': timestamp,
+                    'ts': ts,
+                    'raised_at': datetime.now().isoformat()
+                }
+                self._recent.append(alert)
+                self._unsaved.append(alert)
+                raised.append(alert)
+        return raised
+
+    def recent(self, since_id=0, shipment_id=None):
+        """Saved alerts kept in memory with id greater than since_id"""
+        with self._lock:
+            return [alert for alert in self._recent
+                    if alert['id'] is not None and alert['id'] > since_id and (shipment_id is None or alert['shipment_id'] == shipment_id)]
+
+    def violating(self):
+        """{shipment_id: broken limit names} for shipments currently out of bounds"""
+        with self._lock:
+            return {shipment_id: list(broken) for shipment_id, broken in self._broken.items() if broken}
+
+    def persist(self, conn, rows=None):
+        """
+        Telemetry flush hook: write alerts raised since the last flush
+
+        Ids are left to SQLite, so processes sharing the database never
+        collide. Returns (alert, id) pairs to hand to saved() once the
+        transaction commits; until then the alerts stay queued, so a
+        rolled-back flush writes them again.
+        """
+        with self._lock:
+            alerts = list(self._unsaved)
+        written = []
+        for a in alerts:
+            cursor = conn.execute('''
+            INSERT INTO constraint_alerts (shipment_id, kind, limits, temperature, humidity,
+                                           timestamp, ts, raised_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (a['shipment_id'], a['kind'], ','.join(a['limits']), a['temperature'],
+                  a['humidity'], a['timestamp'], a['ts'], a['raised_at']))
+            written.append((a, cursor.lastrowid))
+        return written
+
+    def saved(self, written):
+        """Give committed alerts their ids and stop queueing them; returns the alerts"""
+        done = set()
+        with self._lock:
+            for alert, alert_id in written:
+                alert['id'] = alert_id
+                done.add(id(alert))
+            self._unsaved = [alert for alert in self._unsaved if id(alert) not in done]
+        return [alert for alert, alert_id in written]
@@ -0,0 +1,77 @@
+# logistics/counters.py
+import threading
+from collections import Counter
+
+# Tables whose rows are counted by status
+COUNTED_TABLES = ('cargo', 'shipments')
+
+def count_by_status(conn, table):
+    """Exact {status: count} for a table, via its status index"""
+    return Counter(dict(conn.execute(f'SELECT status, COUNT(*) FROM {table} GROUP BY status')))
+
+def status_deltas(conn, table, where, params):
+    """
+    Counter of current statuses for the rows matching where
+
+    Call inside the write transaction before changing those rows; the
+    result is what leaves each status.
+    """
+    return Counter(dict(conn.execute(f'''
+    SELECT status, COUNT(*) FROM {table} WHERE {where} GROUP BY status
+    ''', params)))
+
+class StatusCounters:
+    """
+    Row counts per status for cargo and shipments, kept in memory.
+
+    Writers apply deltas after their transaction commits (under the write
+    lock, so in commit order), and the stats endpoints read the counters
+    without touching the database. reconcile() recounts from the tables
+    as a safety net against drift, e.g. rows changed outside CargoManager.
+    """
+    def __init__(self, counts=None):
+        self._counts = {table: Counter((counts or {}).get(table, {})) for table in COUNTED_TABLES}
+        self._lock = threading.Lock()
+        self.reconciliations = 0
+        self.drift_corrections = 0
+
+    @classmethod
+    def load(cls, db):
+        with db.reader() as conn:
+            return cls({table: count_by_status(conn, table) for table in COUNTED_TABLES})
+
+    def apply(self, table, added=None, removed=None):
+        """Count rows entering statuses (added) and leaving them (removed)"""
+        with self._lock:
+            counts = self._counts[table]
+            counts.update(added or {})
+            counts.subtract(removed or {})
+
+    def transition(self, table, old_statuses, new_status):
+        """Rows counted in old_statuses (a Counter) all moved to new_status"""
+        self.apply(table, {new_status: sum(old_statuses.values())}, old_statuses)
+
+    def get(self, table):
+        """{status: count}, leaving out statuses with no rows"""
+        with self._lock:
+            return {status: count for status, count in self._counts[table].items() if count > 0}
+
+    def reconcile(self, db):
+        """
+        Recount every table and replace the in-memory counts
+
+        Runs under the write lock so no write can commit between the recount
+        and the swap. Returns the tables whose counts had drifted.
+        """
+        drifted = []
+        with db.writer() as conn:
+            for table in COUNTED_TABLES:
+                actual = count_by_status(conn, table)
+                with self._lock:
+                    current = +self._counts[table]
+                    if current != actual:
+                        drifted.append(table)
+                    self._counts[table] = actual
+        self.reconciliations += 1
+        self.drift_corrections += len(drifted)
+        return drifted
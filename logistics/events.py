@@ -0,0 +1,90 @@
+# logistics/events.py
+import itertools
+import json
+import queue
+import threading
+
+class Subscription:
+    """
+    One subscriber's queue of pre-formatted server-sent events.
+
+    The queue is bounded: a subscriber that stops reading loses the oldest
+    events rather than holding memory, and is sent a 'resync' event so it
+    knows to refetch full state.
+    """
+    def __init__(self, bus, topics, max_queue):
+        self.bus = bus
+        self.topics = frozenset(topics) if topics else None
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def wants(self, topic):
+        return self.topics is None or topic in self.topics
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # Make room for a marker telling the client its view has gaps
+            self.dropped += 1
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(self.bus.format('resync', {'dropped': self.dropped}))
+            except queue.Full:
+                pass
+
+    def get(self, timeout=None):
+        """Next formatted event, or None if none arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+class EventBus:
+    """
+    In-process publish/subscribe for live dashboard updates.
+
+    publish() formats each event once as a server-sent event and hands the
+    same string to every interested subscriber, so the cost of an update
+    does not depend on how each client renders it, and N open dashboards
+    cost one fan-out instead of N polling query streams.
+    """
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics=None):
+        """Subscribe to the given topics (default: all)"""
+        subscription = Subscription(self, topics, self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def format(self, topic, payload):
+        """A server-sent event frame for payload"""
+        return f'id: {next(self._ids)}\nevent: {topic}\ndata: {json.dumps(payload)}\n\n'
+
+    def publish(self, topic, payload):
+        with self._lock:
+            subscribers = [s for s in self._subscribers if s.wants(topic)]
+        if not subscribers:
+            return
+        message = self.format(topic, payload)
+        for subscription in subscribers:
+            subscription.put(message)
@@ -0,0 +1,49 @@
+# logistics/polyline.py
+"""
+Encoded polyline format for route geometry.
+
+Coordinates are rounded to 1e-5 degrees (about a meter), delta-encoded and
+packed as printable characters, so a route of a few thousand points is a
+few kilobytes of text instead of a JSON array several times that size.
+This is the format Google Maps and Leaflet plugins decode natively.
+"""
+PRECISION = 5
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+def encode(coords, precision=PRECISION):
+    """Encode a sequence of (lat, lon) pairs"""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        lat, lon = int(round(lat * factor)), int(round(lon * factor))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lon - prev_lon, out)
+        prev_lat, prev_lon = lat, lon
+    return ''.join(out)
+
+def decode(text, precision=PRECISION):
+    """Decode a polyline back to a list of (lat, lon) pairs"""
+    factor = 10 ** precision
+    coords = []
+    values = [0, 0]
+    index, length = 0, len(text)
+    while index < length:
+        for i in (0, 1):
+            shift = result = 0
+            while True:
+                byte = ord(text[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            values[i] += ~(result >> 1) if result & 1 else result >> 1
+        coords.append((values[0] / factor, values[1] / factor))
+    return coords
@@ -0,0 +1,189 @@
+# logistics/rollups.py
+import time
+from logistics.constraints import ConstraintIndex, violations
+
+# (name, bucket width in ms, table), finest first
+RESOLUTIONS = (
+    ('minute', 60 * 1000, 'reading_rollups_minute'),
+    ('hour', 60 * 60 * 1000, 'reading_rollups_hour'),
+)
+
+ROLLUP_COLUMNS = ('shipment_id', 'bucket', 'count',
+                  'temperature_count', 'temperature_min', 'temperature_max', 'temperature_sum',
+                  'humidity_count', 'humidity_min', 'humidity_max', 'humidity_sum',
+                  'excursions')
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+def _merge_min(column):
+    return f'MIN(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))'
+
+def _merge_max(column):
+    return f'MAX(COALESCE({column}, excluded.{column}), COALESCE(excluded.{column}, {column}))'
+
+def _upsert_sql(table):
+    """Add a batch aggregate into an existing bucket, or create the bucket"""
+    updates = []
+    for column in ROLLUP_COLUMNS[2:]:
+        if column.endswith('_min'):
+            updates.append(f'{column} = {_merge_min(column)}')
+        elif column.endswith('_max'):
+            updates.append(f'{column} = {_merge_max(column)}')
+        else:
+            updates.append(f'{column} = {column} + excluded.{column}')
+    return f'''
+    INSERT INTO {table} ({', '.join(ROLLUP_COLUMNS)})
+    VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))})
+    ON CONFLICT (shipment_id, bucket) DO UPDATE SET {', '.join(updates)}
+    '''
+
+class ReadingRollups:
+    """
+    Per-shipment minute and hour aggregates of environmental readings.
+
+    apply() runs inside the telemetry flush transaction, folding each batch
+    into the rollup tables with UPSERTs, so aggregates are always in step
+    with the raw rows. compact() then enforces retention: raw rows older
+    than raw_retention_days and minute buckets older than
+    minute_retention_days are deleted, while hour buckets are kept.
+    history() serves a time range from the finest resolution that still
+    holds it within max_points.
+
+    Excursions are counted against shipment envelopes from constraints (a
+    ConstraintIndex), read from the database for shipments it does not hold.
+    """
+    def __init__(self, raw_retention_days=7, minute_retention_days=90, constraints=None):
+        self.raw_retention_days = raw_retention_days
+        self.minute_retention_days = minute_retention_days
+        self.constraints = constraints if constraints is not None else ConstraintIndex()
+
+    def aggregate(self, conn, rows, bucket_ms, envelopes=None):
+        """Fold reading rows into one aggregate row per (shipment, bucket)"""
+        envelopes = {} if envelopes is None else envelopes
+        buckets = {}
+        for shipment_id, temperature, humidity, _, ts in rows:
+            key = (shipment_id, ts - ts % bucket_ms)
+            agg = buckets.get(key)
+            if agg is None:
+                agg = buckets[key] = [0, 0, None, None, 0.0, 0, None, None, 0.0, 0]
+            agg[0] += 1
+            if temperature is not None:
+                agg[1] += 1
+                agg[2] = temperature if agg[2] is None else min(agg[2], temperature)
+                agg[3] = temperature if agg[3] is None else max(agg[3], temperature)
+                agg[4] += temperature
+            if humidity is not None:
+                agg[5] += 1
+                agg[6] = humidity if agg[6] is None else min(agg[6], humidity)
+                agg[7] = humidity if agg[7] is None else max(agg[7], humidity)
+                agg[8] += humidity
+            envelope = envelopes.get(shipment_id)
+            if envelope is None:
+                envelope = envelopes[shipment_id] = self.constraints.envelope(conn, shipment_id)
+            if violations(envelope, temperature, humidity):
+                agg[9] += 1
+        return [key + tuple(agg) for key, agg in buckets.items()]
+
+    def apply(self, conn, rows):
+        """Add a batch of (shipment_id, temperature, humidity, timestamp, ts) rows"""
+        envelopes = {}
+        for _, bucket_ms, table in RESOLUTIONS:
+            conn.executemany(_upsert_sql(table), self.aggregate(conn, rows, bucket_ms, envelopes))
+
+    def compact(self, db, now_ms=None):
+        """
+        Delete raw rows and minute buckets past retention
+
+        Works one shipment at a time through the (shipment_id, ts) indexes,
+        so each delete is a short transaction that never stalls ingest for
+        long. Returns the number of rows deleted per table.
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        raw_cutoff = now_ms - self.raw_retention_days * DAY_MS
+        minute_cutoff = now_ms - self.minute_retention_days * DAY_MS
+
+        with db.reader() as conn:
+            # Every shipment that has ever reported has a latest reading
+            shipment_ids = [row[0] for row in conn.execute('SELECT shipment_id FROM latest_readings')]
+
+        deleted = {'environmental_readings': 0, 'reading_rollups_minute': 0}
+        for shipment_id in shipment_ids:
+            with db.writer() as conn:
+                deleted['environmental_readings'] += conn.execute('''
+                DELETE FROM environmental_readings WHERE shipment_id = ? AND ts < ?
+                ''', (shipment_id, raw_cutoff)).rowcount
+                deleted['reading_rollups_minute'] += conn.execute('''
+                DELETE FROM reading_rollups_minute WHERE shipment_id = ? AND bucket < ?
+                ''', (shipment_id, minute_cutoff)).rowcount
+        return deleted
+
+    def history(self, db, shipment_id, start_ms, end_ms, max_points=500, now_ms=None):
+        """
+        Readings for a shipment between start_ms and end_ms (inclusive)
+
+        Uses raw rows when the range is still retained and holds at most
+        max_points of them, else the finest rollup whose bucket count fits,
+        falling back to hours. Every point has the same fields; raw points
+        are single-reading buckets.
+        """
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        raw_cutoff = now_ms - self.raw_retention_days * DAY_MS
+        minute_cutoff = now_ms - self.minute_retention_days * DAY_MS
+
+        with db.reader() as conn:
+            if start_ms >= raw_cutoff:
+                # Count no further than needed to know the range is too big
+                count = conn.execute('''
+                SELECT COUNT(*) FROM (
+                    SELECT 1 FROM environmental_readings
+                    WHERE shipment_id = ? AND ts BETWEEN ? AND ?
+                    LIMIT ?
+                )
+                ''', (shipment_id, start_ms, end_ms, max_points + 1)).fetchone()[0]
+                if count <= max_points:
+                    return {'resolution': 'raw', 'points': self._raw_points(conn, shipment_id, start_ms, end_ms)}
+
+            resolution, size_ms, table = RESOLUTIONS[-1]
+            for name, bucket_ms, candidate in RESOLUTIONS[:-1]:
+                if start_ms >= minute_cutoff and (end_ms - start_ms) // bucket_ms < max_points:
+                    resolution, size_ms, table = name, bucket_ms, candidate
+                    break
+
+            # Buckets are keyed by their start; include the one holding start_ms
+            cursor = conn.execute(f'''
+            SELECT {', '.join(ROLLUP_COLUMNS[1:])} FROM {table}
+            WHERE shipment_id = ? AND bucket BETWEEN ? AND ?
+            ORDER BY bucket
+            ''', (shipment_id, start_ms - start_ms % size_ms, end_ms))
+            points = [self._point(*row) for row in cursor]
+        return {'resolution': resolution, 'points': points}
+
+    def _raw_points(self, conn, shipment_id, start_ms, end_ms):
+        envelope = self.constraints.envelope(conn, shipment_id)
+        cursor = conn.execute('''
+        SELECT ts, temperature, humidity FROM environmental_readings
+        WHERE shipment_id = ? AND ts BETWEEN ? AND ?
+        ORDER BY ts
+        ''', (shipment_id, start_ms, end_ms))
+        return [
+            self._point(ts, 1,
+                        int(temperature is not None), temperature, temperature, temperature or 0.0,
+                        int(humidity is not None), humidity, humidity, humidity or 0.0,
+                        int(bool(violations(envelope, temperature, humidity))))
+            for ts, temperature, humidity in cursor
+        ]
+
+    @staticmethod
+    def _point(bucket, count, temperature_count, temperature_min, temperature_max, temperature_sum,
+               humidity_count, humidity_min, humidity_max, humidity_sum, excursions):
+        return {
+            'ts': bucket,
+            'count': count,
+            'temperature_min': temperature_min,
+            'temperature_max': temperature_max,
+            'temperature_mean': temperature_sum / temperature_count if temperature_count else None,
+            'humidity_min': humidity_min,
+            'humidity_max': humidity_max,
+            'humidity_mean': humidity_sum / humidity_count if humidity_count else None,
+            'excursions': excursions
+        }
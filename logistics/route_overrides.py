@@ -0,0 +1,60 @@
+# logistics/route_overrides.py
+import json
+from datetime import datetime
+from models.database import current_version, next_version
+
+class RouteOverrideStore:
+    """
+    Live routing overrides kept in the database.
+
+    Every process serving routes reads them from here, so an override set
+    through one worker applies in all of them. Each change bumps the
+    'route_overrides' counter; readers compare version() with the version
+    they last loaded and reload only when it moved.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def version(self):
+        """Version of the last committed change"""
+        with self.db.reader() as conn:
+            return current_version(conn, 'route_overrides')
+
+    def load(self):
+        """({id: override}, version), read from one snapshot"""
+        with self.db.reader() as conn:
+            conn.execute('BEGIN')
+            version = current_version(conn, 'route_overrides')
+            overrides = {override_id: json.loads(spec)
+                         for override_id, spec in conn.execute('SELECT id, spec FROM route_overrides')}
+        return overrides, version
+
+    def add(self, overrides):
+        """
+        Store (id, override) pairs, replacing overrides with the same id
+
+        Pairs with a None id get a new one ('o<n>', numbered in the
+        database). Returns the ids in order.
+        """
+        now = datetime.now().isoformat()
+        ids = []
+        with self.db.writer() as conn:
+            for override_id, override in overrides:
+                if override_id is None:
+                    override_id = f"o{next_version(conn, 'route_override_ids')}"
+                conn.execute('''
+                INSERT INTO route_overrides (id, spec, created_at) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET spec = excluded.spec, created_at = excluded.created_at
+                ''', (override_id, json.dumps(override), now))
+                ids.append(override_id)
+            next_version(conn, 'route_overrides')
+        return ids
+
+    def remove(self, override_ids):
+        """Delete overrides by id; returns the ids that existed"""
+        with self.db.writer() as conn:
+            removed = [override_id for override_id in override_ids
+                       if conn.execute('DELETE FROM route_overrides WHERE id = ?', (override_id,)).rowcount]
+            if removed:
+                next_version(conn, 'route_overrides')
+        return removed
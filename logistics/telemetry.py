@@ -0,0 +1,259 @@
+# logistics/telemetry.py
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from models.database import to_ts
+
+logger = logging.getLogger(__name__)
+
+# Field order of a reading row as queued and written
+READING_FIELDS = ('shipment_id', 'temperature', 'humidity', 'timestamp', 'ts')
+
+def is_transient(error):
+    """Whether a failed write may succeed if retried (the database was busy or locked)"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+class LatestReadings:
+    """
+    Newest reading per shipment, held in memory.
+
+    Updated as readings are accepted, before they reach the database, so
+    current conditions are served without touching environmental_readings.
+    The latest_readings table mirrors it across restarts.
+    """
+    def __init__(self, rows=()):
+        self._latest = {}
+        self._lock = threading.Lock()
+        self.update(rows)
+
+    @classmethod
+    def load(cls, db):
+        """Seed from the persisted latest_readings table"""
+        with db.reader() as conn:
+            rows = conn.execute('''
+            SELECT shipment_id, temperature, humidity, timestamp, ts FROM latest_readings
+            ''').fetchall()
+        return cls(rows)
+
+    def update(self, rows):
+        """Keep each row that is newer than the shipment's current reading"""
+        with self._lock:
+            for row in rows:
+                current = self._latest.get(row[0])
+                if current is None or row[4] >= current[4]:
+                    self._latest[row[0]] = tuple(row)
+
+    def get(self, shipment_id):
+        row = self._latest.get(shipment_id)
+        return dict(zip(READING_FIELDS, row)) if row else None
+
+    def get_many(self, shipment_ids):
+        """{shipment_id: reading} for the ids that have a reading"""
+        latest = self._latest
+        return {shipment_id: dict(zip(READING_FIELDS, latest[shipment_id]))
+                for shipment_id in shipment_ids if shipment_id in latest}
+
+    @staticmethod
+    def newest(rows):
+        """The newest row per shipment within a batch"""
+        newest = {}
+        for row in rows:
+            current = newest.get(row[0])
+            if current is None or row[4] >= current[4]:
+                newest[row[0]] = row
+        return list(newest.values())
+
+class TelemetryBuffer:
+    """
+    Write buffer for environmental readings.
+
+    Readings are queued in memory and written by a background thread as one
+    executemany transaction, either once max_batch readings are waiting or
+    max_delay seconds after the oldest one arrived, so a burst of sensor
+    reports costs one commit instead of one per row.
+
+    At most max_pending readings are held; beyond that add() refuses new
+    ones so callers can push back on senders instead of growing memory.
+    A batch whose write fails because the database is busy is put back and
+    retried; any other failure would repeat forever, so that batch is
+    logged and dropped rather than blocking every reading behind it.
+
+    Accepted readings go straight into latest (a LatestReadings), and each
+    flush upserts the batch's newest reading per shipment into the
+    latest_readings table in the same transaction. on_accept callables are
+    called as fn(rows) with every batch of accepted rows, and on_flush
+    callables as fn(conn, rows) inside the flush transaction, to keep
+    derived tables in step with the raw rows.
+    """
+    def __init__(self, db, max_batch=500, max_delay=1.0, max_pending=50000, latest=None,
+                 on_accept=(), on_flush=()):
+        self.db = db
+        self.latest = latest if latest is not None else LatestReadings()
+        self.on_accept = list(on_accept)
+        self.on_flush = list(on_flush)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self._stats = {
+            'accepted': 0,
+            'rejected': 0,
+            'written': 0,
+            'flushes': 0,
+            'failed_flushes': 0,
+            'dropped': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': 0.0,
+            'max_pending_seen': 0
+        }
+
+        self._thread = threading.Thread(target=self._run, name='telemetry-flush', daemon=True)
+        self._thread.start()
+
+    def add(self, shipment_id, temperature, humidity, timestamp=None):
+        """Queue one reading; returns False if the buffer is full"""
+        return self.add_many([(shipment_id, temperature, humidity, timestamp)]) == 1
+
+    def add_many(self, readings):
+        """
+        Queue (shipment_id, temperature, humidity, timestamp) tuples
+
+        A missing timestamp is stamped with the arrival time; epoch seconds
+        are stored as ISO strings like the rest. Returns how many readings
+        were accepted; the rest were refused because the buffer is full.
+        Raises ValueError for a timestamp that is neither.
+        """
+        now = datetime.now().isoformat()
+        rows = []
+        for shipment_id, temperature, humidity, timestamp in readings:
+            timestamp = timestamp or now
+            ts = to_ts(timestamp)
+            if not isinstance(timestamp, str):
+                timestamp = datetime.fromtimestamp(ts / 1000).isoformat()
+            rows.append((shipment_id, temperature, humidity, timestamp, ts))
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Telemetry buffer is closed')
+            accepted = rows[:max(0, self.max_pending - len(self._pending))]
+            # The first reading of a batch arms the flush thread's timer
+            arm = bool(accepted) and not self._pending
+            if arm:
+                self._oldest = time.monotonic()
+            self._pending.extend(accepted)
+
+            self._stats['accepted'] += len(accepted)
+            self._stats['rejected'] += len(rows) - len(accepted)
+            self._stats['max_pending_seen'] = max(self._stats['max_pending_seen'], len(self._pending))
+            full = len(self._pending) >= self.max_batch
+
+        self.latest.update(accepted)
+        for fn in self.on_accept:
+            fn(accepted)
+        if full or arm:
+            self._wakeup.set()
+        return len(accepted)
+
+    def flush(self):
+        """
+        Write everything queued so far; returns the number of rows written
+
+        Raises the error of a write that failed transiently, with the batch
+        queued again.
+        """
+        # One flush at a time keeps batches in arrival order
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                self._oldest = None
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                with self.db.writer() as conn:
+                    conn.executemany('''
+                    INSERT INTO environmental_readings (shipment_id, temperature, humidity, timestamp, ts)
+                    VALUES (?, ?, ?, ?, ?)
+                    ''', rows)
+                    conn.executemany('''
+                    INSERT INTO latest_readings (shipment_id, temperature, humidity, timestamp, ts)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (shipment_id) DO UPDATE SET
+                        temperature = excluded.temperature,
+                        humidity = excluded.humidity,
+                        timestamp = excluded.timestamp,
+                        ts = excluded.ts
+                    WHERE excluded.ts >= latest_readings.ts
+                    ''', LatestReadings.newest(rows))
+                    for fn in self.on_flush:
+                        fn(conn, rows)
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed_flushes'] += 1
+                    if is_transient(e):
+                        # Put the batch back in front so it is retried, not lost
+                        self._pending[:0] = rows
+                        self._oldest = time.monotonic()
+                    else:
+                        self._stats['dropped'] += len(rows)
+                if is_transient(e):
+                    raise
+                logger.exception('Dropped %d environmental readings that could not be written: %r',
+                                 len(rows), rows)
+                return 0
+
+            with self._lock:
+                self._stats['written'] += len(rows)
+                self._stats['flushes'] += 1
+                self._stats['last_batch_size'] = len(rows)
+                self._stats['last_flush_ms'] = (time.perf_counter() - started) * 1000
+            return len(rows)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                oldest = self._oldest
+            timeout = None if oldest is None else max(0.0, oldest + self.max_delay - time.monotonic())
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            with self._lock:
+                due = (len(self._pending) >= self.max_batch or self._closed or
+                       (self._oldest is not None and time.monotonic() - self._oldest >= self.max_delay))
+            if not due:
+                continue
+            try:
+                self.flush()
+            except Exception:
+                # The batch stays queued; back off before the next attempt
+                time.sleep(self.max_delay)
+
+    def stats(self):
+        """Ingest counters plus current backlog, for monitoring backpressure"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+            stats['oldest_pending_s'] = 0.0 if self._oldest is None else time.monotonic() - self._oldest
+        stats['max_pending'] = self.max_pending
+        stats['utilization'] = stats['pending'] / self.max_pending if self.max_pending else 0.0
+        return stats
+
+    def close(self):
+        """Stop the flush thread and write out whatever is still queued"""
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
@@ -1,4 +1,5 @@
 import osmnx as ox
+import preprocessing
 
 # Specify the Indian city
 city_name = "Delhi, India"
@@ -6,10 +7,8 @@ city_name = "Delhi, India"
 # Load the road network for the city
 G = ox.graph_from_place(city_name, network_type="drive")
 
-# Convert the graph edges to a GeoDataFrame
-edges = ox.graph_to_gdfs(G, nodes=False)
+# Write the normalized edge features in chunks instead of dumping every
+# GeoDataFrame column to CSV
+edges = preprocessing.write_feature_store(preprocessing.graph_edge_chunks(G), "data/features/delhi.npz", region="delhi")
 
-# Save the road network data to a CSV file
-edges.to_csv("delhi_road_network.csv")
-
-print("Road network data for Delhi has been saved to 'delhi_road_network.csv'")
\ No newline at end of file
+print(f"{edges} edge features for Delhi have been saved to 'data/features/delhi.npz'")
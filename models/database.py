@@ -1,17 +1,194 @@
 # models/database.py
 import sqlite3
+import json
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from logistics.polyline import encode as polyline_encode
+
+# Applied to every connection. WAL lets readers run alongside the writer;
+# synchronous=NORMAL is durable across application crashes under WAL.
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA busy_timeout = 5000',
+    'PRAGMA cache_size = -16000',    # 16 MB page cache per connection
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA mmap_size = 268435456',  # 256 MB
+)
+
+def to_ts(timestamp):
+    """
+    Sortable integer timestamp (milliseconds since the epoch)
+    
+    Accepts a datetime, an ISO string or epoch seconds; naive values are
+    local time, as written by datetime.now(). Raises ValueError for
+    anything else.
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    elif isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        try:
+            timestamp = datetime.fromtimestamp(timestamp)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f'epoch timestamp out of range: {timestamp}') from e
+    elif not isinstance(timestamp, datetime):
+        raise ValueError(f'unsupported timestamp: {timestamp!r}')
+    return int(timestamp.timestamp() * 1000)
+
+def next_version(conn, name):
+    """
+    Allocate the next value of a change counter (see Migration 7)
+    
+    Call inside a writer() transaction: the counter stays locked until the
+    commit, so versions are unique and ordered across processes.
+    """
+    return conn.execute('''
+    UPDATE change_versions SET version = version + 1 WHERE name = ? RETURNING version
+    ''', (name,)).fetchone()[0]
+
+def current_version(conn, name):
+    """Last committed value of a change counter"""
+    return conn.execute('SELECT version FROM change_versions WHERE name = ?', (name,)).fetchone()[0]
 
 class LogisticsDB:
-    def __init__(self, db_file='data/logistics.db'):
+    """
+    SQLite access with a read/write split.
+    
+    Writes go through one shared connection serialized by a lock, as SQLite
+    allows a single writer at a time. Reads borrow connections from a
+    bounded pool of query-only connections; in WAL mode they see the last
+    committed state and never block behind a write.
+    """
+    def __init__(self, db_file='data/logistics.db', read_pool_size=8):
         self.db_file = db_file
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
-        self.conn = sqlite3.connect(db_file)
+        
+        self._write_conn = self._connect()
+        self._write_conn.execute('PRAGMA journal_mode = WAL')
+        self._write_lock = threading.RLock()
+        self._after_commit = []
+        
+        self._read_pool = queue.LifoQueue(maxsize=read_pool_size)
+        self._read_slots = threading.BoundedSemaphore(read_pool_size)
+        
         self.create_tables()
     
+    def _connect(self, read_only=False):
+        conn = sqlite3.connect(self.db_file, timeout=5, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+    
+    @property
+    def conn(self):
+        """The write connection; prefer writer()/reader() so access is serialized"""
+        return self._write_conn
+    
+    @contextmanager
+    def writer(self):
+        """
+        Exclusive use of the write connection for one transaction
+        
+        The transaction starts with BEGIN IMMEDIATE, taking SQLite's write
+        lock before the first statement, so what the block reads cannot be
+        changed by another process before it writes. Commits when the block
+        exits normally and rolls back on error. Callbacks registered with
+        after_commit() run once the commit has succeeded, still under the
+        write lock, so they observe commits in order.
+        """
+        with self._write_lock:
+            try:
+                if not self._write_conn.in_transaction:
+                    self._write_conn.execute('BEGIN IMMEDIATE')
+                yield self._write_conn
+                self._write_conn.commit()
+            except BaseException:
+                self._write_conn.rollback()
+                self._after_commit.clear()
+                raise
+            callbacks, self._after_commit = self._after_commit, []
+            for fn in callbacks:
+                fn()
+    
+    def after_commit(self, fn):
+        """Call fn() when the current writer() transaction commits (dropped on rollback)"""
+        self._after_commit.append(fn)
+    
+    @contextmanager
+    def reader(self):
+        """A pooled read-only connection; waits only if every one is in use"""
+        self._read_slots.acquire()
+        try:
+            try:
+                conn = self._read_pool.get_nowait()
+            except queue.Empty:
+                conn = self._connect(read_only=True)
+            try:
+                yield conn
+            finally:
+                # End the read transaction so the next borrower sees fresh data
+                conn.rollback()
+                self._read_pool.put(conn)
+        finally:
+            self._read_slots.release()
+    
+    def close(self):
+        """Close all pooled connections"""
+        with self._write_lock:
+            self._write_conn.close()
+        while True:
+            try:
+                self._read_pool.get_nowait().close()
+            except queue.Empty:
+                break
+    
     def create_tables(self):
-        cursor = self.conn.cursor()
+        """Bring the schema up to the latest version"""
+        self.migrate()
+    
+    @property
+    def schema_version(self):
+        return self._write_conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def migrate(self):
+        """
+        Apply pending schema migrations
+        
+        The schema version lives in PRAGMA user_version. Each migration runs
+        in its own transaction together with the version bump, so an
+        interrupted upgrade resumes from the last completed step.
+        """
+        conn = self._write_conn
+        with self._write_lock:
+            current = self.schema_version
+            # Manage transactions explicitly: in its default mode the sqlite3
+            # module runs DDL such as ALTER TABLE outside any transaction
+            isolation_level, conn.isolation_level = conn.isolation_level, None
+            try:
+                for version, migration in enumerate(MIGRATIONS, start=1):
+                    if version <= current:
+                        continue
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        migration(conn.cursor())
+                        conn.execute(f'PRAGMA user_version = {version}')
+                    except BaseException:
+                        conn.execute('ROLLBACK')
+                        raise
+                    conn.execute('COMMIT')
+            finally:
+                conn.isolation_level = isolation_level
+            if current < len(MIGRATIONS):
+                # Refresh planner statistics for the new indexes
+                self._write_conn.execute('PRAGMA optimize')
+    
+    @staticmethod
+    def _create_tables(cursor):
+        """Migration 1: base schema"""
         
         # Cargo items table
         cursor.execute('''
@@ -86,5 +263,193 @@ class LogisticsDB:
             FOREIGN KEY (shipment_id) REFERENCES shipments (id)
         )
         ''')
+    
+    @staticmethod
+    def _add_indexes(cursor):
+        """Migration 2: indexes for hot queries and integer reading timestamps"""
+        # Milliseconds since the epoch; sorts correctly, unlike mixed ISO strings
+        cursor.execute('ALTER TABLE environmental_readings ADD COLUMN ts INTEGER')
+        cursor.execute('''
+        UPDATE environmental_readings
+        SET ts = CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER)
+        WHERE ts IS NULL AND timestamp IS NOT NULL
+        ''')
         
-        self.conn.commit()
\ No newline at end of file
+        # Latest reading per shipment: one index seek, newest entry first
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_readings_shipment_ts
+        ON environmental_readings (shipment_id, ts)
+        ''')
+        
+        # Active shipment list and status counts
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_shipments_status ON shipments (status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cargo_status ON cargo (status)')
+        
+        # Cargo of a shipment (covering) and shipments holding a cargo item
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shipment_items_shipment
+        ON shipment_items (shipment_id, cargo_id)
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shipment_items_cargo
+        ON shipment_items (cargo_id)
+        ''')
+    
+    @staticmethod
+    def _add_latest_readings(cursor):
+        """Migration 3: newest reading per shipment, kept current on ingest"""
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS latest_readings (
+            shipment_id INTEGER PRIMARY KEY,
+            temperature REAL,
+            humidity REAL,
+            timestamp DATETIME,
+            ts INTEGER,
+            FOREIGN KEY (shipment_id) REFERENCES shipments (id)
+        )
+        ''')
+        # With MAX() SQLite takes the other columns from the row holding the max
+        cursor.execute('''
+        INSERT OR REPLACE INTO latest_readings (shipment_id, temperature, humidity, timestamp, ts)
+        SELECT shipment_id, temperature, humidity, timestamp, MAX(ts)
+        FROM environmental_readings
+        WHERE shipment_id IS NOT NULL
+        GROUP BY shipment_id
+        ''')
+    
+    @staticmethod
+    def _add_reading_rollups(cursor):
+        """Migration 4: minute and hour aggregates of environmental readings"""
+        for table in ('reading_rollups_minute', 'reading_rollups_hour'):
+            cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                shipment_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL, -- bucket start, ms since the epoch
+                count INTEGER NOT NULL,
+                temperature_count INTEGER NOT NULL,
+                temperature_min REAL,
+                temperature_max REAL,
+                temperature_sum REAL NOT NULL,
+                humidity_count INTEGER NOT NULL,
+                humidity_min REAL,
+                humidity_max REAL,
+                humidity_sum REAL NOT NULL,
+                excursions INTEGER NOT NULL, -- readings outside the cargo limits
+                PRIMARY KEY (shipment_id, bucket)
+            ) WITHOUT ROWID
+            ''')
+        
+        # Backfill from existing history; comparisons with missing limits are NULL, not excursions
+        cursor.execute('''
+        WITH limits AS (
+            SELECT si.shipment_id,
+                   MAX(c.temperature_min) AS temp_min, MIN(c.temperature_max) AS temp_max,
+                   MAX(c.humidity_min) AS humidity_min, MIN(c.humidity_max) AS humidity_max
+            FROM shipment_items si
+            JOIN cargo c ON c.id = si.cargo_id
+            GROUP BY si.shipment_id
+        )
+        INSERT INTO reading_rollups_minute
+        SELECT r.shipment_id, r.ts - r.ts % 60000, COUNT(*),
+               COUNT(r.temperature), MIN(r.temperature), MAX(r.temperature), TOTAL(r.temperature),
+               COUNT(r.humidity), MIN(r.humidity), MAX(r.humidity), TOTAL(r.humidity),
+               SUM(CASE WHEN r.temperature < l.temp_min OR r.temperature > l.temp_max
+                          OR r.humidity < l.humidity_min OR r.humidity > l.humidity_max
+                        THEN 1 ELSE 0 END)
+        FROM environmental_readings r
+        LEFT JOIN limits l ON l.shipment_id = r.shipment_id
+        WHERE r.shipment_id IS NOT NULL AND r.ts IS NOT NULL
+        GROUP BY r.shipment_id, r.ts - r.ts % 60000
+        ''')
+        cursor.execute('''
+        INSERT INTO reading_rollups_hour
+        SELECT shipment_id, bucket - bucket % 3600000, SUM(count),
+               SUM(temperature_count), MIN(temperature_min), MAX(temperature_max), SUM(temperature_sum),
+               SUM(humidity_count), MIN(humidity_min), MAX(humidity_max), SUM(humidity_sum),
+               SUM(excursions)
+        FROM reading_rollups_minute
+        GROUP BY shipment_id, bucket - bucket % 3600000
+        ''')
+    
+    @staticmethod
+    def _add_constraint_alerts(cursor):
+        """Migration 5: alerts raised by live cargo constraint checks"""
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS constraint_alerts (
+            id INTEGER PRIMARY KEY,
+            shipment_id INTEGER,
+            kind TEXT NOT NULL, -- 'violation' or 'cleared'
+            limits TEXT, -- comma-separated limits broken, e.g. temperature_max
+            temperature REAL,
+            humidity REAL,
+            timestamp DATETIME, -- of the reading
+            ts INTEGER,
+            raised_at DATETIME,
+            FOREIGN KEY (shipment_id) REFERENCES shipments (id)
+        )
+        ''')
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_constraint_alerts_shipment
+        ON constraint_alerts (shipment_id, id)
+        ''')
+    
+    @staticmethod
+    def _add_shipment_versions(cursor):
+        """Migration 6: change versions and encoded route geometry on shipments"""
+        # Set from a global counter on every change, for delta feeds
+        cursor.execute('ALTER TABLE shipments ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_shipments_version ON shipments (version)')
+        
+        # Route geometry as an encoded polyline (see logistics/polyline.py)
+        cursor.execute('ALTER TABLE shipments ADD COLUMN route_polyline TEXT')
+        rows = cursor.execute('SELECT id, route_data FROM shipments WHERE route_data IS NOT NULL').fetchall()
+        for shipment_id, route_data in rows:
+            try:
+                route = json.loads(route_data)
+                coords = route.get('route') if isinstance(route, dict) else route
+                polyline = polyline_encode(coords) if coords else None
+            except (ValueError, TypeError, AttributeError):
+                continue
+            cursor.execute('UPDATE shipments SET route_polyline = ? WHERE id = ?', (polyline, shipment_id))
+    
+    @staticmethod
+    def _add_change_versions(cursor):
+        """Migration 7: change counters shared by every process using the database"""
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''')
+        cursor.execute('''
+        INSERT INTO change_versions (name, version)
+        SELECT 'shipments', COALESCE(MAX(version), 0) FROM shipments
+        ''')
+    
+    @staticmethod
+    def _add_route_overrides(cursor):
+        """Migration 8: live routing overrides, shared by every process"""
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS route_overrides (
+            id TEXT PRIMARY KEY,
+            spec TEXT NOT NULL, -- JSON override without its id
+            created_at DATETIME
+        )
+        ''')
+        # 'route_overrides' is bumped on every change; 'route_override_ids' numbers new overrides
+        cursor.execute('''
+        INSERT INTO change_versions (name, version)
+        VALUES ('route_overrides', 0), ('route_override_ids', 0)
+        ''')
+
+# Schema migrations in order; the schema version is the number applied
+MIGRATIONS = (
+    LogisticsDB._create_tables,
+    LogisticsDB._add_indexes,
+    LogisticsDB._add_latest_readings,
+    LogisticsDB._add_reading_rollups,
+    LogisticsDB._add_constraint_alerts,
+    LogisticsDB._add_shipment_versions,
+    LogisticsDB._add_change_versions,
+    LogisticsDB._add_route_overrides,
+)
\ No newline at end of file
@@ -0,0 +1,330 @@
+# preprocessing.py
+"""
+Road-network preprocessing for the travel-time model.
+
+Replaces the model.py / traffic.ipynb CSV round trip. Edges are streamed
+from cached Overpass responses (OSMnx writes them to cache/) or from an
+OSMnx graph in fixed-size chunks, normalized with vectorized pandas ops and
+written to a per-region NPZ feature store. Only node coordinates and the
+current chunk are held in memory (finished chunks are spilled to disk), so
+large theatres preprocess in bounded memory, and regions run in parallel
+processes.
+
+    python preprocessing.py cache/*.json --out data/features --workers 4
+
+load_training_frame() turns a store back into the table traffic.ipynb
+trains on: u, v, length, maxspeed, travel_time and one-hot highway_* columns.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from routing.graph import haversine
+
+# Speed assumed for edges without a usable maxspeed tag (matches traffic.ipynb)
+DEFAULT_MAXSPEED = 40
+
+MPH_TO_KMH = 1.609344
+
+# Edges per chunk; bounds the memory held for raw tag strings
+CHUNK_SIZE = 100000
+
+# Characters read from an Overpass response per refill
+READ_SIZE = 1 << 20
+
+# Numeric columns of a feature store and their dtypes
+STORE_COLUMNS = (('u', np.int64), ('v', np.int64), ('length', np.float64), ('maxspeed', np.float32),
+                 ('travel_time', np.float64), ('highway', np.int16))
+
+# OSM oneway values, as OSMnx interprets them for drivable networks
+ONEWAY_FORWARD = ('yes', 'true', '1')
+ONEWAY_REVERSE = ('-1', 'reverse')
+
+def _first_tag(values):
+    """Scalar OSM tag values; OSMnx keeps merged tags as lists, use the first"""
+    return pd.Series([v[0] if isinstance(v, list) and v else v for v in values], dtype=object)
+
+def normalize_maxspeed(values):
+    """
+    Speeds in km/h from raw maxspeed tags
+
+    Takes the first number in each tag ("50", "50 km/h", "['40', '60']"),
+    converts "mph" values and falls back to DEFAULT_MAXSPEED for missing,
+    non-numeric ("signals", "none") or non-positive tags.
+    """
+    tags = _first_tag(values).astype(str)
+    speed = pd.to_numeric(tags.str.extract(r'(\d+(?:\.\d+)?)', expand=False), errors='coerce')
+    speed = speed.where(~tags.str.contains('mph', case=False, regex=False), speed * MPH_TO_KMH)
+    speed = speed.where(speed > 0, DEFAULT_MAXSPEED)
+    return speed.to_numpy(dtype=np.float64)
+
+def normalize_highway(values):
+    """Highway categories as plain strings ('unclassified' when untagged)"""
+    return _first_tag(values).fillna('unclassified').astype(str).to_numpy()
+
+def iter_overpass_elements(path, read_size=READ_SIZE):
+    """
+    Yield the elements of an Overpass JSON response one at a time
+
+    The file is read in read_size pieces and each element is decoded with
+    JSONDecoder.raw_decode as soon as it is complete, so the response is
+    never parsed as a whole.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        # Skip to the opening bracket of the elements array
+        buf = ''
+        while True:
+            chunk = f.read(read_size)
+            if not chunk:
+                raise ValueError(f'{path} is not an Overpass response (no elements array)')
+            buf += chunk
+            start = buf.find('"elements"')
+            if start >= 0 and buf.find('[', start) >= 0:
+                buf = buf[buf.find('[', start) + 1:]
+                break
+            buf = buf[-len('"elements"'):]
+
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(read_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield element
+            pos = end
+            if pos > read_size:
+                buf = buf[pos:]
+                pos = 0
+
+def is_overpass_file(path):
+    """Whether a cache file is an Overpass response (OSMnx also caches geocoder results there)"""
+    with open(path, encoding='utf-8') as f:
+        return '"elements"' in f.read(4096)
+
+def _overpass_ways(path):
+    """Yield (node id array, tags) for every way in an Overpass response"""
+    for element in iter_overpass_elements(path):
+        if element.get('type') == 'way':
+            yield np.asarray(element['nodes'], dtype=np.int64), element.get('tags', {})
+
+def _overpass_nodes(path):
+    """Sorted node ids with their coordinates, and the per-node way reference counts"""
+    ids, lats, lons = [], [], []
+    for element in iter_overpass_elements(path):
+        if element.get('type') == 'node':
+            ids.append(element['id'])
+            lats.append(element['lat'])
+            lons.append(element['lon'])
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids)
+    ids, lats, lons = ids[order], np.asarray(lats)[order], np.asarray(lons)[order]
+
+    # Intersections and way ends split ways into edges, as in OSMnx's simplified graph
+    refs = np.zeros(len(ids), dtype=np.int32)
+    for nodes, _ in _overpass_ways(path):
+        idx = np.searchsorted(ids, nodes)
+        idx = idx[(idx < len(ids)) & (ids[np.minimum(idx, len(ids) - 1)] == nodes)]
+        np.add.at(refs, idx, 1)
+        if len(idx):
+            refs[idx[[0, -1]]] += 1
+    return ids, lats, lons, refs
+
+def overpass_edge_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Stream edges of a cached Overpass response as DataFrame chunks
+
+    Three passes over the file: the first keeps node coordinates, the
+    second counts how many ways use each node, the third splits every way
+    at shared nodes and emits an edge per piece (both directions unless
+    oneway). Only the node arrays and one chunk are held in memory.
+    Chunks have raw u, v, length (m), maxspeed and highway columns.
+    """
+    ids, lats, lons, refs = _overpass_nodes(path)
+    columns = {'u': [], 'v': [], 'length': [], 'maxspeed': [], 'highway': []}
+    pending = 0
+
+    def emit(u, v, length, maxspeed, highway):
+        nonlocal pending
+        pending += len(u)
+        columns['u'].append(u)
+        columns['v'].append(v)
+        columns['length'].append(length)
+        columns['maxspeed'].append(np.full(len(u), maxspeed, dtype=object))
+        columns['highway'].append(np.full(len(u), highway, dtype=object))
+
+    for nodes, tags in _overpass_ways(path):
+        idx = np.searchsorted(ids, nodes)
+        if len(nodes) < 2 or (idx >= len(ids)).any() or (ids[idx] != nodes).any():
+            continue  # way leaves the downloaded area
+
+        # Cumulative length along the way, cut at nodes shared with other ways
+        steps = haversine(lats[idx[:-1]], lons[idx[:-1]], lats[idx[1:]], lons[idx[1:]])
+        along = np.concatenate([[0.0], np.cumsum(steps)])
+        cuts = np.flatnonzero(refs[idx] > 1)
+        cuts = np.union1d(cuts, [0, len(nodes) - 1])
+        u, v = nodes[cuts[:-1]], nodes[cuts[1:]]
+        length = np.diff(along[cuts])
+
+        oneway = str(tags.get('oneway', '')).lower()
+        maxspeed, highway = tags.get('maxspeed'), tags.get('highway')
+        if oneway not in ONEWAY_REVERSE:
+            emit(u, v, length, maxspeed, highway)
+        if oneway not in ONEWAY_FORWARD:
+            emit(v[::-1], u[::-1], length[::-1], maxspeed, highway)
+
+        if pending >= chunk_size:
+            yield pd.DataFrame({name: np.concatenate(parts) for name, parts in columns.items()})
+            columns = {name: [] for name in columns}
+            pending = 0
+
+    if pending:
+        yield pd.DataFrame({name: np.concatenate(parts) for name, parts in columns.items()})
+
+def graph_edge_chunks(G, chunk_size=CHUNK_SIZE):
+    """Stream the edges of an OSMnx graph as DataFrame chunks (same columns)"""
+    rows = []
+    for u, v, data in G.edges(data=True):
+        rows.append((u, v, data.get('length', 0.0), data.get('maxspeed'), data.get('highway')))
+        if len(rows) >= chunk_size:
+            yield pd.DataFrame(rows, columns=['u', 'v', 'length', 'maxspeed', 'highway'])
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows, columns=['u', 'v', 'length', 'maxspeed', 'highway'])
+
+def _write_npy(archive, name, array):
+    with archive.open(name + '.npy', 'w', force_zip64=True) as out:
+        np.lib.format.write_array(out, np.asanyarray(array), allow_pickle=False)
+
+def write_feature_store(chunks, path, region=None):
+    """
+    Normalize edge chunks and write them as one NPZ feature store
+
+    Stores u, v, length, maxspeed (km/h), travel_time (the training target,
+    length / maxspeed * 60 as in traffic.ipynb) and highway as integer codes
+    into highway_categories. Each normalized chunk is appended to per-column
+    spill files next to path, which are then streamed into the archive, so
+    only one chunk is in memory at a time. Returns the number of edges written.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    categories = {}
+    edges = 0
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(path) or '.') as spill_dir:
+        spills = {name: open(os.path.join(spill_dir, name), 'wb') for name, _ in STORE_COLUMNS}
+        try:
+            for chunk in chunks:
+                length = pd.to_numeric(chunk['length'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+                maxspeed = normalize_maxspeed(chunk['maxspeed'])
+                highway = normalize_highway(chunk['highway'])
+
+                # Category codes stay stable across chunks
+                labels, codes = np.unique(highway, return_inverse=True)
+                mapping = np.array([categories.setdefault(label, len(categories)) for label in labels],
+                                   dtype=np.int16)
+
+                values = {
+                    'u': chunk['u'].to_numpy(),
+                    'v': chunk['v'].to_numpy(),
+                    'length': length,
+                    'maxspeed': maxspeed,
+                    'travel_time': length / maxspeed * 60,
+                    'highway': mapping[codes]
+                }
+                for name, dtype in STORE_COLUMNS:
+                    np.ascontiguousarray(values[name], dtype=dtype).tofile(spills[name])
+                edges += len(chunk)
+        finally:
+            for spill in spills.values():
+                spill.close()
+
+        tmp_path = path + '.tmp.npz'
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, dtype in STORE_COLUMNS:
+                header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                          'fortran_order': False, 'shape': (edges,)}
+                with archive.open(name + '.npy', 'w', force_zip64=True) as out, \
+                        open(os.path.join(spill_dir, name), 'rb') as spill:
+                    np.lib.format.write_array_header_1_0(out, header)
+                    shutil.copyfileobj(spill, out, READ_SIZE)
+            _write_npy(archive, 'highway_categories', np.array(sorted(categories, key=categories.get), dtype=str))
+            _write_npy(archive, 'region', np.array(region or os.path.splitext(os.path.basename(path))[0]))
+    os.replace(tmp_path, path)
+    return edges
+
+def preprocess_overpass(path, out_path, region=None, chunk_size=CHUNK_SIZE):
+    """Feature store for one cached Overpass response; returns (region, edges)"""
+    region = region or os.path.splitext(os.path.basename(path))[0]
+    return region, write_feature_store(overpass_edge_chunks(path, chunk_size), out_path, region)
+
+def preprocess_regions(sources, out_dir, max_workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Preprocess many regions in parallel
+
+    sources maps region names to Overpass response paths. Each region is
+    processed in its own worker and written to out_dir/<region>.npz.
+    Returns {region: edges written}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(path, os.path.join(out_dir, f'{region}.npz'), region, chunk_size)
+            for region, path in sources.items()]
+    if max_workers == 1 or len(jobs) <= 1:
+        return dict(preprocess_overpass(*job) for job in jobs)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(preprocess_overpass, *job) for job in jobs]
+        return dict(future.result() for future in futures)
+
+def load_training_frame(paths):
+    """
+    Training table from one or more feature stores
+
+    Same columns as processed_delhi_road_network.csv: u, v, length,
+    maxspeed, travel_time and highway_* dummies (drop_first, as in
+    traffic.ipynb), with categories merged across the stores.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    frames = []
+    for path in paths:
+        with np.load(path) as store:
+            frames.append(pd.DataFrame({
+                'u': store['u'],
+                'v': store['v'],
+                'length': store['length'],
+                'maxspeed': store['maxspeed'].astype(np.float64),
+                'travel_time': store['travel_time'],
+                'highway': pd.Categorical.from_codes(store['highway'], store['highway_categories'].tolist())
+            }))
+    data = pd.concat(frames, ignore_index=True)
+    data['highway'] = data['highway'].astype(str)
+    return pd.get_dummies(data, columns=['highway'], drop_first=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Build edge feature stores from cached Overpass responses')
+    parser.add_argument('paths', nargs='+', help='Overpass response files (other cache files are skipped)')
+    parser.add_argument('--out', default='data/features', help='directory for <region>.npz stores')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    sources = {os.path.splitext(os.path.basename(path))[0]: path
+               for path in args.paths if is_overpass_file(path)}
+    for region, edges in preprocess_regions(sources, args.out, args.workers).items():
+        print(f"{region}: {edges} edges -> {os.path.join(args.out, region + '.npz')}")
+
+if __name__ == '__main__':
+    main()
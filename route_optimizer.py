@@ -5,85 +5,1076 @@ import pandas as pd
 from flask import Flask, render_template
 import branca.colormap as cm
 from datetime import datetime
+from collections import OrderedDict
+import json
 import plotly.graph_objects as go
 import numpy as np
+import hashlib
+import itertools
+import threading
+import time
+from routing import snapshot
+from routing.batch import BatchPool
+from routing.contraction import HierarchyBuilder
+from routing.graph import RoutingGraph
+from routing.graph import haversine
+from routing.overrides import EdgeOverrides, node_pair_edges, override_value, polygon_edges
+from routing.registry import DEFAULT_MEMORY_BUDGET, GraphRegistry
+from routing.search import min_cost_per_meter, run_search
+from routing.spatial_index import SpatialIndex
+# Tag normalization shared with the training pipeline; DEFAULT_MAXSPEED is
+# the speed assumed for edges without a usable maxspeed tag
+from preprocessing import DEFAULT_MAXSPEED, normalize_highway, normalize_maxspeed
+
+# The model is trained on traffic.ipynb's travel_time = length (m) / maxspeed
+# (km/h) * 60, which is in thousandths of a minute
+MODEL_TIME_TO_MINUTES = 1 / 1000
+
+# Segments whose predicted time is this far over free flow count as danger zones
+DANGER_SEGMENT_RISK = 0.5
+
+# Rough per-edge footprint of an OSMnx graph (attribute dicts, geometry),
+# used to estimate memory when the NetworkX graph is loaded
+NX_EDGE_BYTES = 2048
+
+# Request-time features the model may have been trained with
+TIME_FEATURES = ('time_of_day', 'day_of_week')
+
+# Shortest-path backends: NetworkX over self.graph, or the array engine
+# over the compact CSR routing graph
+ROUTING_ENGINES = ('networkx', 'csr')
+
+# Search strategies: plain shortest path, or goal-directed A* with a
+# great-circle heuristic (bidirectional on the CSR engine)
+ROUTING_ALGORITHMS = ('dijkstra', 'astar')
+
+risk_factors = {
+    'low': 1.5,    # Safer routes
+    'medium': 1.0,  # Balanced
+    'high': 0.7     # Faster but riskier
+}
+
+class EdgeWeightCache:
+    """
+    LRU cache of precomputed edge weight arrays.
+    
+    Keys are (graph version, model hash, hour bucket, weekday, risk tolerance);
+    the backend also uses one for per-route segment arrays. Cached arrays
+    are read-only so concurrent requests can share them, and concurrent
+    misses on the same key wait for a single computation.
+    """
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def get_or_compute(self, key, compute):
+        """Return the weights cached under key, computing them on a miss"""
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another request is already scoring this key
+            pending.wait()
+        
+        try:
+            weights = np.asarray(compute())
+            self.put(key, weights)
+            return weights
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+    
+    def put(self, key, weights):
+        """Seed the cache with precomputed weights"""
+        weights = np.asarray(weights)
+        weights.setflags(write=False)
+        with self._lock:
+            self._entries[key] = weights
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def get(self, key):
+        """Cached weights for key, or None; does not count as a hit or miss"""
+        with self._lock:
+            return self._entries.get(key)
+    
+    def discard(self, predicate):
+        """Drop entries whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+    
+    def items(self):
+        """Cached (key, weights) pairs, least recently used first"""
+        with self._lock:
+            return list(self._entries.items())
+    
+    def clear(self):
+        """Drop all cached weights"""
+        with self._lock:
+            self._entries.clear()
+    
+    @property
+    def nbytes(self):
+        """Memory held by the cached arrays"""
+        with self._lock:
+            return sum(array.nbytes for array in self._entries.values())
+    
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries
+            }
+
+class RouteCache:
+    """
+    Bounded cache of computed routes with a time-to-live.
+    
+    Keys are (weight key, start node, end node), so a route is reused only
+    under the exact weight set it was searched on; entries also expire
+    after ttl seconds and the least recently used go first when full.
+    Values are (route_coords, route nodes) pairs, shared read-only.
+    """
+    def __init__(self, max_entries=4096, ttl=900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Cached route for key, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, route, expires=None):
+        with self._lock:
+            self._entries[key] = (expires or time.monotonic() + self.ttl, route)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def items(self):
+        """Live (key, route, expiry) entries, least recently used first"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, route, expires) for key, (expires, route) in self._entries.items()
+                    if expires > now]
+    
+    def discard(self, predicate):
+        """Drop entries whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    @property
+    def nbytes(self):
+        """Rough size: 16 bytes per stored coordinate"""
+        with self._lock:
+            return sum(16 * len(route[0] or ()) for _, route in self._entries.values())
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
 
 class RouteOptimizerBackend:
-    def __init__(self):
+    def __init__(self, hour_bucket_size=1, weight_cache_size=32, engine='networkx',
+                 algorithm='dijkstra', contraction_hierarchies=False, segment_cache_size=1024,
+                 route_cache_size=4096, route_cache_ttl=900):
+        if engine not in ROUTING_ENGINES:
+            raise ValueError(f"Unknown routing engine: {engine}")
+        if algorithm not in ROUTING_ALGORITHMS:
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+        self.engine = engine
+        self.algorithm = algorithm
         self.graph = None
+        self.routing_graph = None
+        self.spatial_index = None
         self.model = None
         self.feature_columns = None
+        self.edge_keys = None
+        self.edge_index = None
+        self.edge_features = None
+        self.graph_version = 0
+        self._graph_digest = None
+        self.model_hash = None
+        self.hour_bucket_size = hour_bucket_size
+        self.weight_cache = EdgeWeightCache(weight_cache_size)
+        self.heuristic_scales = {}
+        self.segment_cache = EdgeWeightCache(segment_cache_size)
+        self.route_cache = RouteCache(route_cache_size, route_cache_ttl)
+        # Live closures/slowdowns/risk areas over the model weights, and the
+        # adjusted weight arrays per (weight key, overrides version)
+        self.overrides = None
+        self.applied_overrides = {}
+        self.overrides_synced = None
+        self.override_cache = EdgeWeightCache(weight_cache_size)
+        self._overrides_lock = threading.RLock()
+        # Optional background-built contraction hierarchies for the CSR engine
+        self.hierarchies = HierarchyBuilder() if contraction_hierarchies else None
+        # Worker processes for predict_routes, forked once per routing graph
+        self.batch_pool = None
+        self._batch_lock = threading.Lock()
         
     def load_model(self, model_path):
         """Load trained ML model"""
         import pickle
         with open(model_path, 'rb') as f:
-            self.model = pickle.load(f)
+            model_bytes = f.read()
+        self.model = pickle.loads(model_bytes)
+        self.model_hash = hashlib.sha1(model_bytes).hexdigest()
+        self.feature_columns = self._model_feature_columns()
+        if self.graph is not None:
+            self.build_edge_features()
+        elif self.edge_features is not None:
+            self._align_edge_features()
         
     def load_graph(self, location):
         """Load road network graph"""
-        self.graph = ox.graph_from_place(location, network_type='drive')
+        self.set_graph(ox.graph_from_place(location, network_type='drive'))
+    
+    def set_graph(self, graph):
+        """Use an OSMnx graph for routing and build its compact CSR form"""
+        self.graph = graph
+        self.routing_graph = RoutingGraph.from_networkx(graph)
+        self.spatial_index = SpatialIndex(self.routing_graph.node_lat, self.routing_graph.node_lon)
+        self._reset_overrides()
+        self.build_edge_features()
+    
+    def save_snapshot(self, path):
+        """
+        Persist the routing graph, edge features and cached weights.
         
+        Only weights scored against the current graph and model are kept.
+        """
+        weights = {key[2:]: array for key, array in self.weight_cache.items()
+                   if key[:2] == (self.graph_version, self.model_hash)}
+        snapshot.save_snapshot(path, self.routing_graph, self.edge_features.to_numpy(),
+                               self.feature_columns, self.model_hash, weights,
+                               spatial_index=self.spatial_index)
+    
+    def load_snapshot(self, path):
+        """
+        Load a graph snapshot instead of downloading and rebuilding the graph.
+        
+        Arrays are memory-mapped, so this takes well under a second and
+        routing switches to the CSR engine, as the OSMnx graph is not loaded.
+        """
+        routing_graph, features, manifest, weights, spatial_index = snapshot.load_snapshot(path)
+        self.graph = None
+        self.edge_keys = None
+        self.edge_index = None
+        self.routing_graph = routing_graph
+        self.spatial_index = spatial_index or SpatialIndex(routing_graph.node_lat, routing_graph.node_lon)
+        self._reset_overrides()
+        self.edge_features = pd.DataFrame(features, columns=manifest['feature_columns'], copy=False)
+        self.graph_version += 1
+        self.engine = 'csr'
+        self._align_edge_features()
+        
+        # Precomputed weights are only valid for the model that scored them
+        if self.model is not None and manifest['model_hash'] == self.model_hash:
+            for key, array in weights.items():
+                self.weight_cache.put((self.graph_version, self.model_hash) + key, array)
+    
+    def share_model(self, other):
+        """Score with another backend's loaded model instead of loading a copy"""
+        self.model = other.model
+        self.model_hash = other.model_hash
+        self.feature_columns = other.feature_columns
+        if self.graph is not None:
+            self.build_edge_features()
+        elif self.edge_features is not None:
+            self._align_edge_features()
+    
+    def memory_bytes(self):
+        """
+        Estimated memory held for this graph
+        
+        Counts the CSR arrays, edge features, spatial index, cached weights
+        and segments and built hierarchies; the OSMnx graph, when loaded,
+        is estimated from its edge count.
+        """
+        total = (self.weight_cache.nbytes + self.segment_cache.nbytes + self.override_cache.nbytes
+                 + self.route_cache.nbytes)
+        if self.overrides is not None:
+            total += self.overrides.nbytes
+        if self.routing_graph is not None:
+            total += self.routing_graph.nbytes
+        if self.edge_features is not None:
+            total += self.edge_features.memory_usage(index=False).sum()
+        if self.spatial_index is not None:
+            total += sum(array.nbytes for array in self.spatial_index.tree.get_arrays())
+        if self.graph is not None:
+            total += self.graph.number_of_edges() * NX_EDGE_BYTES
+        if self.hierarchies is not None:
+            total += self.hierarchies.nbytes
+        return int(total)
+    
+    def close(self):
+        """Stop background hierarchy builds and batch workers"""
+        if self.hierarchies is not None:
+            self.hierarchies.shutdown()
+        with self._batch_lock:
+            if self.batch_pool is not None:
+                self.batch_pool.shutdown()
+    
+    def _align_edge_features(self):
+        """Match edge feature columns to the ones the model was fitted with"""
+        if self.feature_columns is None:
+            self.feature_columns = list(self.edge_features.columns)
+        elif list(self.edge_features.columns) != self.feature_columns:
+            self.edge_features = self.edge_features.reindex(
+                columns=self.feature_columns, fill_value=0).astype(np.float32)
+    
+    def _model_feature_columns(self):
+        """Feature names the model was fitted with, if it recorded them"""
+        names = getattr(self.model, 'feature_names_in_', None)
+        if names is None and hasattr(self.model, 'get_booster'):
+            names = self.model.get_booster().feature_names
+        return list(names) if names is not None else None
+    
+    def build_edge_features(self):
+        """
+        Build the edge feature matrix once per graph.
+        
+        Columns follow preprocessing.load_training_frame (traffic.ipynb):
+        length, maxspeed and one-hot highway_* columns. Row i describes
+        edge self.edge_keys[i].
+        """
+        edges = list(self.graph.edges(keys=True, data=True))
+        self.edge_keys = [(u, v, k) for u, v, k, _ in edges]
+        self.edge_index = {key: i for i, key in enumerate(self.edge_keys)}
+        
+        # Same normalization as preprocessing.py, so serving features match training
+        data = pd.DataFrame({
+            'length': [d.get('length', 0) for _, _, _, d in edges],
+            'maxspeed': normalize_maxspeed([d.get('maxspeed') for _, _, _, d in edges]),
+            'highway': normalize_highway([d.get('highway') for _, _, _, d in edges]),
+        })
+        data = pd.get_dummies(data, columns=['highway'], drop_first=True)
+        
+        if self.feature_columns is None:
+            self.feature_columns = list(data.columns)
+        
+        self.edge_features = data.reindex(columns=self.feature_columns, fill_value=0).astype(np.float32)
+        
+        # Weights scored against the previous graph are no longer valid
+        self.graph_version += 1
+    
+    def compute_edge_weights(self, time_of_day, day_of_week, risk_tolerance='medium'):
+        """Score every edge in one batched predict call, aligned with self.edge_keys"""
+        if self.edge_features is None:
+            self.build_edge_features()
+        
+        features = self.edge_features
+        request_features = {'time_of_day': time_of_day, 'day_of_week': day_of_week}
+        time_columns = [col for col in TIME_FEATURES if col in features.columns]
+        if time_columns:
+            features = features.copy()
+            for col in time_columns:
+                features[col] = request_features[col]
+        
+        predicted = np.asarray(self.model.predict(features), dtype=np.float64)
+        
+        # Adjust for risk tolerance: low prefers safer routes even if longer,
+        # high is willing to take more risks for faster routes
+        return predicted * risk_factors.get(risk_tolerance, 1.0)
+    
+    def weight_key(self, time_of_day, day_of_week, risk_tolerance='medium'):
+        """
+        Weight cache key for a request: graph, model, hour bucket, weekday,
+        risk and overrides version (0 while no override is active)
+        """
+        hour_bucket = int(time_of_day) // self.hour_bucket_size
+        return (self.graph_version, self.model_hash, hour_bucket, int(day_of_week), risk_tolerance,
+                self._overrides_version())
+    
+    def stored_weight_key(self, time_of_day, day_of_week, risk_tolerance='medium'):
+        """
+        weight_key for keys kept outside this process: the graph version and
+        overrides version (per-process counters) are replaced by content
+        digests of the graph and of the active overrides
+        """
+        key = self.weight_key(time_of_day, day_of_week, risk_tolerance)
+        overrides_digest = self.overrides.digest() if key[5] else None
+        return (self.graph_digest(),) + key[1:5] + (overrides_digest,)
+    
+    def graph_digest(self):
+        """Content hash of the routing graph and edge features, computed once per graph"""
+        if self.edge_features is None:
+            self.build_edge_features()
+        cached = self._graph_digest
+        if cached is None or cached[0] != self.graph_version:
+            rg = self.routing_graph
+            h = hashlib.sha1()
+            for array in (rg.node_ids, rg.edge_tail, rg.edge_head, rg.edge_key, rg.edge_length,
+                          self.edge_features.to_numpy(dtype=np.float32)):
+                h.update(np.ascontiguousarray(array).tobytes())
+            h.update(json.dumps(list(self.edge_features.columns)).encode())
+            cached = self._graph_digest = (self.graph_version, h.hexdigest())
+        return cached[1]
+    
+    def _overrides_version(self):
+        overrides = self.overrides
+        return overrides.version if overrides is not None and overrides.active else 0
+    
+    def get_edge_weights(self, time_of_day, day_of_week, risk_tolerance='medium'):
+        """Edge weights for the request's hour bucket, served from the weight cache"""
+        if self.edge_features is None:
+            self.build_edge_features()
+        
+        key = self.weight_key(time_of_day, day_of_week, risk_tolerance)
+        base = self._base_weights(key)
+        if key[5] == 0:
+            return base
+        risk_factor = risk_factors.get(risk_tolerance, 1.0)
+        return self.override_cache.get_or_compute(key, lambda: self.overrides.weights(base, risk_factor))
+    
+    def _base_weights(self, key):
+        """Model-scored weights for a weight key, before overrides"""
+        hour_bucket, day_of_week, risk_tolerance = key[2:5]
+        # Score at the start of the bucket so every request in it shares weights
+        return self.weight_cache.get_or_compute(key[:5], lambda: self.compute_edge_weights(
+            hour_bucket * self.hour_bucket_size, day_of_week, risk_tolerance))
+    
+    def heuristic_scale(self, key):
+        """
+        Minimum weight per great-circle meter for a weight set, used by A*
+        
+        Taken over the model-scored weights; overrides only raise weights,
+        so the scale stays admissible for every overrides version.
+        """
+        scale = self.heuristic_scales.get(key[:5])
+        if scale is None:
+            scale = min_cost_per_meter(self.routing_graph, self._base_weights(key))
+            # Scales for an older graph can never be requested again
+            self.heuristic_scales = {k: v for k, v in self.heuristic_scales.items()
+                                     if k[0] == self.graph_version}
+            self.heuristic_scales[key[:5]] = scale
+        return scale
+    
+    def _reset_overrides(self):
+        """Edge ids change with the graph, so overrides start over"""
+        with self._overrides_lock:
+            self.overrides = EdgeOverrides(self.routing_graph.num_edges)
+            self.applied_overrides = {}
+            self.overrides_synced = None
+            self.override_cache.clear()
+            self.route_cache.clear()
+            if self.hierarchies is not None:
+                self.hierarchies.discard(lambda key: True)
+    
+    def override_edges(self, override):
+        """Edge ids an override covers: its 'edges' node pairs and/or its 'polygon' area"""
+        rg = self.routing_graph
+        parts = [np.empty(0, dtype=np.int64)]
+        if override.get('edges'):
+            parts.append(node_pair_edges(rg, override['edges']))
+        if override.get('polygon'):
+            parts.append(polygon_edges(rg, override['polygon']))
+        return np.unique(np.concatenate(parts))
+    
+    def apply_overrides(self, overrides):
+        """
+        Apply a batch of live edge overrides; returns their ids
+        
+        Each override is a dict with 'kind' ('closure', 'slowdown' or 'risk'),
+        the edges it covers as 'edges' ([u, v] or [u, v, key] OSM node ids)
+        and/or an area 'polygon' ([lat, lon] vertices), 'factor' for a
+        slowdown, 'penalty' for a risk area and optionally an 'id' (re-using
+        one replaces that override). The whole batch is checked before any
+        of it is applied.
+        
+        Cached weights are patched at the changed edges only and cached
+        segments and hierarchies are dropped only where they depend on
+        them, so absorbing a closure takes milliseconds, not a re-score.
+        """
+        resolved = [(override, self.override_edges(override), override_value(override))
+                    for override in overrides]
+        
+        with self._overrides_lock:
+            old_version = self._overrides_version()
+            # Unless an override is replaced, weights only go up
+            raised = not any(override.get('id') in self.applied_overrides for override, _, _ in resolved)
+            ids, changed = [], []
+            for override, edges, value in resolved:
+                override_id, touched = self.overrides.add(override['kind'], edges, value, override.get('id'))
+                self.applied_overrides[override_id] = override
+                ids.append(override_id)
+                changed.append(touched)
+            if changed:
+                self._absorb_overrides(old_version, np.unique(np.concatenate(changed)), raised)
+        return ids
+    
+    def remove_overrides(self, override_ids):
+        """Lift overrides by id; returns the number of edges affected"""
+        with self._overrides_lock:
+            old_version = self._overrides_version()
+            changed = self.overrides.remove(override_ids)
+            for override_id in override_ids:
+                self.applied_overrides.pop(override_id, None)
+            if len(changed):
+                self._absorb_overrides(old_version, changed, raised=False)
+        return len(changed)
+    
+    def sync_overrides(self, overrides, version):
+        """
+        Match the applied overrides to overrides ({id: override}) as of version
+        
+        Used to share one set of overrides across region graphs, including
+        ones loaded after the overrides were set; versions must increase.
+        """
+        with self._overrides_lock:
+            if self.overrides_synced is not None and version <= self.overrides_synced:
+                return
+            stale = [i for i in self.applied_overrides if i not in overrides]
+            if stale:
+                self.remove_overrides(stale)
+            pending = [dict(override, id=override_id) for override_id, override in overrides.items()
+                       if self.applied_overrides.get(override_id) != dict(override, id=override_id)]
+            if pending:
+                self.apply_overrides(pending)
+            self.overrides_synced = version
+    
+    def _absorb_overrides(self, old_version, changed, raised):
+        """
+        Carry caches over to the new overrides version, redoing only changed edges
+        
+        raised says weights only went up; a cached route clear of the changed
+        edges is then still a shortest path and is kept.
+        """
+        version = self._overrides_version()
+        current = (self.graph_version, self.model_hash)
+        
+        if version:
+            # Patch the hot weight arrays: copy and recompute the changed edges
+            if old_version:
+                sources = [(key[:5], weights) for key, weights in self.override_cache.items()
+                           if key[5] == old_version]
+            else:
+                sources = self.weight_cache.items()
+            for base_key, weights in sources:
+                base = self.weight_cache.get(base_key)
+                if base is None or base_key[:2] != current:
+                    continue
+                patched = np.array(weights, dtype=np.float64)
+                patched[changed] = self.overrides.weights(base, risk_factors.get(base_key[4], 1.0), changed)
+                self.override_cache.put(base_key + (version,), patched)
+        self.override_cache.discard(lambda key: key[5] != version)
+        
+        # Hierarchies were built on old adjusted weights; base ones stay valid
+        if self.hierarchies is not None:
+            self.hierarchies.discard(lambda key: key[5] not in (0, version))
+        
+        # Segments of routes clear of the changed edges are still right
+        rg = self.routing_graph
+        changed_pairs = set(zip(rg.node_ids[rg.edge_tail[changed]].tolist(),
+                                rg.node_ids[rg.edge_head[changed]].tolist()))
+        for (key, route_nodes), segments in self.segment_cache.items():
+            if key[5] != old_version or old_version == version:
+                continue
+            if not changed_pairs.intersection(zip(route_nodes[:-1], route_nodes[1:])):
+                self.segment_cache.put((key[:5] + (version,), route_nodes), segments)
+        self.segment_cache.discard(lambda entry: entry[0][5] not in (0, version))
+        
+        if raised:
+            for (key, start_node, end_node), route, expires in self.route_cache.items():
+                route_nodes = route[1]
+                if key[5] != old_version or old_version == version:
+                    continue
+                if route_nodes and not changed_pairs.intersection(zip(route_nodes[:-1], route_nodes[1:])):
+                    self.route_cache.put((key[:5] + (version,), start_node, end_node), route, expires)
+        self.route_cache.discard(lambda key: key[0][5] not in (0, version))
+    
+    def routes_crossing(self, routes, edges):
+        """
+        For each route, a list of (lat, lon) points, whether it runs along any
+        of the given edge ids (passes both of an edge's end nodes)
+        """
+        rg = self.routing_graph
+        edges = np.asarray(edges, dtype=np.int64)
+        tails = _grid_points(rg.node_lat[rg.edge_tail[edges]], rg.node_lon[rg.edge_tail[edges]])
+        heads = _grid_points(rg.node_lat[rg.edge_head[edges]], rg.node_lon[rg.edge_head[edges]])
+        crossing = []
+        for route in routes:
+            if not route or not len(edges):
+                crossing.append(False)
+                continue
+            lats, lons = zip(*route)
+            points = set(_grid_points(lats, lons))
+            crossing.append(any(t in points and h in points for t, h in zip(tails, heads)))
+        return crossing
+    
     def predict_route(self, start_point, end_point, time_of_day, day_of_week, 
-                      mission_priority='standard', risk_tolerance='medium'):
-        """Generate optimal route based on model predictions and mission parameters"""
+                      mission_priority='standard', risk_tolerance='medium', engine=None,
+                      algorithm=None):
+        """
+        Generate optimal route based on model predictions and mission parameters
+        
+        engine and algorithm override the backend defaults for this request;
+        algorithm='astar' expands far fewer nodes on long routes and returns
+        a route of the same cost as 'dijkstra'.
+        """
+        engine = engine or self.engine
+        algorithm = algorithm or self.algorithm
+        if engine not in ROUTING_ENGINES:
+            raise ValueError(f"Unknown routing engine: {engine}")
+        if algorithm not in ROUTING_ALGORITHMS:
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+        
+        if engine == 'networkx' and self.graph is None:
+            raise ValueError("The networkx engine needs the OSMnx graph; use engine='csr' with a snapshot")
+        
         # Convert coordinates to graph nodes
-        start_node = ox.distance.nearest_nodes(self.graph, start_point[1], start_point[0])
-        end_node = ox.distance.nearest_nodes(self.graph, end_point[1], end_point[0])
+        start_node, end_node = self.snap_points([start_point, end_point])
         
-        # Create temporary graph with ML-predicted weights
-        G_temp = self.graph.copy()
+        # Repeat requests under the same weights are answered without a search
+        key = self.weight_key(time_of_day, day_of_week, risk_tolerance)
+        route_key = (key, start_node, end_node)
+        route = self.route_cache.get(route_key)
+        if route is None:
+            route = self._search_route(start_node, end_node, time_of_day, day_of_week,
+                                       risk_tolerance, engine, algorithm)
+            self.route_cache.put(route_key, route)
+        return route
+    
+    def _search_route(self, start_node, end_node, time_of_day, day_of_week, risk_tolerance,
+                      engine, algorithm):
+        """(route_coords, route) for snapped endpoints, by a fresh search"""
+        # Look up ML-predicted weights by edge id instead of writing them
+        # into a copy of the graph, so the base graph stays shared and read-only
+        key = self.weight_key(time_of_day, day_of_week, risk_tolerance)
+        weights = self.get_edge_weights(time_of_day, day_of_week, risk_tolerance)
+        cost_per_meter = self.heuristic_scale(key) if algorithm == 'astar' else 0.0
+        if engine == 'csr':
+            return self._predict_route_csr(start_node, end_node, weights, cost_per_meter, key)
         
-        # Apply weights based on ML predictions
-        for u, v, k, data in G_temp.edges(data=True, keys=True):
-            # Extract features
-            features = self.extract_edge_features(G_temp, u, v, k, time_of_day, day_of_week)
-            
-            # Adjust for mission priority and risk tolerance
-            risk_factor = 1.0
-            if risk_tolerance == 'low':
-                risk_factor = 1.5  # Prefer safer routes even if longer
-            elif risk_tolerance == 'high':
-                risk_factor = 0.7  # Willing to take more risks for faster routes
-                
-            # Predict travel time
-            pred_time = self.model.predict([features])[0] * risk_factor
-            
-            # Set edge weight
-            G_temp[u][v][k]['weight'] = pred_time
+        weight = self.edge_weight_function(weights)
         
         # Find shortest path
         try:
-            route = nx.shortest_path(G_temp, start_node, end_node, weight='weight')
+            if algorithm == 'astar':
+                route = nx.astar_path(self.graph, start_node, end_node,
+                                      heuristic=self._astar_heuristic(cost_per_meter), weight=weight)
+            else:
+                route = nx.shortest_path(self.graph, start_node, end_node, weight=weight)
             route_edges = list(zip(route[:-1], route[1:]))
             
             # Extract route coordinates for mapping
             route_coords = []
             for u, v in route_edges:
+                # Use the parallel edge the search actually took
+                edge_data = self.graph[u][v]
+                k = min(edge_data, key=lambda k: weights[self.edge_index[(u, v, k)]])
+                
                 # Get coordinates for this edge
-                coords = G_temp.edges[u, v, 0].get('geometry', None)
+                coords = edge_data[k].get('geometry', None)
                 if coords:
                     # If we have LineString geometry
                     for coord in coords.coords:
                         route_coords.append((coord[1], coord[0]))  # Folium expects (lat, lon)
                 else:
                     # If we don't have geometry, use node coordinates
-                    route_coords.append((G_temp.nodes[u]['y'], G_temp.nodes[u]['x']))
-                    route_coords.append((G_temp.nodes[v]['y'], G_temp.nodes[v]['x']))
+                    route_coords.append((self.graph.nodes[u]['y'], self.graph.nodes[u]['x']))
+                    route_coords.append((self.graph.nodes[v]['y'], self.graph.nodes[v]['x']))
             
             return route_coords, route
         except:
             return None, None
+    
+    def predict_routes(self, requests, algorithm=None, max_workers=None):
+        """
+        Route many requests at once over the CSR routing graph
+        
+        requests is a list of dicts with start_point, end_point, time_of_day,
+        day_of_week and optionally risk_tolerance. All endpoints are snapped in
+        one index query, requests in the same weight bucket share one weight
+        array (and hierarchy, if ready), and the searches are fanned out over
+        a process pool. Routes found in the route cache are not searched again.
+        Returns (route_coords, route) pairs as predict_route does.
+        """
+        algorithm = algorithm or self.algorithm
+        if algorithm not in ROUTING_ALGORITHMS:
+            raise ValueError(f"Unknown routing algorithm: {algorithm}")
+        if not requests:
+            return []
+        
+        rg = self.routing_graph
+        points = [point for r in requests for point in (r['start_point'], r['end_point'])]
+        nodes = self._snap_indices(points)
+        
+        routes = [None] * len(requests)
+        weight_sets, scales, hierarchies = {}, {}, {}
+        jobs, route_keys = [], []
+        for i, r in enumerate(requests):
+            risk_tolerance = r.get('risk_tolerance', 'medium')
+            key = self.weight_key(r['time_of_day'], r['day_of_week'], risk_tolerance)
+            route_key = (key, int(rg.node_ids[nodes[2 * i]]), int(rg.node_ids[nodes[2 * i + 1]]))
+            routes[i] = self.route_cache.get(route_key)
+            if routes[i] is not None:
+                continue
+            if key not in weight_sets:
+                weights = self.get_edge_weights(r['time_of_day'], r['day_of_week'], risk_tolerance)
+                weight_sets[key] = weights
+                scales[key] = self.heuristic_scale(key) if algorithm == 'astar' else 0.0
+                if self.hierarchies is not None:
+                    hierarchy = self.hierarchies.get(key, rg, weights)
+                    if hierarchy is not None:
+                        hierarchies[key] = hierarchy
+            jobs.append((key, nodes[2 * i], nodes[2 * i + 1], scales[key]))
+            route_keys.append((i, route_key))
+        
+        results = self._batch_pool(rg).run(jobs, weight_sets, hierarchies, max_workers) if jobs else []
+        for (i, route_key), job, result in zip(route_keys, jobs, results):
+            routes[i] = self._route_output(job[1], result)
+            self.route_cache.put(route_key, routes[i])
+        return routes
+    
+    def _batch_pool(self, routing_graph):
+        """Batch pool over routing_graph; workers forked from a previous graph are retired"""
+        with self._batch_lock:
+            pool = self.batch_pool
+            if pool is None or pool.routing_graph is not routing_graph:
+                if pool is not None:
+                    pool.shutdown()
+                pool = self.batch_pool = BatchPool(routing_graph)
+            return pool
+    
+    def route_segments(self, route_nodes, time_of_day, day_of_week, risk_tolerance='medium'):
+        """
+        Per-edge metrics along a route, computed in one vectorized pass
+        
+        Returns a read-only 3 x n array: distance (m), predicted time (min) and
+        risk in [0, 1] for each of the route's n edges. Risk is how far the
+        model's predicted time exceeds free flow at the posted speed. Arrays
+        are cached per weight bucket and route, so known routes are not redone.
+        """
+        weight_key = self.weight_key(time_of_day, day_of_week, risk_tolerance)
+        key = (weight_key, tuple(route_nodes))
+        weights = self.get_edge_weights(time_of_day, day_of_week, risk_tolerance)
+        return self.segment_cache.get_or_compute(
+            key, lambda: self._compute_segments(route_nodes, weights, risk_tolerance, weight_key))
+    
+    def _compute_segments(self, route_nodes, weights, risk_tolerance, weight_key):
+        rg = self.routing_graph
+        edges = rg.path_edges(rg.node_indices(route_nodes), weights)
+        
+        length = rg.edge_length[edges].astype(np.float64)
+        predicted = np.asarray(self._base_weights(weight_key))[edges] / risk_factors.get(risk_tolerance, 1.0)
+        area_risk = None
+        if weight_key[5]:
+            # Slowdowns add to the time; risk areas count as risk, not time
+            predicted = predicted * self.overrides.slowdown[edges]
+            area_risk = np.clip(self.overrides.penalty[edges], 0.0, 1.0)
+        
+        if 'maxspeed' in self.edge_features.columns:
+            maxspeed = self.edge_features['maxspeed'].to_numpy(dtype=np.float64)[edges]
+        else:
+            maxspeed = np.full(len(edges), np.nan)
+        maxspeed = np.where(np.isnan(maxspeed) | (maxspeed <= 0), DEFAULT_MAXSPEED, maxspeed)
+        # Free-flow time in the model's units, as in the training target
+        free_flow = length / maxspeed * 60
+        delay = np.divide(predicted, free_flow, out=np.ones_like(predicted), where=free_flow > 0)
+        risk = np.clip(delay - 1.0, 0.0, 1.0)
+        if area_risk is not None:
+            risk = np.maximum(risk, area_risk)
+        
+        return np.vstack([length, predicted * MODEL_TIME_TO_MINUTES, risk])
+    
+    def _snap_indices(self, points):
+        """Routing graph node indices closest to a batch of (lat, lon) points"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        index, _ = self.spatial_index.query(points[:, 0], points[:, 1])
+        return index.tolist()
+    
+    def snap_points(self, points):
+        """OSM node ids closest to a batch of (lat, lon) points, in one index query"""
+        return self.routing_graph.node_ids[self._snap_indices(points)].tolist()
+    
+    def nearest_node(self, point):
+        """OSM node id closest to a (lat, lon) point"""
+        return self.snap_points([point])[0]
+    
+    def _predict_route_csr(self, start_node, end_node, weights, cost_per_meter=0.0, key=None):
+        """
+        Shortest path over the CSR routing graph; edge ids index weights directly
+        
+        When contraction hierarchies are enabled and the one for this weight
+        set is ready it answers the query; until then a build is queued in
+        the background and the regular search is used.
+        """
+        rg = self.routing_graph
+        source, target = rg.node_index(start_node), rg.node_index(end_node)
+        hierarchy = None
+        if self.hierarchies is not None and key is not None:
+            hierarchy = self.hierarchies.get(key, rg, weights)
+        
+        result = run_search(rg, weights, source, target, cost_per_meter, hierarchy)
+        return self._route_output(source, result)
+    
+    def _route_output(self, source, result):
+        """(route_coords, route node ids) for a CSR search result"""
+        if not result.found:
+            return None, None
+        rg = self.routing_graph
+        route = rg.node_ids[[source] + rg.edge_head[result.edges].tolist()].tolist()
+        return rg.edge_coords(result.edges), route
+    
+    def _astar_heuristic(self, cost_per_meter):
+        """NetworkX A* heuristic: great-circle distance times the cheapest cost per meter"""
+        nodes = self.graph.nodes
+        
+        def heuristic(u, v):
+            return cost_per_meter * float(haversine(nodes[u]['y'], nodes[u]['x'],
+                                                    nodes[v]['y'], nodes[v]['x']))
+        
+        return heuristic
+    
+    def edge_weight_function(self, weights):
+        """NetworkX weight callable reading a weight array indexed by edge id"""
+        edge_index = self.edge_index
+        
+        def weight(u, v, edge_data):
+            # MultiDiGraph searches pass all parallel edges between u and v;
+            # None hides edges closed by an override
+            cost = min(weights[edge_index[(u, v, k)]] for k in edge_data)
+            return None if cost == np.inf else cost
+        
+        return weight
     # route_optimizer.py
 
+def _grid_points(lats, lons):
+    """(lat, lon) as integer 1e-5 degree steps, the rounding of stored polylines"""
+    return list(zip(np.round(np.asarray(lats, dtype=np.float64) * 1e5).astype(np.int64).tolist(),
+                    np.round(np.asarray(lons, dtype=np.float64) * 1e5).astype(np.int64).tolist()))
+
+def _location_point(location):
+    """(lat, lon) from a current_location value: JSON string, dict or pair"""
+    if not location:
+        return None
+    if isinstance(location, str):
+        location = json.loads(location)
+    if isinstance(location, dict):
+        lat = location.get('lat', location.get('latitude'))
+        lon = location.get('lon', location.get('lng', location.get('longitude')))
+        return (lat, lon) if lat is not None and lon is not None else None
+    return tuple(location[:2])
+
 class EnhancedRouteOptimizer:
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, snapshot_path=None, engine='networkx',
+                 contraction_hierarchies=False, regions=None, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 override_store=None):
+        self.engine = engine
+        self.contraction_hierarchies = contraction_hierarchies
         # Initialize your base route optimizer
-        self.optimizer = RouteOptimizerBackend()
+        self.optimizer = RouteOptimizerBackend(engine=engine,
+                                               contraction_hierarchies=contraction_hierarchies)
         if model_path:
             self.optimizer.load_model(model_path)
+        if snapshot_path:
+            self.optimizer.load_snapshot(snapshot_path)
+        # Per-region graphs ({name: spec}, see routing.registry.load_regions),
+        # loaded on demand; self.optimizer's graph serves requests outside them
+        self.registry = GraphRegistry(regions, self._load_region, memory_budget) if regions else None
+        # Live edge overrides ({id: override}, version), synced to each graph
+        # before it serves a request. With an override_store (see
+        # logistics/route_overrides.py) they live in the database and this is
+        # the copy loaded at the store's current version.
+        self.override_store = override_store
+        self._override_state = ({}, 0)
+        self._override_ids = itertools.count(1)
+        self._overrides_lock = threading.Lock()
+    
+    @property
+    def has_graph(self):
+        """Whether a road network is loaded (or loadable) for routing and snapping"""
+        return self.optimizer.routing_graph is not None or self.registry is not None
+    
+    def _load_region(self, name, spec):
+        """Registry loader: a backend for one region, sharing the loaded model"""
+        backend = RouteOptimizerBackend(engine=self.engine,
+                                        contraction_hierarchies=self.contraction_hierarchies)
+        backend.share_model(self.optimizer)
+        if spec.get('snapshot'):
+            backend.load_snapshot(spec['snapshot'])
+        else:
+            backend.load_graph(spec['place'])
+        return backend
     
-    def optimize_for_shipment(self, shipment, cargo_list, current_time=None):
+    def backend_for(self, points):
+        """Backend whose graph covers all (lat, lon) points"""
+        if self.registry is not None and self.registry.region_for(points) is not None:
+            backend = self.registry.backend_for(points)
+        elif self.optimizer.routing_graph is None and self.registry is not None:
+            raise ValueError(f"No configured region covers {list(points)}")
+        else:
+            backend = self.optimizer
+        if backend.routing_graph is not None:
+            backend.sync_overrides(*self._current_overrides())
+        return backend
+    
+    def loaded_backend_for(self, points):
+        """Like backend_for, but only among graphs already in memory; None if none covers points"""
+        backend = None
+        if self.registry is not None:
+            backend = self.registry.loaded_backend_for(points)
+        if backend is None and self.optimizer.routing_graph is not None:
+            if self.registry is None or self.registry.region_for(points) is None:
+                backend = self.optimizer
+        if backend is not None:
+            backend.sync_overrides(*self._current_overrides())
+        return backend
+    
+    def _loaded_backends(self):
+        backends = self.registry.backends() if self.registry is not None else []
+        if self.optimizer.routing_graph is not None:
+            backends.append(self.optimizer)
+        return backends
+    
+    def _current_overrides(self):
+        """({id: override}, version), reloaded from the override store when it has changed"""
+        if self.override_store is None:
+            return self._override_state
+        version = self.override_store.version()
+        with self._overrides_lock:
+            if version != self._override_state[1]:
+                self._override_state = self.override_store.load()
+            return self._override_state
+    
+    def _sync_loaded(self):
+        state = self._current_overrides()
+        for backend in self._loaded_backends():
+            backend.sync_overrides(*state)
+    
+    def apply_overrides(self, overrides):
+        """
+        Apply live edge overrides (see RouteOptimizerBackend.apply_overrides)
+        to every graph; returns their ids
+        
+        Every override is checked before any is stored. Loaded graphs absorb
+        them right away, regions loaded later on load.
+        """
+        batch = []
+        for override in overrides:
+            override_value(override)
+            batch.append((str(override['id']) if override.get('id') else None,
+                          {k: v for k, v in override.items() if k != 'id'}))
+        if self.override_store is not None:
+            ids = self.override_store.add(batch)
+        else:
+            ids = [override_id or f'o{next(self._override_ids)}' for override_id, _ in batch]
+            with self._overrides_lock:
+                specs, version = self._override_state
+                specs = dict(specs)
+                specs.update(zip(ids, (override for _, override in batch)))
+                self._override_state = (specs, version + 1)
+        self._sync_loaded()
+        return ids
+    
+    def remove_overrides(self, override_ids):
+        """Lift overrides by id; returns the ids that were active"""
+        if self.override_store is not None:
+            removed = self.override_store.remove(override_ids)
+        else:
+            with self._overrides_lock:
+                specs, version = self._override_state
+                removed = [i for i in override_ids if i in specs]
+                if removed:
+                    self._override_state = ({i: o for i, o in specs.items() if i not in removed},
+                                            version + 1)
+        if removed:
+            self._sync_loaded()
+        return removed
+    
+    def list_overrides(self):
+        specs, _ = self._current_overrides()
+        return [dict(override, id=override_id) for override_id, override in specs.items()]
+    
+    def affected_routes(self, routes, override_ids):
+        """
+        For each route ((lat, lon) points), whether it runs along an edge
+        covered by any of the given overrides
+        """
+        affected = []
+        for route in routes:
+            try:
+                backend = self.backend_for([route[0], route[-1]]) if route else None
+            except ValueError:
+                backend = None
+            if backend is None:
+                affected.append(False)
+                continue
+            edges = backend.overrides.edges(override_ids)
+            affected.extend(backend.routes_crossing([route], edges))
+        return affected
+    
+    def reroute_shipments(self, shipments, cargo_lists, current_time=None, algorithm=None):
+        """
+        Re-plan shipments from their current_location to their destination
+        
+        Shipments without a current location are planned from their origin.
+        Returns results shaped like optimize_for_shipment's.
+        """
+        starts = [self.from_current_location(shipment) for shipment in shipments]
+        return self.optimize_many(starts, cargo_lists, current_time, algorithm)
+    
+    @staticmethod
+    def from_current_location(shipment):
+        """Copy of shipment starting at its current_location, if it reports one"""
+        current = _location_point(shipment.get('current_location'))
+        if current is None:
+            return shipment
+        return dict(shipment, origin_lat=current[0], origin_lon=current[1])
+    
+    def close(self):
+        if self.registry is not None:
+            self.registry.close()
+        self.optimizer.close()
+    
+    def optimize_for_shipment(self, shipment, cargo_list, current_time=None, algorithm=None):
         """
         Optimize route considering cargo constraints
         
@@ -91,10 +1082,75 @@ class EnhancedRouteOptimizer:
         shipment (dict): Shipment information
         cargo_list (list): List of cargo items in the shipment
         current_time (datetime): Current time for optimization
+        algorithm (str): 'dijkstra' or 'astar'; defaults to the backend setting
         
         Returns:
         dict: Optimized route information
         """
+        params, constraints = self._route_parameters(shipment, cargo_list, current_time)
+        backend = self.backend_for([params['start_point'], params['end_point']])
+        
+        # Get optimized route
+        route_coords, route_nodes = backend.predict_route(
+            params['start_point'], params['end_point'],
+            params['time_of_day'], params['day_of_week'],
+            mission_priority=params['mission_priority'],
+            risk_tolerance=params['risk_tolerance'],
+            algorithm=algorithm
+        )
+        
+        return self._route_result(backend, route_coords, route_nodes, constraints, params)
+    
+    def route_key(self, shipment, cargo_list, current_time=None):
+        """
+        Identity of the route optimize_for_shipment would compute now
+        
+        A JSON-friendly list of the snapped origin and destination nodes and
+        the stored weight key (graph digest, model, hour bucket, weekday,
+        risk tolerance, overrides digest). It is meant to be persisted, so
+        it holds content hashes rather than per-process versions: a stored
+        route with the same key is still current in any process, and any
+        change in graph or weights gives a different key.
+        """
+        params, _ = self._route_parameters(shipment, cargo_list, current_time)
+        backend = self.backend_for([params['start_point'], params['end_point']])
+        start_node, end_node = backend.snap_points([params['start_point'], params['end_point']])
+        key = backend.stored_weight_key(params['time_of_day'], params['day_of_week'], params['risk_tolerance'])
+        return [start_node, end_node] + list(key)
+    
+    def optimize_many(self, shipments, cargo_lists, current_time=None, algorithm=None,
+                      max_workers=None):
+        """
+        Optimize routes for a whole wave of shipments at once
+        
+        cargo_lists[i] holds the cargo of shipments[i]. Requests are grouped
+        by region graph and weight bucket and searched in parallel across a process pool
+        sharing the graph read-only. Returns one result per shipment, shaped
+        like optimize_for_shipment's.
+        """
+        if current_time is None:
+            current_time = datetime.now()
+        
+        prepared = [self._route_parameters(shipment, cargo_list, current_time)
+                    for shipment, cargo_list in zip(shipments, cargo_lists)]
+        
+        # One batch per region graph
+        groups = {}
+        for i, (params, _) in enumerate(prepared):
+            backend = self.backend_for([params['start_point'], params['end_point']])
+            groups.setdefault(id(backend), (backend, []))[1].append(i)
+        
+        results = [None] * len(prepared)
+        for backend, indices in groups.values():
+            routes = backend.predict_routes([prepared[i][0] for i in indices],
+                                            algorithm=algorithm, max_workers=max_workers)
+            for i, (route_coords, route_nodes) in zip(indices, routes):
+                params, constraints = prepared[i]
+                results[i] = self._route_result(backend, route_coords, route_nodes, constraints, params)
+        return results
+    
+    def _route_parameters(self, shipment, cargo_list, current_time=None):
+        """Routing request and cargo constraints for one shipment"""
         # Extract basic route information
         origin = (shipment['origin_lat'], shipment['origin_lon'])
         destination = (shipment['dest_lat'], shipment['dest_lon'])
@@ -103,9 +1159,6 @@ class EnhancedRouteOptimizer:
         if not current_time:
             current_time = datetime.now()
         
-        time_of_day = current_time.hour
-        day_of_week = current_time.weekday()
-        
         # Determine constraints based on cargo
         constraints = self._get_cargo_constraints(cargo_list)
         
@@ -115,19 +1168,27 @@ class EnhancedRouteOptimizer:
             risk_tolerance = 'low'  # safer routes for critical cargo
         elif all(cargo['priority'] == 'low' for cargo in cargo_list):
             risk_tolerance = 'high'  # can take more risks for low priority
-            
-        # Determine mission priority
-        mission_priority = shipment.get('priority', 'standard')
         
-        # Get optimized route
-        route_coords, route_nodes = self.optimizer.predict_route(
-            origin, destination, time_of_day, day_of_week,
-            mission_priority=mission_priority,
-            risk_tolerance=risk_tolerance
-        )
+        params = {
+            'start_point': origin,
+            'end_point': destination,
+            'time_of_day': current_time.hour,
+            'day_of_week': current_time.weekday(),
+            'risk_tolerance': risk_tolerance,
+            # Determine mission priority
+            'mission_priority': shipment.get('priority', 'standard')
+        }
+        return params, constraints
+    
+    def _route_result(self, backend, route_coords, route_nodes, constraints, params):
+        """Response dict for a route computed on backend"""
+        segments = None
+        if route_nodes:
+            segments = backend.route_segments(
+                route_nodes, params['time_of_day'], params['day_of_week'], params['risk_tolerance'])
         
         # Add cargo-specific considerations
-        route_metrics = self._calculate_cargo_metrics(route_nodes, constraints)
+        route_metrics = self._calculate_cargo_metrics(route_nodes, constraints, segments)
         
         return {
             'route': route_coords,
@@ -136,6 +1197,41 @@ class EnhancedRouteOptimizer:
             'risk_level': self._calculate_risk_level(route_metrics)
         }
     
+    def snap_shipments(self, shipments):
+        """
+        Attach nearest road-network nodes to shipment dicts, one batch query per region
+        
+        Sets 'origin_node' and 'dest_node', plus 'current_node' for shipments
+        reporting a current_location. Shipments are updated in place. Only
+        graphs already loaded are used; shipments in regions that are not
+        in memory are left unsnapped rather than loading them.
+        """
+        # Points to snap per region graph, with the field each one fills
+        groups = {}
+        for shipment in shipments:
+            targets = []
+            if shipment.get('origin_lat') is not None and shipment.get('origin_lon') is not None:
+                targets.append(((shipment['origin_lat'], shipment['origin_lon']), 'origin_node'))
+            if shipment.get('dest_lat') is not None and shipment.get('dest_lon') is not None:
+                targets.append(((shipment['dest_lat'], shipment['dest_lon']), 'dest_node'))
+            current = _location_point(shipment.get('current_location'))
+            if current is not None:
+                targets.append((current, 'current_node'))
+            if not targets:
+                continue
+            backend = self.loaded_backend_for([point for point, _ in targets])
+            if backend is None:
+                continue
+            group = groups.setdefault(id(backend), (backend, [], []))
+            for point, field in targets:
+                group[1].append(point)
+                group[2].append((shipment, field))
+        
+        for backend, points, targets in groups.values():
+            for (shipment, field), node in zip(targets, backend.snap_points(points)):
+                shipment[field] = node
+        return shipments
+    
     def _get_cargo_constraints(self, cargo_list):
         """Extract constraints from cargo items"""
         constraints = {
@@ -185,8 +1281,13 @@ class EnhancedRouteOptimizer:
         
         return constraints
     
-    def _calculate_cargo_metrics(self, route_nodes, constraints):
-        """Calculate route metrics considering cargo constraints"""
+    def _calculate_cargo_metrics(self, route_nodes, constraints, segments=None):
+        """
+        Calculate route metrics considering cargo constraints
+        
+        segments is the 3 x n distance/time/risk array from
+        RouteOptimizerBackend.route_segments; it is returned per edge too.
+        """
         # Basic metrics
         metrics = {
             'total_distance': 0,
@@ -194,22 +1295,28 @@ class EnhancedRouteOptimizer:
             'risk_score': 0,
             'environmental_risk': 0,
             'safe_zones': 0,
-            'danger_zones': 0
+            'danger_zones': 0,
+            'segments': {'distance': [], 'time': [], 'risk': []}
         }
         
-        # Add your route metrics calculation logic here
-        # This would typically consider the specific edges in your graph
-        # and factor in cargo constraints
-        
-        # Example pseudocode:
-        # for each segment in route_nodes:
-        #    segment_metrics = calculate_segment_metrics(segment)
-        #    apply_cargo_constraints(segment_metrics, constraints)
-        #    update overall metrics
-        
-        # Mock calculation for demonstration
-        metrics['total_distance'] = 100  # km
-        metrics['total_time'] = 120  # minutes
+        if segments is not None and segments.shape[1]:
+            distance, time, risk = segments
+            metrics['total_distance'] = round(float(distance.sum()) / 1000, 3)  # km
+            metrics['total_time'] = round(float(time.sum()), 2)  # minutes
+            
+            # Time-weighted share of the route spent on delayed segments
+            exposure = float(np.average(risk, weights=time)) if time.sum() > 0 else float(risk.mean())
+            metrics['risk_score'] = round(exposure * 100, 1)
+            
+            # Zones are contiguous runs of risky or entirely delay-free segments
+            metrics['danger_zones'] = self._count_runs(risk >= DANGER_SEGMENT_RISK)
+            metrics['safe_zones'] = self._count_runs(risk == 0)
+            
+            metrics['segments'] = {
+                'distance': distance.tolist(),
+                'time': time.tolist(),
+                'risk': risk.tolist()
+            }
         
         # Increase risk score for sensitive cargo
         if constraints['temp_sensitive'] or constraints['humidity_sensitive']:
@@ -218,10 +1325,16 @@ class EnhancedRouteOptimizer:
         # Increase risk for dangerous goods
         if constraints['has_dangerous_goods']:
             metrics['risk_score'] += 50
-            metrics['danger_zones'] = 2
         
         return metrics
     
+    @staticmethod
+    def _count_runs(mask):
+        """Number of contiguous True runs in a boolean array"""
+        if not mask.size:
+            return 0
+        return int(mask[0]) + int(np.count_nonzero(mask[1:] & ~mask[:-1]))
+    
     def _calculate_risk_level(self, metrics):
         """Determine overall risk level based on metrics"""
         total_risk = metrics['risk_score'] + metrics['environmental_risk']
@@ -233,24 +1346,19 @@ class EnhancedRouteOptimizer:
         else:
             return 'high'
 
-risk_factors = {
-    'low': 1.5,    # Safer routes
-    'medium': 1.0,  # Balanced
-    'high': 0.7     # Faster but riskier
-}
-
-# 1. Initialize with ML model
-optimizer = EnhancedRouteOptimizer('models/route_model.pkl')
+if __name__ == '__main__':
+    # 1. Initialize with ML model
+    optimizer = EnhancedRouteOptimizer('models/route_model.pkl')
 
-# 2. Input: Shipment details and cargo list
-shipment = {
-    'origin_lat': 34.05,
-    'origin_lon': -118.25,
-    'dest_lat': 34.22,
-    'dest_lon': -118.40,
-    'priority': 'urgent'
-}
+    # 2. Input: Shipment details and cargo list
+    shipment = {
+        'origin_lat': 34.05,
+        'origin_lon': -118.25,
+        'dest_lat': 34.22,
+        'dest_lon': -118.40,
+        'priority': 'urgent'
+    }
 
-cargo_list = [
-    {'name': 'Medical Supplies', 'priority': 'critical', 'temperature_min': 2}
-]
\ No newline at end of file
+    cargo_list = [
+        {'name': 'Medical Supplies', 'priority': 'critical', 'temperature_min': 2}
+    ]
@@ -0,0 +1,102 @@
+# routing/batch.py
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from routing.search import run_search
+
+# Below this many searches a process pool costs more than it saves
+MIN_PARALLEL_JOBS = 16
+
+# Graph of a pool worker process, set once by the pool initializer
+_worker = {}
+
+def _init_worker(routing_graph):
+    """
+    Pool initializer. Under the fork start method the graph is inherited
+    rather than pickled, so workers share the parent's graph pages (or
+    memory-mapped snapshot) read-only.
+    """
+    _worker['graph'] = routing_graph
+
+def _search(graph, jobs, weight_sets, hierarchies):
+    return [
+        (i, run_search(graph, weight_sets[key], source, target, cost_per_meter, hierarchies.get(key)))
+        for i, key, source, target, cost_per_meter in jobs
+    ]
+
+def _run_chunk(chunk):
+    jobs, weight_sets, hierarchies = chunk
+    return _search(_worker['graph'], jobs, weight_sets, hierarchies)
+
+class BatchPool:
+    """
+    Long-lived process pool for batch searches over one routing graph.
+
+    Workers are forked on first use and inherit the graph; each batch then
+    ships only the weight arrays and hierarchies its chunks use. Fork is
+    requested explicitly rather than relying on the platform default; where
+    it is unavailable, and after shutdown(), batches run in the calling thread.
+    """
+    def __init__(self, routing_graph, max_workers=None):
+        self.routing_graph = routing_graph
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        """The executor, started on first use; None once shut down"""
+        with self._lock:
+            if self._executor is None and not self._closed:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=multiprocessing.get_context('fork'),
+                                                     initializer=_init_worker,
+                                                     initargs=(self.routing_graph,))
+            return self._executor
+
+    def run(self, jobs, weight_sets, hierarchies=None, max_workers=None):
+        """
+        Run many shortest-path searches, fanned out over the pool.
+
+        jobs is a list of (weight key, source, target, cost_per_meter) with
+        node indices; weight_sets maps each key to its edge weights and
+        hierarchies maps keys to ready contraction hierarchies. Jobs sharing
+        a key are kept together in chunks. max_workers caps the workers used
+        for this batch (1 runs it in the calling thread). Returns
+        SearchResults in job order.
+        """
+        hierarchies = hierarchies or {}
+        indexed = sorted(((i,) + tuple(job) for i, job in enumerate(jobs)), key=lambda job: str(job[1]))
+        workers = min(max_workers or self.max_workers, self.max_workers)
+
+        pool = None
+        if (workers > 1 and len(jobs) >= MIN_PARALLEL_JOBS
+                and 'fork' in multiprocessing.get_all_start_methods()):
+            pool = self._pool()
+        if pool is None:
+            finished = _search(self.routing_graph, indexed, weight_sets, hierarchies)
+        else:
+            # A few chunks per worker keeps them busy without per-job overhead
+            chunk_size = max(1, math.ceil(len(indexed) / (workers * 4)))
+            chunks = []
+            for start in range(0, len(indexed), chunk_size):
+                chunk = indexed[start:start + chunk_size]
+                keys = {job[1] for job in chunk}
+                chunks.append((chunk, {key: weight_sets[key] for key in keys},
+                               {key: hierarchies[key] for key in keys if key in hierarchies}))
+            finished = [item for chunk in pool.map(_run_chunk, chunks) for item in chunk]
+
+        results = [None] * len(jobs)
+        for i, result in finished:
+            results[i] = result
+        return results
+
+    def shutdown(self):
+        """Stop the workers once batches already running on them finish"""
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
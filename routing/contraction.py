@@ -0,0 +1,354 @@
+# routing/contraction.py
+import concurrent.futures
+import heapq
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from routing.search import SearchResult
+
+# Witness searches give up after settling this many nodes or following
+# paths of more than this many arcs; a missed witness only adds a redundant
+# shortcut, never a wrong distance. Ordering runs a cheaper search than the
+# contraction itself.
+WITNESS_SETTLE_LIMIT = 60
+WITNESS_HOP_LIMIT = 5
+ORDERING_HOP_LIMIT = 2
+# Contraction stops once the remaining graph averages this many arcs per
+# node; contracting that dense core costs far more than searching it
+CORE_DEGREE = 16
+# Largest graph HierarchyBuilder contracts; a 5,000-node grid takes about
+# 15 s in this pure-Python build
+DEFAULT_MAX_NODES = 20000
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over one fixed edge weight set.
+
+    Nodes are contracted in order of importance, adding shortcut arcs that
+    preserve shortest-path distances, until only a dense core is left. A
+    query is then a bidirectional Dijkstra that only climbs to higher-ranked
+    nodes, plus whatever it needs of the core.
+
+    Arcs are stored as two CSR arrays: up_* rows hold arcs u -> v with
+    rank[u] < rank[v] (indexed by u) and down_* rows hold arcs u -> v with
+    rank[u] > rank[v] (indexed by v, listing u); arcs between core nodes are
+    in both. *_mid is the contracted node a shortcut bypasses, or -1 for an
+    original edge, whose id is in *_edge.
+    """
+    ARRAYS = ('rank', 'up_indptr', 'up_node', 'up_weight', 'up_mid', 'up_edge',
+              'down_indptr', 'down_node', 'down_weight', 'down_mid', 'down_edge')
+
+    def __init__(self, **arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def build(cls, indptr, edge_head, weights):
+        """Contract every node of a CSR graph under the given edge weights"""
+        n = len(indptr) - 1
+        # Cheapest arc per node pair: v -> (weight, mid, edge id)
+        out_arcs = [dict() for _ in range(n)]
+        in_arcs = [dict() for _ in range(n)]
+        for u in range(n):
+            start, end = int(indptr[u]), int(indptr[u + 1])
+            for e, v, w in zip(range(start, end), edge_head[start:end].tolist(),
+                               weights[start:end].tolist()):
+                if v == u or w == float('inf'):
+                    continue
+                if v not in out_arcs[u] or w < out_arcs[u][v][0]:
+                    out_arcs[u][v] = in_arcs[v][u] = (w, -1, e)
+
+        # out_arcs/in_arcs hold the remaining graph: a contracted node's arcs
+        # move to up/down, so searches never scan arcs into contracted nodes
+        up = [None] * n
+        down = [None] * n
+        # Plain lists: these are read in the innermost witness-search loop
+        contracted = [False] * n
+        deleted_neighbors = [0] * n
+        level = [0] * n
+        rank = np.empty(n, dtype=np.int32)
+        heappush, heappop = heapq.heappush, heapq.heappop
+        inf = float('inf')
+
+        def witness_distances(u, skip, targets, limit, hop_limit):
+            """Distances from u to targets in the remaining graph, avoiding skip"""
+            dist = {u: 0.0}
+            found = {}
+            heap = [(0.0, u, 0)]
+            settled = 0
+            while heap and settled < WITNESS_SETTLE_LIMIT and len(found) < len(targets):
+                d, x, hops = heappop(heap)
+                if d > dist[x]:
+                    continue
+                if d > limit:
+                    break
+                settled += 1
+                if x in targets:
+                    found[x] = d
+                if hops == hop_limit:
+                    continue
+                for y, arc in out_arcs[x].items():
+                    if y == skip:
+                        continue
+                    nd = d + arc[0]
+                    if nd < dist.get(y, inf):
+                        dist[y] = nd
+                        heappush(heap, (nd, y, hops + 1))
+            return found
+
+        def shortcuts_for(v, hop_limit):
+            """Shortcuts needed to contract v: (u, w, weight)"""
+            ins = [(u, arc[0]) for u, arc in in_arcs[v].items()]
+            outs = [(w, arc[0]) for w, arc in out_arcs[v].items()]
+            shortcuts = []
+            for u, w_in in ins:
+                targets = {w: w_in + w_out for w, w_out in outs if w != u}
+                if not targets:
+                    continue
+                found = witness_distances(u, v, targets, max(targets.values()), hop_limit)
+                for w, via in targets.items():
+                    if found.get(w, inf) > via:
+                        shortcuts.append((u, w, via))
+            return shortcuts, len(ins) + len(outs)
+
+        def priority(v):
+            # Edge difference, spread over the graph by contracted neighbours
+            # and kept shallow by the level each node would sit at
+            shortcuts, removed = shortcuts_for(v, ORDERING_HOP_LIMIT)
+            return len(shortcuts) - removed + deleted_neighbors[v] + level[v]
+
+        current = [priority(v) for v in range(n)]
+        heap = [(p, v) for v, p in enumerate(current)]
+        heapq.heapify(heap)
+        order = 0
+        arcs = sum(len(row) for row in out_arcs)
+        while heap and arcs <= CORE_DEGREE * (n - order):
+            p, v = heappop(heap)
+            if contracted[v] or p != current[v]:
+                continue  # superseded by a later priority update
+
+            shortcuts, _ = shortcuts_for(v, WITNESS_HOP_LIMIT)
+            for u, w, via in shortcuts:
+                if w not in out_arcs[u]:
+                    arcs += 1
+                    out_arcs[u][w] = in_arcs[w][u] = (via, v, -1)
+                elif via < out_arcs[u][w][0]:
+                    out_arcs[u][w] = in_arcs[w][u] = (via, v, -1)
+            arcs -= len(out_arcs[v]) + len(in_arcs[v])
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+
+            # Every remaining neighbour ranks above v: arcs out of v go up
+            # (listed under v), arcs into v come down (listed under v too)
+            up[v] = [(x, w, mid, e) for x, (w, mid, e) in out_arcs[v].items()]
+            down[v] = [(x, w, mid, e) for x, (w, mid, e) in in_arcs[v].items()]
+            for x in out_arcs[v]:
+                del in_arcs[x][v]
+            for x in in_arcs[v]:
+                del out_arcs[x][v]
+            neighbors = set(out_arcs[v]) | set(in_arcs[v])
+            out_arcs[v] = in_arcs[v] = None
+
+            # Only the neighbours' priorities depend on v being gone
+            for x in neighbors:
+                deleted_neighbors[x] += 1
+                level[x] = max(level[x], level[v] + 1)
+                current[x] = priority(x)
+                heappush(heap, (current[x], x))
+
+        # Uncontracted core: its arcs go both ways, so upward and downward
+        # searches both cross it freely
+        for v in range(n):
+            if not contracted[v]:
+                rank[v] = order
+                order += 1
+                up[v] = [(x, w, mid, e) for x, (w, mid, e) in out_arcs[v].items()]
+                down[v] = [(x, w, mid, e) for x, (w, mid, e) in in_arcs[v].items()]
+
+        arrays = {'rank': rank}
+        for prefix, rows in (('up', up), ('down', down)):
+            arrays[f'{prefix}_indptr'] = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(row) for row in rows], out=arrays[f'{prefix}_indptr'][1:])
+            flat = [arc for row in rows for arc in row]
+            arrays[f'{prefix}_node'] = np.array([a[0] for a in flat], dtype=np.int32)
+            arrays[f'{prefix}_weight'] = np.array([a[1] for a in flat], dtype=np.float64)
+            arrays[f'{prefix}_mid'] = np.array([a[2] for a in flat], dtype=np.int32)
+            arrays[f'{prefix}_edge'] = np.array([a[3] for a in flat], dtype=np.int32)
+        return cls(**arrays)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def _arc(self, prefix, row, node):
+        """(mid, edge) of the arc in a CSR row whose other endpoint is node"""
+        indptr = getattr(self, f'{prefix}_indptr')
+        start, end = int(indptr[row]), int(indptr[row + 1])
+        i = start + getattr(self, f'{prefix}_node')[start:end].tolist().index(node)
+        return int(getattr(self, f'{prefix}_mid')[i]), int(getattr(self, f'{prefix}_edge')[i])
+
+    def _unpack(self, u, v, mid, edge, out):
+        """Expand arc u -> v into original edge ids, appending to out"""
+        stack = [(u, v, mid, edge)]
+        while stack:
+            u, v, mid, edge = stack.pop()
+            if mid < 0:
+                out.append(edge)
+                continue
+            # mid ranks below both ends: u -> mid is a down arc, mid -> v an up arc
+            second = (mid, v) + self._arc('up', mid, v)
+            first = (u, mid) + self._arc('down', mid, u)
+            stack.append(second)
+            stack.append(first)
+
+    def query(self, source, target):
+        """Shortest path between node indices; same cost as Dijkstra on the weights"""
+        if source == target:
+            return SearchResult(0.0, [], [source], 0)
+
+        sides = (
+            (self.up_indptr, self.up_node, self.up_weight),
+            (self.down_indptr, self.down_node, self.down_weight)
+        )
+        dist = ({source: 0.0}, {target: 0.0})
+        pred = ({}, {})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        inf = float('inf')
+        best, meet = inf, None
+        settled = 0
+
+        while True:
+            # Each direction runs until its frontier cannot beat the best meeting
+            active = [side for side in (0, 1) if heaps[side] and heaps[side][0][0] < best]
+            if not active:
+                break
+            side = min(active, key=lambda s: heaps[s][0][0])
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+            settled += 1
+            if u in dist[1 - side] and d + dist[1 - side][u] < best:
+                best, meet = d + dist[1 - side][u], u
+
+            indptr, nodes, arc_weights = sides[side]
+            start, end = int(indptr[u]), int(indptr[u + 1])
+            own = dist[side]
+            for i, v, w in zip(range(start, end), nodes[start:end].tolist(),
+                               arc_weights[start:end].tolist()):
+                nd = d + w
+                if nd < own.get(v, inf):
+                    own[v] = nd
+                    pred[side][v] = (u, i)
+                    heapq.heappush(heaps[side], (nd, v))
+
+        if meet is None:
+            return SearchResult(inf, None, None, settled)
+
+        # Upward arcs from source to the meeting node, then down to target
+        arcs = []
+        node = meet
+        while node != source:
+            u, i = pred[0][node]
+            arcs.append((u, node, int(self.up_mid[i]), int(self.up_edge[i])))
+            node = u
+        arcs.reverse()
+        node = meet
+        while node != target:
+            v, i = pred[1][node]
+            arcs.append((node, v, int(self.down_mid[i]), int(self.down_edge[i])))
+            node = v
+
+        edges = []
+        for arc in arcs:
+            self._unpack(*arc, edges)
+        return SearchResult(best, edges, None, settled)
+
+def _build_hierarchy(indptr, edge_head, weights):
+    """Process-pool entry point; returns the hierarchy arrays"""
+    hierarchy = ContractionHierarchy.build(indptr, edge_head, weights)
+    return {name: getattr(hierarchy, name) for name in ContractionHierarchy.ARRAYS}
+
+class HierarchyBuilder:
+    """
+    Builds contraction hierarchies for weight sets in a background process.
+
+    get() never waits: it returns a finished hierarchy or None after queueing
+    a build, and callers fall back to a plain search meanwhile. Finished
+    hierarchies are kept per weight-cache key with LRU eviction. Graphs over
+    max_nodes are never built (contraction time grows faster than the graph),
+    and at most max_workers builds are queued at once; discard() cancels
+    queued builds for keys that are no longer wanted. After shutdown() built
+    hierarchies are still served but nothing new is queued, so requests
+    still holding a closed backend fall back to plain searches.
+    """
+    def __init__(self, max_entries=8, max_workers=1, max_nodes=DEFAULT_MAX_NODES):
+        self.max_entries = max_entries
+        self.max_workers = max_workers
+        self.max_nodes = max_nodes
+        self._hierarchies = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def get(self, key, routing_graph, weights):
+        """Hierarchy for key if built, otherwise schedule it and return None"""
+        with self._lock:
+            if key in self._hierarchies:
+                self._hierarchies.move_to_end(key)
+                return self._hierarchies[key]
+            if (key in self._pending or self._closed or len(self._pending) >= self.max_workers
+                    or routing_graph.num_nodes > self.max_nodes):
+                return None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._executor.submit(_build_hierarchy, np.asarray(routing_graph.indptr),
+                                           np.asarray(routing_graph.edge_head), np.asarray(weights))
+            self._pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._finish(key, f))
+        return None
+
+    def _finish(self, key, future):
+        with self._lock:
+            # A build discarded while it ran is no longer wanted
+            if self._pending.get(key) is not future:
+                return
+            del self._pending[key]
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._hierarchies[key] = ContractionHierarchy(**future.result())
+            while len(self._hierarchies) > self.max_entries:
+                self._hierarchies.popitem(last=False)
+
+    def discard(self, predicate):
+        """Drop built hierarchies and cancel queued builds whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._hierarchies if predicate(key)]:
+                del self._hierarchies[key]
+            for key in [key for key in self._pending if predicate(key)]:
+                self._pending.pop(key).cancel()
+
+    @property
+    def nbytes(self):
+        """Memory held by the built hierarchies"""
+        with self._lock:
+            return sum(hierarchy.nbytes for hierarchy in self._hierarchies.values())
+
+    def wait(self, timeout=None):
+        """Block until queued builds finish (for warm-up scripts, not requests)"""
+        with self._lock:
+            pending = list(self._pending.items())
+        concurrent.futures.wait([future for _, future in pending], timeout=timeout)
+        # Store finished builds now rather than when their callbacks get to run
+        for key, future in pending:
+            if future.done():
+                self._finish(key, future)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,150 @@
+# routing/graph.py
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters; works on scalars or NumPy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class RoutingGraph:
+    """
+    Compact CSR road network for array-based routing.
+
+    Nodes are numbered 0..N-1 and edges 0..E-1. The outgoing edges of node i
+    are indptr[i]:indptr[i + 1], with heads in edge_head; the reverse CSR
+    lists incoming edge ids in in_edges[in_indptr[i]:in_indptr[i + 1]]. Edge geometry is
+    stored as (lat, lon) rows of geom_coords, edge e owning rows
+    geom_offsets[e]:geom_offsets[e + 1] (empty when the edge is straight).
+    """
+    ARRAYS = ('node_ids', 'node_lat', 'node_lon', 'indptr', 'edge_tail', 'edge_head',
+              'edge_key', 'edge_length', 'geom_offsets', 'geom_coords',
+              'in_indptr', 'in_edges', 'node_order', 'sorted_node_ids')
+
+    def __init__(self, node_ids, node_lat, node_lon, indptr, edge_tail, edge_head,
+                 edge_key, edge_length, geom_offsets, geom_coords,
+                 in_indptr=None, in_edges=None, node_order=None, sorted_node_ids=None):
+        self.node_ids = node_ids
+        self.node_lat = node_lat
+        self.node_lon = node_lon
+        self.indptr = indptr
+        self.edge_tail = edge_tail
+        self.edge_head = edge_head
+        self.edge_key = edge_key
+        self.edge_length = edge_length
+        self.geom_offsets = geom_offsets
+        self.geom_coords = geom_coords
+
+        # Derived arrays are passed in when loading a snapshot so that
+        # memory-mapped graphs need no rebuild
+        if in_edges is None:
+            # Reverse adjacency for backward searches
+            in_edges = np.argsort(edge_head, kind='stable').astype(np.int32)
+            in_indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(edge_head, minlength=len(node_ids)), out=in_indptr[1:])
+        if node_order is None:
+            # Sorted view of node ids for id -> index lookups
+            node_order = np.argsort(node_ids, kind='stable')
+            sorted_node_ids = node_ids[node_order]
+        self.in_indptr = in_indptr
+        self.in_edges = in_edges
+        self.node_order = node_order
+        self.sorted_node_ids = sorted_node_ids
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Build from an OSMnx MultiDiGraph.
+
+        Edge ids follow G.edges(keys=True) order, which NetworkX groups by
+        tail node in node order, so they line up with the backend's
+        edge feature matrix.
+        """
+        node_ids = np.fromiter(G.nodes, dtype=np.int64, count=G.number_of_nodes())
+        node_lat = np.array([d['y'] for _, d in G.nodes(data=True)], dtype=np.float64)
+        node_lon = np.array([d['x'] for _, d in G.nodes(data=True)], dtype=np.float64)
+        index = {node: i for i, node in enumerate(G.nodes)}
+
+        n_edges = G.number_of_edges()
+        edge_tail = np.empty(n_edges, dtype=np.int32)
+        edge_head = np.empty(n_edges, dtype=np.int32)
+        edge_key = np.empty(n_edges, dtype=np.int32)
+        edge_length = np.empty(n_edges, dtype=np.float32)
+        geom_offsets = np.zeros(n_edges + 1, dtype=np.int64)
+        geom_parts = []
+
+        for e, (u, v, k, data) in enumerate(G.edges(keys=True, data=True)):
+            edge_tail[e] = index[u]
+            edge_head[e] = index[v]
+            edge_key[e] = k
+            edge_length[e] = data.get('length', 0)
+            geometry = data.get('geometry')
+            n_coords = 0
+            if geometry is not None:
+                # Shapely coordinates are (lon, lat)
+                coords = np.asarray(geometry.coords, dtype=np.float64)[:, ::-1]
+                geom_parts.append(coords)
+                n_coords = len(coords)
+            geom_offsets[e + 1] = geom_offsets[e] + n_coords
+
+        if np.any(np.diff(edge_tail) < 0):
+            raise ValueError('graph edges are not grouped by tail node')
+
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edge_tail, minlength=len(node_ids)), out=indptr[1:])
+        geom_coords = np.concatenate(geom_parts) if geom_parts else np.empty((0, 2))
+
+        return cls(node_ids, node_lat, node_lon, indptr, edge_tail, edge_head,
+                   edge_key, edge_length, geom_offsets, geom_coords)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_head)
+
+    @property
+    def nbytes(self):
+        """Memory held by the graph arrays"""
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def node_index(self, node_id):
+        """Index of an OSM node id, or None if it is not in the graph"""
+        pos = np.searchsorted(self.sorted_node_ids, node_id)
+        if pos < len(self.sorted_node_ids) and self.sorted_node_ids[pos] == node_id:
+            return int(self.node_order[pos])
+        return None
+
+    def node_indices(self, node_ids):
+        """Indices of many OSM node ids at once; all must be in the graph"""
+        pos = np.searchsorted(self.sorted_node_ids, np.asarray(node_ids, dtype=np.int64))
+        return self.node_order[pos]
+
+    def path_edges(self, node_path, weights):
+        """Edge ids along a node index path, taking the cheapest parallel edge"""
+        edges = []
+        for u, v in zip(node_path[:-1], node_path[1:]):
+            start, end = int(self.indptr[u]), int(self.indptr[u + 1])
+            candidates = start + np.flatnonzero(self.edge_head[start:end] == v)
+            edges.append(int(candidates[np.argmin(weights[candidates])]))
+        return edges
+
+    def edge_coords(self, edge_ids):
+        """(lat, lon) polyline along a sequence of edge ids"""
+        route_coords = []
+        for e in edge_ids:
+            start, end = self.geom_offsets[e], self.geom_offsets[e + 1]
+            if end > start:
+                # If we have LineString geometry
+                route_coords.extend(map(tuple, self.geom_coords[start:end].tolist()))
+            else:
+                # If we don't have geometry, use node coordinates
+                u, v = self.edge_tail[e], self.edge_head[e]
+                route_coords.append((float(self.node_lat[u]), float(self.node_lon[u])))
+                route_coords.append((float(self.node_lat[v]), float(self.node_lon[v])))
+        return route_coords
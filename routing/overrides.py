@@ -0,0 +1,221 @@
+# routing/overrides.py
+import hashlib
+import itertools
+import threading
+import numpy as np
+
+OVERRIDE_KINDS = ('closure', 'slowdown', 'risk')
+
+# Range of OSM node ids and edge keys, as stored in the routing graph
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+def _is_node_id(value):
+    return isinstance(value, int) and not isinstance(value, bool) and INT64_MIN <= value <= INT64_MAX
+
+def validate_override(kind, value):
+    """Raise ValueError for an unknown kind or a value that would lower weights"""
+    if not isinstance(kind, str) or kind not in OVERRIDE_KINDS:
+        raise ValueError(f"Unknown override kind: {kind}")
+    if value is not None and not _is_number(value):
+        raise ValueError(f"Override values must be numbers, got {value!r}")
+    if kind == 'slowdown' and (value is None or value < 1):
+        raise ValueError("A slowdown needs a factor of at least 1")
+    if kind == 'risk' and (value is None or value < 0):
+        raise ValueError("A risk override needs a non-negative penalty")
+
+def points_in_polygon(lat, lon, polygon):
+    """
+    Mask of the points inside a polygon of (lat, lon) vertices
+
+    Even-odd ray casting, vectorized over the points one polygon side at a
+    time; points outside the polygon's bounding box are skipped up front.
+    """
+    vertices = np.asarray(polygon, dtype=np.float64)
+    south, west = vertices.min(axis=0)
+    north, east = vertices.max(axis=0)
+    inside = np.zeros(len(lat), dtype=bool)
+    candidates = np.flatnonzero((lat >= south) & (lat <= north) & (lon >= west) & (lon <= east))
+    y, x = np.asarray(lat)[candidates], np.asarray(lon)[candidates]
+    hit = np.zeros(len(candidates), dtype=bool)
+    for (y1, x1), (y2, x2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        crosses = (y1 > y) != (y2 > y)
+        if not crosses.any():
+            continue
+        # Longitude where this side crosses each point's latitude
+        x_cross = x1 + (y[crosses] - y1) * (x2 - x1) / (y2 - y1)
+        hit[crosses] ^= x[crosses] < x_cross
+    inside[candidates] = hit
+    return inside
+
+def polygon_edges(routing_graph, polygon):
+    """Ids of edges with either end inside a polygon of (lat, lon) vertices"""
+    inside = points_in_polygon(routing_graph.node_lat, routing_graph.node_lon, polygon)
+    return np.flatnonzero(inside[routing_graph.edge_tail] | inside[routing_graph.edge_head])
+
+def node_pair_edges(routing_graph, pairs):
+    """
+    Ids of edges given as (u, v) or (u, v, key) OSM node ids
+
+    (u, v) selects every parallel edge between the two nodes. Pairs not in
+    the graph are skipped.
+    """
+    edges = []
+    for pair in pairs:
+        u, v = routing_graph.node_index(pair[0]), routing_graph.node_index(pair[1])
+        if u is None or v is None:
+            continue
+        start, end = int(routing_graph.indptr[u]), int(routing_graph.indptr[u + 1])
+        match = routing_graph.edge_head[start:end] == v
+        if len(pair) > 2:
+            match &= routing_graph.edge_key[start:end] == pair[2]
+        edges.extend(start + np.flatnonzero(match))
+    return np.unique(np.asarray(edges, dtype=np.int64))
+
+def override_value(override):
+    """
+    Check an override dict and return its value (slowdown factor or risk
+    penalty, None for a closure)
+
+    Raises ValueError unless edges is a list of (u, v) or (u, v, key)
+    integer triples and polygon a list of at least 3 numeric (lat, lon)
+    vertices, so a bad override is rejected before anything stores it.
+    """
+    if not isinstance(override, dict):
+        raise ValueError("An override must be an object")
+    kind = override.get('kind')
+    value = override.get('factor') if kind == 'slowdown' else override.get('penalty')
+    validate_override(kind, value)
+    edges, polygon = override.get('edges'), override.get('polygon')
+    if not edges and not polygon:
+        raise ValueError("An override needs 'edges' or a 'polygon'")
+    if edges:
+        if not isinstance(edges, list) or not all(
+                isinstance(pair, (list, tuple)) and len(pair) in (2, 3) and all(map(_is_node_id, pair))
+                for pair in edges):
+            raise ValueError("'edges' must be a list of [u, v] or [u, v, key] integer node ids")
+    if polygon:
+        if not isinstance(polygon, list) or len(polygon) < 3:
+            raise ValueError("A polygon needs at least 3 (lat, lon) vertices")
+        if not all(isinstance(vertex, (list, tuple)) and len(vertex) == 2 and all(map(_is_number, vertex))
+                   for vertex in polygon):
+            raise ValueError("Polygon vertices must be [lat, lon] number pairs")
+    return value
+
+class EdgeOverrides:
+    """
+    Live edge adjustments layered over model-scored weights.
+
+    Closures make an edge impassable, slowdowns multiply its weight by a
+    factor >= 1 and area risk penalties add a surcharge, scaled by the
+    request's risk tolerance:
+
+        weight = base * slowdown * (1 + penalty * risk_factor)
+
+    Overrides only ever raise weights, so A* scales and other lower bounds
+    computed on the base weights stay valid. Every change bumps version and
+    reports the edge ids it touched, so callers can patch cached weight
+    arrays for just those edges instead of re-scoring the graph.
+    """
+    def __init__(self, num_edges):
+        self.num_edges = num_edges
+        self.version = 0
+        self.slowdown = np.ones(num_edges)
+        self.penalty = np.zeros(num_edges)
+        self._active = {}
+        self._ids = itertools.count(1)
+        self._digest = None
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return bool(self._active)
+
+    def add(self, kind, edges, value=None, override_id=None):
+        """
+        Add one override over edge ids; returns (override id, changed edges)
+
+        value is the slowdown factor or risk penalty; re-using an active id
+        replaces that override.
+        """
+        validate_override(kind, value)
+        edges = np.unique(np.asarray(edges, dtype=np.int64))
+        with self._lock:
+            if override_id is None:
+                override_id = f'o{next(self._ids)}'
+            previous = self._active.get(override_id)
+            self._active[override_id] = (kind, edges, value)
+            changed = edges if previous is None else np.union1d(edges, previous[1])
+            self._recompute(changed)
+            self.version += 1
+        return override_id, changed
+
+    def remove(self, override_ids):
+        """Lift overrides; returns the edge ids whose adjustments changed"""
+        with self._lock:
+            removed = [self._active.pop(i) for i in override_ids if i in self._active]
+            if not removed:
+                return np.empty(0, dtype=np.int64)
+            changed = np.unique(np.concatenate([edges for _, edges, _ in removed]))
+            self._recompute(changed)
+            self.version += 1
+        return changed
+
+    def _recompute(self, edges):
+        """Rebuild the combined adjustments of edges from the active overrides"""
+        self.slowdown[edges] = 1.0
+        self.penalty[edges] = 0.0
+        for kind, override_edges, value in self._active.values():
+            hit = override_edges[np.isin(override_edges, edges)]
+            if kind == 'closure':
+                self.slowdown[hit] = np.inf
+            elif kind == 'slowdown':
+                self.slowdown[hit] *= value
+            else:
+                self.penalty[hit] += value
+
+    def weights(self, base, risk_factor, edges=None):
+        """Adjusted weights for all edges, or just the given edge ids"""
+        with self._lock:
+            slowdown, penalty = self.slowdown, self.penalty
+            if edges is not None:
+                base, slowdown, penalty = base[edges], slowdown[edges], penalty[edges]
+            with np.errstate(invalid='ignore'):
+                weights = base * slowdown * (1 + penalty * risk_factor)
+            # Closed stays closed even over zero base weights
+            return np.where(np.isinf(slowdown), np.inf, weights)
+
+    def digest(self):
+        """
+        Content hash of the combined adjustments
+
+        version only counts changes within this process; equal adjustments
+        give equal digests across restarts and workers, so the digest can
+        identify override state in keys that are stored.
+        """
+        with self._lock:
+            if self._digest is None or self._digest[0] != self.version:
+                adjusted = np.flatnonzero((self.slowdown != 1) | (self.penalty != 0))
+                h = hashlib.sha1()
+                for array in (adjusted, self.slowdown[adjusted], self.penalty[adjusted]):
+                    h.update(np.ascontiguousarray(array).tobytes())
+                self._digest = (self.version, h.hexdigest())
+            return self._digest[1]
+
+    def list(self):
+        """Active overrides as {id: {'kind', 'edges', 'value'}}"""
+        with self._lock:
+            return {override_id: {'kind': kind, 'edges': int(len(edges)), 'value': value}
+                    for override_id, (kind, edges, value) in self._active.items()}
+
+    def edges(self, override_ids):
+        """Edge ids covered by the given active overrides"""
+        with self._lock:
+            parts = [self._active[i][1] for i in override_ids if i in self._active]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return self.slowdown.nbytes + self.penalty.nbytes
@@ -0,0 +1,208 @@
+# routing/registry.py
+import json
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Default cap on the estimated memory held by loaded regions
+DEFAULT_MEMORY_BUDGET = 2 * 1024 ** 3
+
+def load_regions(path):
+    """
+    Region definitions from a JSON file
+
+    Maps region name to a dict with 'bbox' as [south, west, north, east]
+    plus where to load the graph from ('snapshot' directory or OSM 'place'
+    name). Regions with "preload": true are loaded at startup.
+    """
+    with open(path) as f:
+        regions = json.load(f)
+    for name, spec in regions.items():
+        south, west, north, east = spec['bbox']
+        if south > north or west > east:
+            raise ValueError(f"Region {name}: bbox must be [south, west, north, east]")
+        if not spec.get('snapshot') and not spec.get('place'):
+            raise ValueError(f"Region {name}: needs a 'snapshot' or 'place' to load from")
+    return regions
+
+def bbox_contains(bbox, lat, lon):
+    south, west, north, east = bbox
+    return south <= lat <= north and west <= lon <= east
+
+def bbox_area(bbox):
+    south, west, north, east = bbox
+    return (north - south) * (east - west)
+
+class GraphRegistry:
+    """
+    Region graphs loaded on demand under a memory budget.
+
+    Each region is served by its own routing backend (graph, spatial index,
+    weight caches), created by load_region(name, spec) the first time a
+    request falls inside it. A request is routed on the smallest region
+    whose bbox holds all of its points, i.e. the bounding box of origin and
+    destination.
+
+    Loaded regions are kept in least-recently-used order; after a load,
+    the least recently used ones are dropped until the estimated memory
+    (backend.memory_bytes()) fits memory_budget. The region just loaded is
+    always kept, and requests already holding an evicted backend finish on
+    it. Concurrent requests for a region being loaded wait for that single
+    load rather than starting their own.
+    """
+    def __init__(self, regions, load_region, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.regions = dict(regions)
+        self.load_region = load_region
+        self.memory_budget = memory_budget
+        self.loads = 0
+        self.evictions = 0
+        self.requests = Counter()
+        self._loaded = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def region_for(self, points):
+        """Name of the smallest region covering every (lat, lon) point, or None"""
+        covering = [name for name, spec in self.regions.items()
+                    if all(bbox_contains(spec['bbox'], lat, lon) for lat, lon in points)]
+        if not covering:
+            return None
+        return min(covering, key=lambda name: bbox_area(self.regions[name]['bbox']))
+
+    def backend_for(self, points):
+        """Backend of the region covering points, loading it if needed"""
+        name = self.region_for(points)
+        if name is None:
+            raise ValueError(f"No configured region covers {list(points)}")
+        return self.get(name)
+
+    def loaded_backend_for(self, points):
+        """
+        Backend of the smallest loaded region covering points, or None
+
+        Never loads a region and does not count as a request, for callers
+        such as feed snapping that should only use what is already in memory.
+        """
+        with self._lock:
+            covering = [name for name in self._loaded
+                        if all(bbox_contains(self.regions[name]['bbox'], lat, lon) for lat, lon in points)]
+            if not covering:
+                return None
+            return self._loaded[min(covering, key=lambda name: bbox_area(self.regions[name]['bbox']))]
+
+    def get(self, name):
+        """Backend of region name, loading it on first use"""
+        if name not in self.regions:
+            raise KeyError(f"Unknown region: {name}")
+        while True:
+            with self._lock:
+                self.requests[name] += 1
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name]
+                pending = self._pending.get(name)
+                if pending is None:
+                    pending = self._pending[name] = threading.Event()
+                    break
+            # Another request is already loading this region; if that load
+            # fails the next waiter retries it
+            pending.wait()
+            with self._lock:
+                self.requests[name] -= 1
+
+        evicted = []
+        try:
+            backend = self.load_region(name, self.regions[name])
+            with self._lock:
+                self._loaded[name] = backend
+                self.loads += 1
+                evicted = self._evict(keep=name)
+        finally:
+            with self._lock:
+                del self._pending[name]
+            pending.set()
+        for old in evicted:
+            old.close()
+        return backend
+
+    def _evict(self, keep):
+        """Drop LRU regions until under budget; call with the lock held"""
+        evicted = []
+        while len(self._loaded) > 1 and self._memory_bytes() > self.memory_budget:
+            name = next(iter(self._loaded))
+            if name == keep:
+                self._loaded.move_to_end(name)
+                continue
+            evicted.append(self._loaded.pop(name))
+            self.evictions += 1
+        return evicted
+
+    def _memory_bytes(self):
+        return sum(backend.memory_bytes() for backend in self._loaded.values())
+
+    def loaded(self):
+        """Names of loaded regions, least recently used first"""
+        with self._lock:
+            return list(self._loaded)
+
+    def backends(self):
+        """Loaded backends, least recently used first"""
+        with self._lock:
+            return list(self._loaded.values())
+
+    def hot_regions(self, n=None):
+        """Region names by request count, most requested first"""
+        with self._lock:
+            return [name for name, _ in self.requests.most_common(n)]
+
+    def preload(self, names=None):
+        """
+        Load regions in a background thread
+
+        names defaults to the regions marked "preload" in their spec,
+        followed by the most requested ones so far. Loading stops once the
+        budget is used up, so preloading does not churn the cache.
+        """
+        if names is None:
+            names = [name for name, spec in self.regions.items() if spec.get('preload')]
+            names += [name for name in self.hot_regions() if name not in names]
+
+        def run():
+            for name in names:
+                with self._lock:
+                    if name in self._loaded or name not in self.regions:
+                        continue
+                    if self._loaded and self._memory_bytes() >= self.memory_budget:
+                        return
+                try:
+                    self.get(name)
+                except Exception:
+                    logger.exception('Error preloading region %s', name)
+                with self._lock:
+                    # Preloading is not demand
+                    self.requests[name] -= 1
+
+        thread = threading.Thread(target=run, name='graph-preload', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            return {
+                'regions': len(self.regions),
+                'loaded': list(self._loaded),
+                'memory_bytes': self._memory_bytes(),
+                'memory_budget': self.memory_budget,
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'requests': dict(self.requests)
+            }
+
+    def close(self):
+        with self._lock:
+            backends = list(self._loaded.values())
+            self._loaded.clear()
+        for backend in backends:
+            backend.close()
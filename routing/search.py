@@ -0,0 +1,260 @@
+# routing/search.py
+import heapq
+import math
+import numpy as np
+from routing.graph import EARTH_RADIUS_M, haversine
+
+class SearchResult:
+    """Outcome of a shortest-path query over a RoutingGraph"""
+    def __init__(self, cost, edges, nodes, settled):
+        self.cost = cost
+        self.edges = edges      # edge ids along the path
+        self.nodes = nodes      # node indices along the path
+        self.settled = settled  # nodes expanded by the search
+
+    @property
+    def found(self):
+        return self.edges is not None
+
+def _unwind(pred_edge, edge_tail, source, target):
+    """Rebuild the edge path by walking predecessor edges back from target"""
+    edges = []
+    node = target
+    while node != source:
+        e = pred_edge[node]
+        edges.append(e)
+        node = int(edge_tail[e])
+    edges.reverse()
+    return edges
+
+def _join(graph, pred_edge, source, target, meet, cost, settled):
+    """Combine forward and backward predecessor edges through the meeting node"""
+    heads = graph.edge_head
+    edges = _unwind(pred_edge[0], graph.edge_tail, source, meet)
+    node = meet
+    while node != target:
+        e = pred_edge[1][node]
+        edges.append(e)
+        node = int(heads[e])
+    nodes = [source] + [int(heads[e]) for e in edges]
+    return SearchResult(cost, edges, nodes, settled)
+
+def dijkstra(graph, weights, source, target):
+    """
+    Shortest path between two node indices with per-edge weights.
+
+    weights is an array indexed by edge id. Parallel edges are all relaxed,
+    so the cheapest one is used, as nx.shortest_path does on a MultiDiGraph.
+    """
+    if source == target:
+        return SearchResult(0.0, [], [source], 0)
+
+    indptr, heads = graph.indptr, graph.edge_head
+    dist = {source: 0.0}
+    pred_edge = {}
+    settled = 0
+    heap = [(0.0, source)]
+    heappush, heappop = heapq.heappush, heapq.heappop
+    inf = float('inf')
+
+    while heap:
+        d, u = heappop(heap)
+        if d > dist[u]:
+            continue  # stale entry for an already settled node
+        settled += 1
+        if u == target:
+            edges = _unwind(pred_edge, graph.edge_tail, source, target)
+            nodes = [source] + [int(heads[e]) for e in edges]
+            return SearchResult(d, edges, nodes, settled)
+
+        # Slice the node's adjacency once instead of indexing arrays per edge
+        start, end = int(indptr[u]), int(indptr[u + 1])
+        e = start
+        for v, w in zip(heads[start:end].tolist(), weights[start:end].tolist()):
+            nd = d + w
+            if nd < dist.get(v, inf):
+                dist[v] = nd
+                pred_edge[v] = e
+                heappush(heap, (nd, v))
+            e += 1
+
+    return SearchResult(inf, None, None, settled)
+
+def bidirectional_dijkstra(graph, weights, source, target):
+    """
+    Shortest path searching forward from source and backward from target.
+
+    This is the algorithm nx.shortest_path uses for a source/target pair,
+    run over the CSR arrays. It stops once the two frontiers can no longer
+    improve the best meeting point.
+    """
+    if source == target:
+        return SearchResult(0.0, [], [source], 0)
+
+    indptr, heads = graph.indptr, graph.edge_head
+    in_indptr, in_edges, tails = graph.in_indptr, graph.in_edges, graph.edge_tail
+    dist = ({source: 0.0}, {target: 0.0})
+    pred_edge = ({}, {})
+    heaps = ([(0.0, source)], [(0.0, target)])
+    heappush, heappop = heapq.heappush, heapq.heappop
+    inf = float('inf')
+    best, meet = inf, None
+    settled = 0
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+
+        # Grow whichever frontier is closer to its origin
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        d, u = heappop(heaps[side])
+        if d > dist[side][u]:
+            continue
+        settled += 1
+
+        if side == 0:
+            start, end = int(indptr[u]), int(indptr[u + 1])
+            edge_ids = range(start, end)
+            neighbors = heads[start:end].tolist()
+            edge_weights = weights[start:end].tolist()
+        else:
+            edge_ids = in_edges[in_indptr[u]:in_indptr[u + 1]]
+            neighbors = tails[edge_ids].tolist()
+            edge_weights = weights[edge_ids].tolist()
+            edge_ids = edge_ids.tolist()
+
+        own, other = dist[side], dist[1 - side]
+        for e, v, w in zip(edge_ids, neighbors, edge_weights):
+            nd = d + w
+            if nd < own.get(v, inf):
+                own[v] = nd
+                pred_edge[side][v] = e
+                heappush(heaps[side], (nd, v))
+            if v in other and nd + other[v] < best:
+                best, meet = nd + other[v], v
+
+    if meet is None:
+        return SearchResult(inf, None, None, settled)
+
+    return _join(graph, pred_edge, source, target, meet, best, settled)
+
+def min_cost_per_meter(graph, weights):
+    """
+    Cheapest weight per meter of straight-line distance over all edges.
+
+    Every edge then costs at least this much per great-circle meter between
+    its end nodes, so scaling the great-circle distance to the target by it
+    gives an admissible and consistent A* heuristic.
+    """
+    tails, heads = graph.edge_tail, graph.edge_head
+    crow = haversine(graph.node_lat[tails], graph.node_lon[tails],
+                     graph.node_lat[heads], graph.node_lon[heads])
+    # Edges between (near-)coincident nodes bound nothing
+    usable = crow > 1e-3
+    if not usable.any():
+        return 0.0
+    cost = float(np.min(np.asarray(weights)[usable] / crow[usable]))
+    # Shave off float error so the bound stays a bound
+    return max(cost, 0.0) * (1 - 1e-9)
+
+def _great_circle(lat1, lon1, lat2, lon2):
+    """Haversine distance in meters between points given in radians"""
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+def bidirectional_astar(graph, weights, source, target, cost_per_meter):
+    """
+    Goal-directed bidirectional search with a great-circle heuristic.
+
+    cost_per_meter comes from min_cost_per_meter. Both directions use the
+    average potential p(v) = (h_target(v) - h_source(v)) / 2, which keeps
+    reduced edge costs non-negative in both searches. That makes the
+    bidirectional stopping rule valid, so the cost equals Dijkstra's while
+    far fewer nodes are expanded on long routes.
+    """
+    if source == target:
+        return SearchResult(0.0, [], [source], 0)
+    if cost_per_meter <= 0:
+        return bidirectional_dijkstra(graph, weights, source, target)
+
+    indptr, heads = graph.indptr, graph.edge_head
+    in_indptr, in_edges, tails = graph.in_indptr, graph.in_edges, graph.edge_tail
+    node_lat, node_lon = graph.node_lat, graph.node_lon
+    s_lat, s_lon = math.radians(node_lat[source]), math.radians(node_lon[source])
+    t_lat, t_lon = math.radians(node_lat[target]), math.radians(node_lon[target])
+    half_cost = cost_per_meter / 2
+    potentials = {}
+
+    def potential(v):
+        p = potentials.get(v)
+        if p is None:
+            v_lat, v_lon = math.radians(node_lat[v]), math.radians(node_lon[v])
+            p = potentials[v] = half_cost * (_great_circle(v_lat, v_lon, t_lat, t_lon)
+                                             - _great_circle(s_lat, s_lon, v_lat, v_lon))
+        return p
+
+    p_source, p_target = potential(source), potential(target)
+    # Reduced path cost = true cost + offset, in either direction
+    offset = p_target - p_source
+
+    dist = ({source: 0.0}, {target: 0.0})
+    pred_edge = ({}, {})
+    heaps = ([(0.0, 0.0, source)], [(0.0, 0.0, target)])
+    heappush, heappop = heapq.heappush, heapq.heappop
+    inf = float('inf')
+    best, meet = inf, None
+    settled = 0
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best + offset:
+            break
+
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        _, d, u = heappop(heaps[side])
+        if d > dist[side][u]:
+            continue
+        settled += 1
+
+        if side == 0:
+            start, end = int(indptr[u]), int(indptr[u + 1])
+            edge_ids = range(start, end)
+            neighbors = heads[start:end].tolist()
+            edge_weights = weights[start:end].tolist()
+        else:
+            edge_ids = in_edges[in_indptr[u]:in_indptr[u + 1]]
+            neighbors = tails[edge_ids].tolist()
+            edge_weights = weights[edge_ids].tolist()
+            edge_ids = edge_ids.tolist()
+
+        own, other = dist[side], dist[1 - side]
+        for e, v, w in zip(edge_ids, neighbors, edge_weights):
+            nd = d + w
+            if nd < own.get(v, inf):
+                own[v] = nd
+                pred_edge[side][v] = e
+                if side == 0:
+                    key = nd + potential(v) - p_source
+                else:
+                    key = nd + p_target - potential(v)
+                heappush(heaps[side], (key, nd, v))
+            if v in other and nd + other[v] < best:
+                best, meet = nd + other[v], v
+
+    if meet is None:
+        return SearchResult(inf, None, None, settled)
+
+    return _join(graph, pred_edge, source, target, meet, best, settled)
+
+def run_search(graph, weights, source, target, cost_per_meter=0.0, hierarchy=None):
+    """
+    Pick the fastest available search for one query.
+
+    A ready contraction hierarchy wins; otherwise bidirectional A* when a
+    heuristic scale is given, else bidirectional Dijkstra.
+    """
+    if hierarchy is not None:
+        return hierarchy.query(source, target)
+    if cost_per_meter > 0:
+        return bidirectional_astar(graph, weights, source, target, cost_per_meter)
+    return bidirectional_dijkstra(graph, weights, source, target)
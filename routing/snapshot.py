@@ -0,0 +1,101 @@
+# routing/snapshot.py
+import json
+import os
+import pickle
+import shutil
+import numpy as np
+from routing.graph import RoutingGraph
+
+# Bump when the on-disk layout changes; older snapshots are then rejected
+SNAPSHOT_FORMAT_VERSION = 2
+
+MANIFEST_FILE = 'manifest.json'
+SPATIAL_INDEX_FILE = 'spatial_index.pkl'
+
+def save_snapshot(path, routing_graph, edge_features, feature_columns,
+                  model_hash=None, weights=None, spatial_index=None):
+    """
+    Write a routing graph and its feature/weight arrays as a snapshot directory.
+
+    Every array is stored as its own .npy file next to a JSON manifest, so
+    load_snapshot can memory-map them. weights maps (hour bucket, weekday,
+    risk tolerance) to edge weight arrays scored with the model model_hash.
+    The node spatial index is pickled alongside so it need not be rebuilt.
+    The directory is swapped in whole so readers never see a partial snapshot.
+    """
+    tmp_path = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name in RoutingGraph.ARRAYS:
+        np.save(os.path.join(tmp_path, f'graph_{name}.npy'), getattr(routing_graph, name))
+    np.save(os.path.join(tmp_path, 'edge_features.npy'),
+            np.ascontiguousarray(edge_features, dtype=np.float32))
+
+    if spatial_index is not None:
+        with open(os.path.join(tmp_path, SPATIAL_INDEX_FILE), 'wb') as f:
+            pickle.dump(spatial_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    weight_entries = []
+    for i, ((hour_bucket, day_of_week, risk_tolerance), array) in enumerate((weights or {}).items()):
+        filename = f'weights_{i}.npy'
+        np.save(os.path.join(tmp_path, filename), np.asarray(array))
+        weight_entries.append({
+            'hour_bucket': hour_bucket,
+            'day_of_week': day_of_week,
+            'risk_tolerance': risk_tolerance,
+            'file': filename
+        })
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'num_nodes': routing_graph.num_nodes,
+        'num_edges': routing_graph.num_edges,
+        'feature_columns': list(feature_columns),
+        'model_hash': model_hash,
+        'weights': weight_entries
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    old_path = path.rstrip(os.sep) + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def load_snapshot(path, mmap=True):
+    """
+    Load a snapshot written by save_snapshot.
+
+    With mmap=True the arrays are read-only memory maps, so startup does no
+    parsing and worker processes on one host share the same page cache.
+
+    Returns (routing_graph, edge_features, manifest, weights, spatial_index);
+    spatial_index is None if the snapshot was saved without one.
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported graph snapshot version {manifest.get('format_version')} "
+                         f"(expected {SNAPSHOT_FORMAT_VERSION}); rebuild the snapshot")
+
+    mmap_mode = 'r' if mmap else None
+
+    def load(filename):
+        return np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+
+    routing_graph = RoutingGraph(**{name: load(f'graph_{name}.npy') for name in RoutingGraph.ARRAYS})
+    edge_features = load('edge_features.npy')
+    weights = {
+        (entry['hour_bucket'], entry['day_of_week'], entry['risk_tolerance']): load(entry['file'])
+        for entry in manifest['weights']
+    }
+
+    spatial_index = None
+    spatial_index_path = os.path.join(path, SPATIAL_INDEX_FILE)
+    if os.path.exists(spatial_index_path):
+        with open(spatial_index_path, 'rb') as f:
+            spatial_index = pickle.load(f)
+
+    return routing_graph, edge_features, manifest, weights, spatial_index
@@ -0,0 +1,32 @@
+# routing/spatial_index.py
+import numpy as np
+from sklearn.neighbors import KDTree
+from routing.graph import EARTH_RADIUS_M
+
+def _unit_vectors(lats, lons):
+    """Points on the unit sphere; straight-line order matches great-circle order"""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lats)
+    return np.column_stack([cos_lat * np.cos(lons), cos_lat * np.sin(lons), np.sin(lats)])
+
+class SpatialIndex:
+    """
+    KD-tree over graph node coordinates for snapping (lat, lon) points.
+
+    Built once per graph; queries take whole arrays of points so a batch of
+    shipments is snapped in one vectorized call.
+    """
+    def __init__(self, node_lat, node_lon):
+        self.tree = KDTree(_unit_vectors(node_lat, node_lon))
+
+    def query(self, lats, lons):
+        """Nearest node index and great-circle distance in meters for each point"""
+        chord, index = self.tree.query(_unit_vectors(np.atleast_1d(lats), np.atleast_1d(lons)), k=1)
+        distance = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(chord[:, 0] / 2, 1.0))
+        return index[:, 0], distance
+
+    def nearest(self, lat, lon):
+        """Index of the node closest to a single point"""
+        index, _ = self.query(lat, lon)
+        return int(index[0])
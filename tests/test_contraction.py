@@ -0,0 +1,55 @@
+# tests/test_contraction.py
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_graph
+from routing.graph import RoutingGraph
+from routing.contraction import ContractionHierarchy, HierarchyBuilder
+from routing.search import dijkstra
+
+@pytest.fixture(scope='module')
+def network():
+    G = synthetic_graph(25, seed=3)
+    graph = RoutingGraph.from_networkx(G)
+    speeds = np.array([float(str(d.get('maxspeed') or 30).split()[0])
+                       for _, _, d in G.edges(data=True)])
+    weights = graph.edge_length.astype(np.float64) / (speeds * 1000 / 60)
+    return graph, weights
+
+def test_hierarchy_costs_match_dijkstra(network):
+    graph, weights = network
+    hierarchy = ContractionHierarchy.build(graph.indptr, graph.edge_head, weights)
+    rng = random.Random(0)
+    for _ in range(100):
+        source, target = rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)
+        expected = dijkstra(graph, weights, source, target)
+        result = hierarchy.query(source, target)
+        assert result.cost == pytest.approx(expected.cost, rel=1e-9)
+        if result.found:
+            # Shortcuts unpack into a connected path of original edges
+            assert int(graph.edge_tail[result.edges[0]]) == source
+            assert int(graph.edge_head[result.edges[-1]]) == target
+            assert float(np.sum(weights[result.edges])) == pytest.approx(expected.cost, rel=1e-9)
+
+def test_builder_skips_large_graphs_and_discarded_keys(network):
+    graph, weights = network
+    builder = HierarchyBuilder(max_nodes=graph.num_nodes - 1)
+    assert builder.get('key', graph, weights) is None
+    assert not builder._pending
+
+    builder = HierarchyBuilder()
+    try:
+        builder.get('stale', graph, weights)
+        builder.discard(lambda key: key == 'stale')
+        builder.get('current', graph, weights)
+        builder.wait()
+        assert builder.get('current', graph, weights) is not None
+        assert 'stale' not in builder._hierarchies
+    finally:
+        builder.shutdown()
@@ -0,0 +1,66 @@
+# tests/test_overrides.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from benchmarks.synthetic import synthetic_graph
+from logistics.route_overrides import RouteOverrideStore
+from models.database import LogisticsDB
+from route_optimizer import EnhancedRouteOptimizer
+from routing.overrides import override_value
+
+@pytest.mark.parametrize('override', [
+    {'kind': 'closure', 'edges': [1000000000]},
+    {'kind': 'closure', 'edges': [[1, 2, 3, 4]]},
+    {'kind': 'closure', 'edges': [['1', '2']]},
+    {'kind': 'closure', 'edges': [[1, 2 ** 70]]},
+    {'kind': 'closure', 'polygon': [[0, 0], [0, 1], 'x']},
+    {'kind': 'closure', 'polygon': [[0, 0], [0, 1], [1, None]]},
+    {'kind': 'slowdown', 'factor': '2', 'edges': [[1, 2]]},
+    {'kind': ['closure'], 'edges': [[1, 2]]},
+    'closure',
+])
+def test_malformed_overrides_are_rejected(override):
+    with pytest.raises(ValueError):
+        override_value(override)
+
+def test_rejected_override_leaves_state_unchanged():
+    optimizer = EnhancedRouteOptimizer()
+    G = synthetic_graph(5, seed=1)
+    optimizer.optimizer.set_graph(G)
+    u, v = next(iter(G.edges()))
+
+    with pytest.raises(ValueError):
+        optimizer.apply_overrides([{'kind': 'closure', 'edges': [[u, v]]},
+                                   {'kind': 'closure', 'edges': [1000000000]}])
+    assert optimizer.list_overrides() == []
+
+    ids = optimizer.apply_overrides([{'kind': 'closure', 'edges': [[u, v]]}])
+    assert [override['id'] for override in optimizer.list_overrides()] == ids
+    assert optimizer.optimizer.overrides.active
+
+def test_overrides_are_shared_through_the_store(tmp_path):
+    G = synthetic_graph(5, seed=1)
+    u, v = next(iter(G.edges()))
+    db_file = str(tmp_path / 'logistics.db')
+    # Two workers, each with its own connection and graph
+    workers = []
+    for _ in range(2):
+        optimizer = EnhancedRouteOptimizer(override_store=RouteOverrideStore(LogisticsDB(db_file)))
+        optimizer.optimizer.set_graph(G)
+        workers.append(optimizer)
+    first, second = workers
+
+    ids = first.apply_overrides([{'kind': 'closure', 'edges': [[u, v]]}])
+    assert ids == ['o1']
+    assert second.list_overrides() == [{'kind': 'closure', 'edges': [[u, v]], 'id': 'o1'}]
+    backend = second.backend_for([])
+    assert backend.overrides.active
+
+    assert second.apply_overrides([{'kind': 'slowdown', 'factor': 2, 'edges': [[u, v]]}]) == ['o2']
+    assert second.remove_overrides(['o1']) == ['o1']
+    assert [override['id'] for override in first.list_overrides()] == ['o2']
+    assert first.remove_overrides(['o1']) == []
@@ -0,0 +1,50 @@
+# tests/test_search.py
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import synthetic_graph
+from routing.graph import RoutingGraph
+from routing.search import bidirectional_astar, dijkstra, min_cost_per_meter
+
+GRID = 40
+
+@pytest.fixture(scope='module')
+def network():
+    G = synthetic_graph(GRID, seed=7)
+    graph = RoutingGraph.from_networkx(G)
+    # Travel minutes at each edge's speed limit, as the model is trained on
+    speeds = np.array([float(str(d.get('maxspeed') or 30).split()[0])
+                       for _, _, d in G.edges(data=True)])
+    weights = graph.edge_length.astype(np.float64) / (speeds * 1000 / 60)
+    return graph, weights, min_cost_per_meter(graph, weights)
+
+def test_astar_costs_match_dijkstra(network):
+    graph, weights, cost_per_meter = network
+    rng = random.Random(0)
+    for _ in range(100):
+        source, target = rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes)
+        expected = dijkstra(graph, weights, source, target)
+        result = bidirectional_astar(graph, weights, source, target, cost_per_meter)
+        assert result.found == expected.found
+        assert result.cost == pytest.approx(expected.cost, rel=1e-9)
+        if result.found:
+            assert result.nodes[0] == source and result.nodes[-1] == target
+            assert float(np.sum(weights[result.edges])) == pytest.approx(expected.cost, rel=1e-9)
+
+def test_astar_settles_fewer_nodes_on_long_routes(network):
+    graph, weights, cost_per_meter = network
+    rng = random.Random(1)
+    # Opposite corners of the grid, give or take a few streets
+    pairs = [(rng.randrange(GRID * 3), graph.num_nodes - 1 - rng.randrange(GRID * 3))
+             for _ in range(10)]
+    for source, target in pairs:
+        expected = dijkstra(graph, weights, source, target)
+        result = bidirectional_astar(graph, weights, source, target, cost_per_meter)
+        assert result.cost == pytest.approx(expected.cost, rel=1e-9)
+        assert result.settled < expected.settled